@@ -1,4 +1,3 @@
-from femm import *
 import sys, os
 import numpy as np
 import shutil
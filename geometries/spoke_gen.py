@@ -1,4 +1,3 @@
-from femm import *
 import sys, os, shutil
 import numpy as np
 
@@ -1,7 +1,10 @@
 import sys, os, shutil
 import json
-import zlib
+import copy
+import pickle
 import threading
+import traceback
+from collections import OrderedDict
 
 from PyQt6.QtCore import *
 from PyQt6.QtGui import *
@@ -20,6 +23,8 @@ default_application_settings = {
     'window_position_y': 100,
 }
 
+max_live_figures = 4
+
 new_project_index = 0
 simid = 0
 
@@ -27,6 +32,9 @@ os.chdir(os.path.dirname(sys.argv[0]))
 from modules.plt_util import *
 from modules.sim_util import *
 from modules.fem_util import *
+import modules.progress_util as progress_util
+import modules.supervisor_util as supervisor_util
+from modules.project_util import PMSMFileHandler, DebouncedWriter, write_atomic
 
 import geometries.initial_gen as initial
 import geometries.burried_gen as burried
@@ -34,77 +42,52 @@ import geometries.spoke_gen as spoke
 import geometries.vera_gen as vera
 import geometries.ITHMA_gen as halbach
 
+recovery_folder = 'recovery'
+
 class SettingsManager:
-    def __init__(self, file_path, initial_settings={}):
+    def __init__(self, file_path, initial_settings={}, delay=0.5):
         self.file_path = file_path
+        self.lock = threading.Lock()
+        self.writer = DebouncedWriter(self.write, delay)
         try:
             with open(self.file_path, 'r') as file:
                 self.data = json.load(file)
         except FileNotFoundError:
             self.data = initial_settings
+        self.changed = False
         self.save()
 
     def __getitem__(self, key):
         return self.data[key]
 
     def __setitem__(self, key, value):
-        self.data[key] = value        
+        with self.lock:
+            self.data[key] = value        
+            self.changed = True
         self.save()
         
     def __contains__(self, key):
         return key in self.data
 
     def update(self, new_data):
-        self.data.update(new_data)
+        with self.lock:
+            self.data.update(new_data)
+            self.changed = True
         self.save()
 
     def __repr__(self):
         return repr(self.data)
     
     def save(self):
-        with open(self.file_path, 'w') as file:
-            json.dump(self.data, file, indent=4)
-
-class PMSMFileHandler:
-    def __init__(self, folder_path):
-        self.folder_path = folder_path
-
-    def _read_file(self, file_path):
-        with open(file_path, 'r', encoding='utf-8') as file:
-            return file.read()
-
-    def _write_file(self, file_path, content):
-        os.makedirs(os.path.dirname(file_path), exist_ok=True)
-        with open(file_path, 'w', encoding='utf-8') as file:
-            file.write(content)
-
-    def pack(self, output_file):
-        data = {}
-        for foldername, _, filenames in os.walk(self.folder_path):
-            folder_data = {}
-            for filename in filenames:
-                file_path = os.path.join(foldername, filename)
-                file_content = self._read_file(file_path)
-                folder_data[filename] = file_content
-            data[os.path.relpath(foldername, self.folder_path)] = folder_data
-
-        with open(output_file, 'wb') as file:
-            json_data = json.dumps(data).encode('utf-8')
-            compressed_data = zlib.compress(json_data)
-            file.write(compressed_data)
-
-    def unpack(self, input_file):
-        with open(input_file, 'rb') as file:
-            compressed_data = file.read()
-            json_data = zlib.decompress(compressed_data)
-            data = json.loads(json_data.decode('utf-8'))
-
-        for rel_folder_path, folder_data in data.items():
-            folder_path = os.path.join(self.folder_path, rel_folder_path)
-            for filename, content in folder_data.items():
-                file_path = os.path.join(folder_path, filename)
-                self._write_file(file_path, content)
+        self.writer.schedule()
+
+    def flush(self):
+        self.writer.flush()
 
+    def write(self):
+        with self.lock:
+            text = json.dumps(self.data, indent=4)
+        write_atomic(self.file_path, text)
 
 class MatplotlibWidget(QWidget):
     def __init__(self, fig):
@@ -124,7 +107,52 @@ class MatplotlibWidget(QWidget):
     def close(self):
         plt.close(self.figure)
 
+class LazyFigure:
+    def __init__(self, path, fig):
+        self.path = path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as file:
+            pickle.dump(fig, file)
+
+    def build(self):
+        with open(self.path, 'rb') as file:
+            return MatplotlibWidget(pickle.load(file))
+
+    def close(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+class SimulationWorker(QThread):
+    progress = pyqtSignal(str, object)
+    done = pyqtSignal(str, object)
+    failed = pyqtSignal(str, bool)
+
+    def __init__(self, name, func, cache_path, executor=None, priority=0, solve=True):
+        super().__init__()
+        self.name = name
+        self.func = func
+        self.cache_path = cache_path
+        self.control = progress_util.RunControl(callback=lambda state: self.progress.emit(self.name, state), executor=executor, priority=priority, solve=solve)
+
+    def run(self):
+        progress_util.bind(self.control)
+        try:
+            figs = self.func()
+            self.done.emit(self.name, {str(key): LazyFigure(os.path.join(self.cache_path, f"{index}.pickle"), fig) for index, (key, fig) in enumerate(figs.items())})
+        except progress_util.SimulationCancelled:
+            self.failed.emit(f"Simulation {self.name} was cancelled.", True)
+        except Exception as e:
+            traceback.print_exc()
+            self.failed.emit(f"Simulation {self.name} failed: {type(e).__name__}: {e}", False)
+        finally:
+            progress_util.bind(None)
+
+    def cancel(self):
+        self.control.cancel()
+
 class FileWidget(QSplitter):
+    saved = pyqtSignal(str, str)
+
     def __init__(self, parent, name=None, path=None):
         super().__init__(parent)
         self.save_path = None
@@ -135,17 +163,28 @@ class FileWidget(QSplitter):
                 raise AttributeError("FileWidget either needs a name or a path to a project.")
             self.tmp_project_path = os.path.join('tmp', name)
             os.mkdir(self.tmp_project_path)
+            self.file_handler = PMSMFileHandler(self.tmp_project_path)
         else:
             if not os.path.exists(path):
                 raise FileNotFoundError("The specified project does not exist.")
             self.tmp_project_path = os.path.join('tmp', os.path.basename(path).split('.')[0])
             self.save_path = path
-            load_file = PMSMFileHandler(self.tmp_project_path)
-            load_file.unpack(self.save_path)
+            self.file_handler = PMSMFileHandler(self.tmp_project_path)
+            self.file_handler.unpack(self.save_path)
+            self.save_required = False
             
         self.settings = SettingsManager(os.path.join(self.tmp_project_path, "settings.json"), initial_settings={'project_name':name})
         
         self.results = []
+        self.workers = []
+        self.run_queue = []
+        self.run_states = {}
+        self.executor = None
+        self.save_thread = None
+        self.save_again = None
+        self.saved.connect(self.save_finished)
+        self.live = OrderedDict()
+        self.figure_cache = os.path.join('tmp', 'figures', os.path.basename(self.tmp_project_path))
         if 'simulations' not in self.settings:
             self.settings['simulations'] = []
         if 'spmsweepname' not in self.settings:
@@ -190,6 +229,27 @@ class FileWidget(QSplitter):
             self.settings['irms'] = 12
         if 'degoffset' not in self.settings:
             self.settings['degoffset'] = 22.5
+        if 'max_workers' not in self.settings:
+            self.settings['max_workers'] = 0
+        if 'worker_memory_mb' not in self.settings:
+            self.settings['worker_memory_mb'] = 1024
+        if 'fluxmap_steps' not in self.settings:
+            self.settings['fluxmap_steps'] = 0
+        if 'u_max' not in self.settings:
+            self.settings['u_max'] = 0
+        if 'resistance' not in self.settings:
+            self.settings['resistance'] = 0.1
+        if 'stack_length' not in self.settings:
+            self.settings['stack_length'] = 63
+        if 'tooth_radius' not in self.settings:
+            self.settings['tooth_radius'] = 22
+        if 'yoke_radius' not in self.settings:
+            self.settings['yoke_radius'] = 26.7
+        if 'autosave_interval' not in self.settings:
+            self.settings['autosave_interval'] = 120
+        self.autosave_timer = QTimer(self)
+        self.autosave_timer.timeout.connect(self.autosave)
+        self.autosave_timer.start(int(1000*self.settings['autosave_interval']))
         if 'spmsweepstart' not in self.settings:
             self.settings['spmsweepstart'] = 0.1
         if 'spmsweepend' not in self.settings:
@@ -279,6 +339,8 @@ class FileWidget(QSplitter):
             self.settings['ithmapointangle'] = 0
         if 'ithmapointmagangle' not in self.settings:
             self.settings['ithmapointmagangle'] = 0
+        # Filling in missing defaults does not make an opened project dirty.
+        self.settings.changed = self.save_path is None
         
         self.setSizePolicy(
             QSizePolicy.Policy.Expanding, QSizePolicy.Policy.Expanding
@@ -363,6 +425,70 @@ class FileWidget(QSplitter):
         self.setup_general_layout.addWidget(self.d_position_input)
         self.d_position_input.valueChanged.connect(lambda x: self.update_settings('degoffset', x))
 
+        self.max_workers_label = QLabel("Solver Workers (0 = automatic):")
+        self.max_workers_input = QSpinBox()
+        self.max_workers_input.setMaximum(1024)
+        self.max_workers_input.setValue(self.settings['max_workers'])
+        self.setup_general_layout.addWidget(self.max_workers_label)
+        self.setup_general_layout.addWidget(self.max_workers_input)
+        self.max_workers_input.valueChanged.connect(lambda x: self.update_settings('max_workers', x))
+
+        self.worker_memory_label = QLabel("Memory per Worker in MB:")
+        self.worker_memory_input = QSpinBox()
+        self.worker_memory_input.setMaximum(65536)
+        self.worker_memory_input.setValue(self.settings['worker_memory_mb'])
+        self.setup_general_layout.addWidget(self.worker_memory_label)
+        self.setup_general_layout.addWidget(self.worker_memory_input)
+        self.worker_memory_input.valueChanged.connect(lambda x: self.update_settings('worker_memory_mb', x))
+
+        self.fluxmap_steps_label = QLabel("Flux Map Steps per Current Axis (0 = off):")
+        self.fluxmap_steps_input = QSpinBox()
+        self.fluxmap_steps_input.setMaximum(64)
+        self.fluxmap_steps_input.setValue(self.settings['fluxmap_steps'])
+        self.setup_general_layout.addWidget(self.fluxmap_steps_label)
+        self.setup_general_layout.addWidget(self.fluxmap_steps_input)
+        self.fluxmap_steps_input.valueChanged.connect(lambda x: self.update_settings('fluxmap_steps', x))
+
+        self.u_max_label = QLabel("Peak Phase Voltage Limit in V (0 = rated point):")
+        self.u_max_input = QDoubleSpinBox()
+        self.u_max_input.setMaximum(10000)
+        self.u_max_input.setValue(self.settings['u_max'])
+        self.setup_general_layout.addWidget(self.u_max_label)
+        self.setup_general_layout.addWidget(self.u_max_input)
+        self.u_max_input.valueChanged.connect(lambda x: self.update_settings('u_max', x))
+
+        self.resistance_label = QLabel("Phase Resistance in Ohm:")
+        self.resistance_input = QDoubleSpinBox()
+        self.resistance_input.setDecimals(4)
+        self.resistance_input.setValue(self.settings['resistance'])
+        self.setup_general_layout.addWidget(self.resistance_label)
+        self.setup_general_layout.addWidget(self.resistance_input)
+        self.resistance_input.valueChanged.connect(lambda x: self.update_settings('resistance', x))
+
+        self.stack_length_label = QLabel("Stack Length in mm:")
+        self.stack_length_input = QDoubleSpinBox()
+        self.stack_length_input.setMaximum(1000)
+        self.stack_length_input.setValue(self.settings['stack_length'])
+        self.setup_general_layout.addWidget(self.stack_length_label)
+        self.setup_general_layout.addWidget(self.stack_length_input)
+        self.stack_length_input.valueChanged.connect(lambda x: self.update_settings('stack_length', x))
+
+        self.tooth_radius_label = QLabel("Tooth Flux Density Probe Radius in mm:")
+        self.tooth_radius_input = QDoubleSpinBox()
+        self.tooth_radius_input.setMaximum(1000)
+        self.tooth_radius_input.setValue(self.settings['tooth_radius'])
+        self.setup_general_layout.addWidget(self.tooth_radius_label)
+        self.setup_general_layout.addWidget(self.tooth_radius_input)
+        self.tooth_radius_input.valueChanged.connect(lambda x: self.update_settings('tooth_radius', x))
+
+        self.yoke_radius_label = QLabel("Yoke Flux Density Probe Radius in mm:")
+        self.yoke_radius_input = QDoubleSpinBox()
+        self.yoke_radius_input.setMaximum(1000)
+        self.yoke_radius_input.setValue(self.settings['yoke_radius'])
+        self.setup_general_layout.addWidget(self.yoke_radius_label)
+        self.setup_general_layout.addWidget(self.yoke_radius_input)
+        self.yoke_radius_input.valueChanged.connect(lambda x: self.update_settings('yoke_radius', x))
+
         self.setup_spm_widget = QWidget(self)
         self.setup_spm_layout = QVBoxLayout()
         self.setup_spm_widget.setLayout(self.setup_spm_layout)
@@ -968,6 +1094,18 @@ class FileWidget(QSplitter):
         self.simulate_all_button.pressed.connect(self.simulate_all)
         self.simulate_delete_button.pressed.connect(self.delete_current_simulation)
         self.sim_select_layout.addWidget(self.simulate_buttons_widget)
+
+        self.progress_widget = QWidget()
+        self.progress_layout = QHBoxLayout()
+        self.progress_widget.setLayout(self.progress_layout)
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setFormat("%v/%m points")
+        self.progress_cancel_button = QPushButton("Cancel")
+        self.progress_cancel_button.pressed.connect(self.cancel_simulation)
+        self.progress_layout.addWidget(self.progress_bar)
+        self.progress_layout.addWidget(self.progress_cancel_button)
+        self.progress_widget.setVisible(False)
+        self.sim_select_layout.addWidget(self.progress_widget)
     
         self.sim_select_label2 = QLabel("Finished Simulations:")
         self.sim_select_layout.addWidget(self.sim_select_label2)
@@ -981,9 +1119,22 @@ class FileWidget(QSplitter):
         self.sim_show_delete_button.pressed.connect(self.delete_current_plot)
         self.sim_select_layout.addWidget(self.sim_show_delete_button)
 
+        self.restore_results()
+
     def update_plot(self, new_widget):
         self.hlayout.replaceWidget(self.hlayout.indexOf(self.main_content_widget), new_widget)
+        self.main_content_widget.hide()
         self.main_content_widget = new_widget    
+        self.main_content_widget.show()
+
+    def restore_results(self):
+        for simulation in self.settings['simulations']:
+            name = simulation['parameters'][2]
+            if name in [result['name'] for result in self.results]:
+                continue
+            if any(entry.startswith('sims/' + name + '/') for entry in self.file_handler.pending) or os.path.isdir(os.path.join(self.tmp_project_path, 'sims', name)):
+                self.results.append({'name':name, 'simulation':simulation, 'sims':None})
+        self.update_results()
 
     def update_results(self):
         self.sim_show_widget.clear()
@@ -991,6 +1142,12 @@ class FileWidget(QSplitter):
             simulation_item = QTreeWidgetItem([self.results[i]['name']])
             # simulation_item.setData(0, 1, i)
             self.sim_show_widget.addTopLevelItem(simulation_item)
+            if self.results[i]['sims'] is None:
+                simulation_item.setData(0, 1, ['load', i])
+                item = QTreeWidgetItem(["Click to load plots"])
+                simulation_item.addChild(item)
+                item.setData(0, 1, ['load', i])
+                continue
             for index in range(len(self.results[i]['sims'])):
                 item = QTreeWidgetItem([self.results[i]['sims'][index][0]])
                 simulation_item.addChild(item)
@@ -998,24 +1155,62 @@ class FileWidget(QSplitter):
 
     def tree_item_click(self, item):
         widget = item.data(0, 1)
-        if widget is not None:
-            self.update_plot(self.results[widget[0]]['sims'][widget[1]][1])
+        if widget is None:
+            return
+        if widget[0] == 'load':
+            self.rebuild_result(widget[1])
+        else:
+            self.show_figure(*widget)
+
+    def rebuild_result(self, i):
+        name = self.results[i]['name']
+        if name in [worker.name for worker in self.workers] or name in [simulation['parameters'][2] for simulation in self.run_queue]:
+            return
+        simulation = self.prepare_simulation(self.results[i]['simulation'])
+        simulation['rebuild'] = True
+        self.run_queue.append(simulation)
+        self.parent.statusBar.showMessage(f"Loading plots of {name}.")
+        self.start_queued_simulations()
+
+    def show_figure(self, i, index):
+        key = (self.results[i]['name'], self.results[i]['sims'][index][0])
+        widget = self.live.pop(key, None)
+        if widget is None:
+            widget = self.results[i]['sims'][index][1].build()
+        self.live[key] = widget
+        self.update_plot(widget)
+        while len(self.live) > max_live_figures:
+            _, old = self.live.popitem(last=False)
+            old.close()
+            old.deleteLater()
+
+    def release(self, name, key=None):
+        for live_key in [live_key for live_key in self.live if live_key[0] == name and (key is None or live_key[1] == key)]:
+            widget = self.live.pop(live_key)
+            if widget is self.main_content_widget:
+                self.update_plot(QWidget())
+            widget.close()
+            widget.deleteLater()
     
     def delete_current_plot(self):
         selected_item = self.sim_show_widget.currentItem()
         if selected_item:
             # If selected item is a group, delete the whole group
             parent = selected_item.parent()
-            if parent is None:
+            if parent is None or selected_item.data(0, 1)[0] == 'load':
                 # Root level item
-                index = self.sim_show_widget.indexOfTopLevelItem(selected_item)
-                self.results.pop(index)
-                self.sim_show_widget.takeTopLevelItem(index)
+                index = self.sim_show_widget.indexOfTopLevelItem(selected_item if parent is None else parent)
+                result = self.results.pop(index)
+                self.release(result['name'])
+                for _, figure in result['sims'] or []:
+                    figure.close()
+                self.update_results()
             else:
-                self.results
                 widget = selected_item.data(0, 1)
                 if widget is not None:
-                    self.results[widget[0]]['sims'][widget[1]][1].close()
+                    key, figure = self.results[widget[0]]['sims'][widget[1]]
+                    self.release(self.results[widget[0]]['name'], key)
+                    figure.close()
                 index = parent.indexOfChild(selected_item)
                 parent.takeChild(index)
             self.update_plot(QWidget())
@@ -1030,55 +1225,131 @@ class FileWidget(QSplitter):
         self.settings.save()
         self.update_sim_queue()
 
-    def run_simulation(self, index):
-        self.parent.setEnabled(False)
-        simulation = self.settings['simulations'][index].copy()
-        simulation['parameters'][1].update({'stator_path':self.settings['stator_path']})
+    def run_simulation(self, simulation):
         simpars = simulation['parameters'][1:]
-        simpars[0].update(self.settings.data)
         if simulation['type'] == "sweep":
             if simulation['parameters'][0] == "initial":
-                figs = sweep_1d(initial, *simpars, path=self.tmp_project_path)
+                figs = sweep_1d(initial, *simpars, path=self.tmp_project_path, sims=simulation.get('sims'))
             elif simulation['parameters'][0] == "burried":
-                figs = sweep_1d(burried, *simpars, path=self.tmp_project_path)
+                figs = sweep_1d(burried, *simpars, path=self.tmp_project_path, sims=simulation.get('sims'))
             elif simulation['parameters'][0] == "spoke":
-                figs = sweep_1d(spoke, *simpars, path=self.tmp_project_path)
+                figs = sweep_1d(spoke, *simpars, path=self.tmp_project_path, sims=simulation.get('sims'))
             elif simulation['parameters'][0] == "vera":
-                figs = sweep_2d(vera, *simpars, "Magnet Angle in Degrees", path=self.tmp_project_path)
+                figs = sweep_2d(vera, *simpars, "Magnet Angle in Degrees", path=self.tmp_project_path, sims=simulation.get('sims'))
             elif simulation['parameters'][0] == "halbach":
                 if isinstance(simulation['parameters'][1]['magnet_depth'], list):
-                    figs = sweep_2d(halbach, *simpars, "Magnet Factor", path=self.tmp_project_path)
+                    figs = sweep_2d(halbach, *simpars, "Magnet Factor", path=self.tmp_project_path, sims=simulation.get('sims'))
                 else:
-                    figs = sweep_2d(halbach, *simpars, 'Magnetization Direction in Degrees', xlabel="Trapezoidal Angle in Degrees", path=self.tmp_project_path)
+                    figs = sweep_2d(halbach, *simpars, 'Magnetization Direction in Degrees', xlabel="Trapezoidal Angle in Degrees", path=self.tmp_project_path, sims=simulation.get('sims'))
         else:
             if simulation['parameters'][0] == "initial":
-                figs = simulate_everything(initial, *simpars, path=self.tmp_project_path)
+                figs = simulate_everything(initial, *simpars, path=self.tmp_project_path, sims=simulation.get('sims'))
             elif simulation['parameters'][0] == "burried":
-                figs = simulate_everything(burried, *simpars, path=self.tmp_project_path)
+                figs = simulate_everything(burried, *simpars, path=self.tmp_project_path, sims=simulation.get('sims'))
             elif simulation['parameters'][0] == "spoke":
-                figs = simulate_everything(spoke, *simpars, path=self.tmp_project_path)
+                figs = simulate_everything(spoke, *simpars, path=self.tmp_project_path, sims=simulation.get('sims'))
             elif simulation['parameters'][0] == "vera":
-                figs = simulate_everything(vera, *simpars, path=self.tmp_project_path)
+                figs = simulate_everything(vera, *simpars, path=self.tmp_project_path, sims=simulation.get('sims'))
             elif simulation['parameters'][0] == "halbach":
-                figs = simulate_everything(halbach, *simpars, path=self.tmp_project_path)
-        self.results.append({'name':simulation['parameters'][2],
-                                         'sims': [[str(key), MatplotlibWidget(val)] for key, val in figs.items()]})
+                figs = simulate_everything(halbach, *simpars, path=self.tmp_project_path, sims=simulation.get('sims'))
+        return figs
+
+    def prepare_simulation(self, simulation):
+        simulation = copy.deepcopy(simulation)
+        simulation['parameters'][1].update({'stator_path':self.settings['stator_path']})
+        simulation['parameters'][1].update({key: copy.deepcopy(value) for key, value in self.settings.data.items() if key != 'simulations'})
+        return simulation
+
+    def queue_simulation(self, index):
+        self.run_queue.append(self.prepare_simulation(self.settings['simulations'][index]))
+
+    def start_queued_simulations(self):
+        running = [worker.name for worker in self.workers]
+        for simulation in list(self.run_queue):
+            name = simulation['parameters'][2]
+            if name in running:
+                continue
+            supervisor_util.set_budget(self.settings['max_workers'], self.settings['worker_memory_mb'])
+            if self.executor is None:
+                self.executor = supervisor_util.SupervisedExecutor(supervisor_util.pool_size(self.settings['max_workers'], self.settings['worker_memory_mb']))
+            self.run_queue.remove(simulation)
+            running.append(name)
+            self.file_handler.extract('sims/' + name)
+            priority = simulation.get('priority', 1 if simulation['type'] == 'point' else 0)
+            worker = SimulationWorker(name, lambda simulation=simulation: self.run_simulation(simulation), os.path.join(self.figure_cache, name), self.executor, priority, solve=not simulation.get('rebuild', False))
+            worker.simulation = simulation
+            worker.progress.connect(self.simulation_progress)
+            worker.done.connect(self.simulation_done)
+            worker.failed.connect(self.simulation_failed)
+            worker.finished.connect(lambda worker=worker: self.simulation_finished(worker))
+            self.workers.append(worker)
+            worker.start()
+        if len(self.workers) == 0 and self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+        self.set_running(len(self.workers) != 0)
+
+    def simulation_finished(self, worker):
+        worker.wait()
+        self.workers.remove(worker)
+        self.run_states.pop(worker.name, None)
+        self.start_queued_simulations()
+
+    def set_running(self, running):
+        self.progress_cancel_button.setEnabled(running)
+        self.progress_widget.setVisible(running)
+        if not running:
+            self.progress_bar.setValue(0)
+
+    def simulation_progress(self, name, state):
+        self.run_states[name] = state
+        done = sum(state['done'] for state in self.run_states.values())
+        total = sum(state['total'] for state in self.run_states.values())
+        rate = sum(state['rate'] for state in self.run_states.values())
+        self.progress_bar.setMaximum(max(total, 1))
+        self.progress_bar.setValue(done)
+        eta = convert_seconds_to_formatted_string(60*(total - done)/rate) if rate > 0 else "unknown time"
+        self.parent.statusBar.showMessage(f"{len(self.workers)} running, {len(self.run_queue)} waiting: {done}/{total} points, {rate:.1f} points/min, {eta} remaining.")
+
+    def simulation_done(self, name, figs):
+        result = {'name':name, 'simulation':[worker.simulation for worker in self.workers if worker.name == name][0],
+                                         'sims': [[key, val] for key, val in figs.items()]}
+        self.release(name)
+        self.save_required = True
+        names = [result['name'] for result in self.results]
+        if name in names:
+            self.results[names.index(name)] = result
+        else:
+            self.results.append(result)
         self.update_results()
-        self.parent.setEnabled(True)
+        self.parent.statusBar.showMessage(f"Finished simulation {name}.")
+
+    def simulation_failed(self, message, cancelled):
+        if cancelled:
+            self.run_queue = []
+        self.parent.statusBar.showMessage(message)
+
+    def cancel_simulation(self):
+        self.run_queue = []
+        self.progress_cancel_button.setEnabled(False)
+        self.parent.statusBar.showMessage("Cancelling simulations, waiting for running solves to stop.")
+        for worker in self.workers:
+            worker.cancel()
 
     def simulate_current(self):
         if len(self.settings['simulations']) == 0:
             self.parent.statusBar.showMessage("Add Simulations to Queue first.")
             return
-        i = self.sim_select_list.currentRow()
-        self.run_simulation(i)
+        self.queue_simulation(self.sim_select_list.currentRow())
+        self.start_queued_simulations()
     
     def simulate_all(self):
         if len(self.settings['simulations']) == 0:
             self.parent.statusBar.showMessage("Add Simulations to Queue first.")
             return
         for i in range(len(self.settings['simulations'])):
-            self.run_simulation(i)
+            self.queue_simulation(i)
+        self.start_queued_simulations()
 
     def update_sim_queue(self):
         self.sim_select_list.clear()
@@ -1090,6 +1361,13 @@ class FileWidget(QSplitter):
         if self.settings['stator_path'] == '':
             self.parent.statusBar.showMessage("Select a Stator File first.")
             return
+        if 'sims' not in dict:
+            if dict['type'] == 'point':
+                dict['sims'] = default_sims('point')
+            elif dict['parameters'][0] in ('vera', 'halbach'):
+                dict['sims'] = default_sims('sweep_2d')
+            else:
+                dict['sims'] = default_sims('sweep_1d')
         self.settings['simulations'].append(dict)
         self.settings.save()
         self.update_sim_queue()
@@ -1113,12 +1391,67 @@ class FileWidget(QSplitter):
         if self.save_path == None:
             res = self.saveas()
         else:
-            file_handler = PMSMFileHandler(self.tmp_project_path)
-            file_handler.pack(self.save_path)
+            self.start_save(self.save_path)
             res = 0
         if res == 0:
             self.save_required = False
+            self.settings.changed = False
         return res
+
+    def dirty(self):
+        return self.save_required or self.settings.changed
+
+    def recovery_path(self):
+        return os.path.join(recovery_folder, os.path.basename(self.tmp_project_path) + '.pmsm')
+
+    def start_save(self, path):
+        if self.save_thread is not None:
+            self.save_again = path
+            return
+        self.save_thread = threading.Thread(target=self.save_worker, args=(path,))
+        self.save_thread.start()
+
+    def save_worker(self, path):
+        warning = ''
+        try:
+            self.settings.flush()
+        except Exception as e:
+            traceback.print_exc()
+            warning = f"Settings could not be written ({type(e).__name__}: {e}), the project was saved with the last written settings."
+        try:
+            if path == self.recovery_path():
+                self.file_handler.snapshot(path)
+            else:
+                self.file_handler.pack(path)
+            self.saved.emit(path, warning)
+        except Exception as e:
+            traceback.print_exc()
+            self.saved.emit(path, f"{type(e).__name__}: {e}")
+
+    def save_finished(self, path, error):
+        self.save_thread.join()
+        self.save_thread = None
+        if path == self.recovery_path():
+            if error == '':
+                self.parent.statusBar.showMessage(f"Recovery copy was written to {path}")
+            else:
+                self.parent.statusBar.showMessage(f"There has been an error writing the recovery copy: {error}")
+        elif error == '':
+            self.parent.statusBar.showMessage(f"Project was saved to {path}")
+            if os.path.exists(self.recovery_path()):
+                os.remove(self.recovery_path())
+        else:
+            self.save_required = True
+            self.parent.statusBar.showMessage(f"There has been an error saving the project: {error}")
+        if self.save_again is not None:
+            path, self.save_again = self.save_again, None
+            self.start_save(path)
+
+    def autosave(self):
+        # Never touches the project file itself, only a recovery copy of unsaved changes.
+        if not self.dirty() or self.save_thread is not None:
+            return
+        self.start_save(self.recovery_path())
     
     def saveas(self, filename=None):
         if filename == None:
@@ -1127,14 +1460,29 @@ class FileWidget(QSplitter):
             self.settings['project_name'] = os.path.basename(filename).split('.')[0]
             self.save_path = filename
             self.parent.rename_project(name=self.settings['project_name'])
-            file_handler = PMSMFileHandler(self.tmp_project_path)
-            file_handler.pack(filename)
+            self.start_save(filename)
             self.save_required = False
+            self.settings.changed = False
             return 0
         else:
             return 1
 
     def close(self):
+        self.run_queue = []
+        for worker in self.workers:
+            worker.cancel()
+        for worker in self.workers:
+            worker.wait()
+        if self.executor is not None:
+            self.executor.shutdown(wait=True, cancel_futures=True)
+            self.executor = None
+        self.autosave_timer.stop()
+        for key in list(self.live):
+            self.release(*key)
+        shutil.rmtree(self.figure_cache, ignore_errors=True)
+        if self.save_thread is not None:
+            self.save_thread.join()
+        self.settings.flush()
         return
     
     def get_name(self):
@@ -1201,7 +1549,7 @@ class MainWindow(QMainWindow):
             shutil.rmtree('tmp')
         os.makedirs('tmp')
 
-        self.open_project(os.path.join('examples', 'ba-laurin-weitzel.pmsm'))
+        QTimer.singleShot(0, lambda: self.open_project(os.path.join('examples', 'ba-laurin-weitzel.pmsm')))
         self.statusBar.showMessage("Welcome to the PMSM Rotor Geometry Analyzer")
 
 
@@ -1262,7 +1610,7 @@ class MainWindow(QMainWindow):
         try:
             res = active_widget.save()
             if res == 0:
-                self.statusBar.showMessage("Project was saved successfully")
+                self.statusBar.showMessage("Saving project in the background")
             else:
                 self.statusBar.showMessage("There has been an error saving the project")
         except AttributeError:
@@ -1290,6 +1638,9 @@ class MainWindow(QMainWindow):
         self.settings['window_height'] = window_geometry.height()
         self.settings['window_position_x'] = window_geometry.x()
         self.settings['window_position_y'] = window_geometry.y()
+        self.settings.flush()
+        for widget in self.file_list:
+            widget.close()
         return super().closeEvent(a0)
 
 if __name__=="__main__":
@@ -0,0 +1,96 @@
+import sys, os
+from itertools import product
+import numpy as np
+import pandas as pd
+from scipy.interpolate import griddata
+
+sys.path.insert(0, os.getcwd())
+import modules.post_util as post_util
+
+metric_names = ('max', 'max_rel', 'mean', 'ripple', 'ratio')
+
+
+def sweep_axes(steps):
+    return [key for key, value in steps.items() if isinstance(value, list) and len(value) == 3 and all(isinstance(element, (int, float)) for element in value)]
+
+def point_metrics(data1, data2, keys, irms):
+    ret = post_util.torque_metrics(data1, data2, irms, keys)
+    ret['mean'] = ret['mean'].abs()
+    return ret[list(metric_names)].fillna(0)
+
+def adaptive_sweep(handler, simfunc, simpath, rotfunc, steps, sims1, sims2, irms, coarse=5, tol=0.05, fraction=0.3, max_rounds=8, **kwargs):
+    axes = sweep_axes(steps)
+    if len(axes) == 0:
+        raise KeyError("Adaptive sweeps need at least one [start, end, steps] parameter.")
+    grids = [np.linspace(*steps[key]) for key in axes]
+    sizes = [len(grid) for grid in grids]
+    starts = [np.unique(np.round(np.linspace(0, n - 1, min(coarse, n))).astype(int)) for n in sizes]
+
+    cells = [tuple(zip(*corner)) for corner in product(*[list(zip(start[:-1], start[1:])) if len(start) > 1 else [(0, 0)] for start in starts])]
+    solved = set()
+    frames1 = []
+    frames2 = []
+    metrics = None
+    for level in range(max_rounds + 1):
+        wanted = set()
+        for lo, hi in cells:
+            for corner in product(*zip(lo, hi)):
+                if corner not in solved:
+                    wanted.add(corner)
+        if len(wanted) != 0:
+            substeps = dict(steps)
+            for key in axes:
+                substeps.pop(key)
+            substeps['adaptive'] = tuple({key: grids[d][i] for d, (key, i) in enumerate(zip(axes, corner))} for corner in sorted(wanted))
+            print(f"Adaptive sweep round {level}: solving {len(wanted)} of {np.prod(sizes)} grid points.")
+            frames1.append(handler(simfunc, simpath, rotfunc, substeps, sims1, **kwargs))
+            frames2.append(handler(simfunc, simpath, rotfunc, substeps, sims2, **kwargs))
+            solved |= wanted
+            metrics = point_metrics(pd.concat(frames1, ignore_index=True), pd.concat(frames2, ignore_index=True), axes, irms)
+
+        spans = (metrics.max() - metrics.min()).replace(0, 1)
+        lookup = {tuple(index) if isinstance(index, tuple) else (index,): row for index, row in zip(metrics.index, metrics.to_numpy())}
+        scores = []
+        for lo, hi in cells:
+            if all(h - l <= 1 for l, h in zip(lo, hi)):
+                scores.append(0)
+                continue
+            corners = [lookup.get(tuple(grids[d][i] for d, i in enumerate(corner))) for corner in product(*zip(lo, hi))]
+            corners = np.array([c for c in corners if c is not None])
+            scores.append(np.max((corners.max(axis=0) - corners.min(axis=0))/spans.to_numpy()) if len(corners) != 0 else 0)
+        scores = np.array(scores)
+        limit = max(tol, np.quantile(scores[scores > 0], 1 - fraction)) if (scores > 0).any() else np.inf
+        refined = []
+        for (lo, hi), score in zip(cells, scores):
+            if score == 0 or score < limit:
+                continue
+            splits = [[(l, (l + h)//2), ((l + h)//2, h)] if h - l > 1 else [(l, h)] for l, h in zip(lo, hi)]
+            refined += [tuple(zip(*part)) for part in product(*splits)]
+        if len(refined) == 0:
+            break
+        cells = refined
+
+    data1 = pd.concat(frames1, ignore_index=True)
+    data2 = pd.concat(frames2, ignore_index=True)
+    print(f"Adaptive sweep finished with {len(solved)} of {np.prod(sizes)} grid points ({100*len(solved)/np.prod(sizes):.1f}%).")
+    return data1, data2
+
+def fill_grid(table):
+    values = table.to_numpy(dtype=float)
+    missing = np.isnan(values)
+    if not missing.any() or missing.all():
+        return table
+    yy, xx = np.meshgrid(table.index.to_numpy(dtype=float), table.columns.to_numpy(dtype=float), indexing='ij')
+    known = ~missing
+    filled = values.copy()
+    try:
+        filled[missing] = griddata((yy[known], xx[known]), values[known], (yy[missing], xx[missing]), method='linear')
+    except Exception:
+        pass
+    still = np.isnan(filled)
+    if still.any():
+        filled[still] = griddata((yy[known], xx[known]), values[known], (yy[still], xx[still]), method='nearest')
+    return pd.DataFrame(filled, index=table.index, columns=table.columns)
+
+if __name__ == "__main__":
+    sys.exit(0)
@@ -0,0 +1,407 @@
+import sys, os
+import json
+import math
+from contextlib import contextmanager
+import numpy as np
+
+sys.path.insert(0, os.getcwd())
+
+backend_env = 'PMSM_BACKEND'
+default_backend = 'femm'
+
+femm_functions = (
+    'openfemm', 'closefemm', 'opendocument',
+    'mi_drawline', 'mi_drawarc', 'mi_addblocklabel', 'mi_clearselected', 'mi_deleteselected',
+    'mi_selectsegment', 'mi_selectarcsegment', 'mi_selectnode', 'mi_selectlabel', 'mi_selectrectangle',
+    'mi_setsegmentprop', 'mi_setarcsegmentprop', 'mi_setblockprop', 'mi_moverotate',
+    'mi_modifycircprop', 'mi_modifyboundprop', 'mi_smartmesh', 'mi_createmesh', 'mi_analyse', 'mi_loadsolution', 'mi_saveas',
+    'mo_smoothoff', 'mo_gapintegral', 'mo_clearblock', 'mo_groupselectblock', 'mo_blockintegral',
+    'mo_getcircuitproperties', 'mo_getb', 'mo_close',
+)
+
+_instance = None
+_override = None
+
+
+class FemmBackend:
+    name = 'femm'
+
+    def __init__(self):
+        try:
+            import femm
+        except ImportError as e:
+            raise ImportError(f"The FEMM backend needs pyfemm and a FEMM installation, select another backend with {backend_env}.") from e
+        self.femm = femm
+
+    def __getattr__(self, name):
+        return getattr(self.femm, name)
+
+class AnalyticBackend:
+    name = 'analytic'
+    marker = 'analytic-backend'
+
+    magnet_materials = {'N28UH': 1.04}
+    pole_pairs = 4
+    slots = 12
+    flux_factor = 6.4e-5
+    inductance = 5e-5
+    cogging_factor = 0.05
+    ripple_factor = 0.03
+    harmonic_factor = 0.04
+    flux_density_ref = 0.8
+    flux_ref = 2e-3
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.document = None
+        self.segments = []
+        self.labels = []
+        self.selected = {'segments': set(), 'labels': set()}
+        self.circuits = {'A': 0.0, 'B': 0.0, 'C': 0.0}
+        self.bounds = {}
+        self.groups = set()
+        self.solution = None
+        self.areas = None
+        self.analyses = 0
+        self.meshes = 0
+
+    def openfemm(self, hide=0):
+        self.reset()
+
+    def closefemm(self):
+        self.reset()
+
+    def opendocument(self, filename):
+        self.reset()
+        self.document = filename
+        try:
+            with open(filename, 'r') as file:
+                state = json.load(file)
+        except (OSError, UnicodeDecodeError, ValueError):
+            return
+        if isinstance(state, dict) and state.get('format') == self.marker:
+            self.areas = None
+            self.segments = state['segments']
+            self.labels = state['labels']
+            self.circuits = state['circuits']
+            self.bounds = state['bounds']
+
+    def mi_saveas(self, filename):
+        with open(filename, 'w') as file:
+            json.dump({'format': self.marker, 'segments': self.segments, 'labels': self.labels, 'circuits': self.circuits, 'bounds': self.bounds}, file)
+        self.document = filename
+
+    def mi_drawline(self, x1, y1, x2, y2):
+        self._add_segment(x1, y1, x2, y2, 0)
+
+    def mi_drawarc(self, x1, y1, x2, y2, angle, maxseg):
+        self._add_segment(x1, y1, x2, y2, angle)
+
+    def _add_segment(self, x1, y1, x2, y2, arc):
+        self.areas = None
+        self.segments.append({'p1': [float(x1), float(y1)], 'p2': [float(x2), float(y2)], 'arc': float(arc), 'group': 0, 'boundary': '<None>'})
+
+    def mi_addblocklabel(self, x, y):
+        self.areas = None
+        self.labels.append({'p': [float(x), float(y)], 'material': '<None>', 'magdir': 0.0, 'group': 0, 'circuit': '<None>'})
+
+    def mi_clearselected(self):
+        self.selected = {'segments': set(), 'labels': set()}
+
+    def _nearest(self, items, x, y, points):
+        if len(items) == 0:
+            return None
+        distances = [min(np.hypot(px - x, py - y) for px, py in points(item)) for item in items]
+        return int(np.argmin(distances))
+
+    def _segment_points(self, segment, samples=5):
+        p1 = np.array(segment['p1'])
+        p2 = np.array(segment['p2'])
+        if segment['arc'] == 0:
+            return [tuple(p1 + (p2 - p1)*t) for t in np.linspace(0, 1, samples)]
+        _, mid = _arc_midpoint(p1, p2, segment['arc'])
+        return [tuple(p1), tuple((p1 + mid)/2), tuple(mid), tuple((mid + p2)/2), tuple(p2)]
+
+    def mi_selectsegment(self, x, y):
+        lines = [i for i, s in enumerate(self.segments) if s['arc'] == 0]
+        index = self._nearest([self.segments[i] for i in lines], x, y, self._segment_points)
+        if index is not None:
+            self.selected['segments'].add(lines[index])
+
+    def mi_selectarcsegment(self, x, y):
+        arcs = [i for i, s in enumerate(self.segments) if s['arc'] != 0]
+        index = self._nearest([self.segments[i] for i in arcs], x, y, self._segment_points)
+        if index is not None:
+            self.selected['segments'].add(arcs[index])
+
+    def mi_selectnode(self, x, y):
+        nodes = [p for s in self.segments for p in (s['p1'], s['p2'])]
+        if len(nodes) == 0:
+            return (x, y)
+        node = nodes[int(np.argmin([np.hypot(p[0] - x, p[1] - y) for p in nodes]))]
+        return (node[0], node[1])
+
+    def mi_selectlabel(self, x, y):
+        index = self._nearest(self.labels, x, y, lambda label: [label['p']])
+        if index is not None:
+            self.selected['labels'].add(index)
+
+    def mi_selectrectangle(self, x1, y1, x2, y2, editmode=4):
+        xmin, xmax = min(x1, x2), max(x1, x2)
+        ymin, ymax = min(y1, y2), max(y1, y2)
+        inside = lambda p: xmin - 1e-9 <= p[0] <= xmax + 1e-9 and ymin - 1e-9 <= p[1] <= ymax + 1e-9
+        if editmode in (1, 3, 4):
+            for i, s in enumerate(self.segments):
+                if inside(s['p1']) and inside(s['p2']) and (editmode == 4 or (editmode == 1) == (s['arc'] == 0)):
+                    self.selected['segments'].add(i)
+        if editmode in (2, 4):
+            for i, label in enumerate(self.labels):
+                if inside(label['p']):
+                    self.selected['labels'].add(i)
+
+    def mi_setsegmentprop(self, name, elemsize, automesh, hide, group):
+        self.areas = None
+        for i in self.selected['segments']:
+            self.segments[i].update({'boundary': name, 'group': group})
+
+    def mi_setarcsegmentprop(self, maxseg, name, hide, group):
+        self.areas = None
+        for i in self.selected['segments']:
+            self.segments[i].update({'boundary': name, 'group': group})
+
+    def mi_setblockprop(self, material, automesh, meshsize, incircuit, magdir, group, turns):
+        self.areas = None
+        for i in self.selected['labels']:
+            self.labels[i].update({'material': material, 'magdir': float(magdir), 'group': group, 'circuit': incircuit})
+
+    def mi_moverotate(self, bx, by, angle):
+        self.areas = None
+        rot = np.deg2rad(angle)
+        turn = lambda p: [bx + (p[0] - bx)*np.cos(rot) - (p[1] - by)*np.sin(rot), by + (p[0] - bx)*np.sin(rot) + (p[1] - by)*np.cos(rot)]
+        for i in self.selected['segments']:
+            self.segments[i]['p1'] = turn(self.segments[i]['p1'])
+            self.segments[i]['p2'] = turn(self.segments[i]['p2'])
+        for i in self.selected['labels']:
+            self.labels[i]['p'] = turn(self.labels[i]['p'])
+
+    def mi_deleteselected(self):
+        self.areas = None
+        self.segments = [s for i, s in enumerate(self.segments) if i not in self.selected['segments']]
+        self.labels = [label for i, label in enumerate(self.labels) if i not in self.selected['labels']]
+        self.mi_clearselected()
+
+    def mi_modifycircprop(self, name, propnum, value):
+        if propnum == 1:
+            self.circuits[name] = float(np.real(value))
+
+    def mi_modifyboundprop(self, name, propnum, value):
+        self.bounds[name] = {**self.bounds.get(name, {}), str(propnum): float(value)}
+
+    def mi_smartmesh(self, state):
+        return
+
+    def mi_createmesh(self):
+        self.meshes += 1
+        return len(self.segments)
+
+    def mi_analyse(self, flag=0):
+        self.analyses += 1
+        self.solution = self._solve()
+
+    def mi_loadsolution(self):
+        return
+
+    def mo_smoothoff(self):
+        return
+
+    def mo_close(self):
+        return
+
+    def mo_clearblock(self):
+        self.groups = set()
+
+    def mo_groupselectblock(self, group):
+        self.groups.add(group)
+
+    def mo_blockintegral(self, kind):
+        areas = [area for area, label in zip(self.solution['areas'], self.labels) if label['group'] in self.groups]
+        if kind == 5:
+            return sum(areas)*1e-6
+        return 0.0
+
+    def mo_gapintegral(self, name, kind):
+        return self.solution['torque'] if kind == 0 else 0.0
+
+    def mo_getcircuitproperties(self, name):
+        return (self.circuits.get(name, 0.0), 0.0, self.solution['flux'].get(name, 0.0))
+
+    def mo_getb(self, x, y):
+        phi = np.arctan2(y, x)
+        b = self.solution['b']*np.cos(self.pole_pairs*phi - self.solution['field_angle'])
+        return (b*np.cos(phi), b*np.sin(phi))
+
+    def _areas(self):
+        nodes = {}
+        parent = {}
+        def key(p):
+            return (round(p[0], 6), round(p[1], 6))
+        def find(k):
+            while parent[k] != k:
+                parent[k] = parent[parent[k]]
+                k = parent[k]
+            return k
+        for s in self.segments:
+            a, b = key(s['p1']), key(s['p2'])
+            for k in (a, b):
+                parent.setdefault(k, k)
+            parent[find(a)] = find(b)
+        for s in self.segments:
+            nodes.setdefault((find(key(s['p1'])), s['group']), []).extend(self._segment_points(s))
+        areas = []
+        for label in self.labels:
+            best = 0.0
+            distance = np.inf
+            for (_, group), points in nodes.items():
+                if group != label['group'] and group != 0:
+                    continue
+                hull = _convex_hull(points)
+                if len(hull) < 3:
+                    continue
+                d = 0.0 if _inside(hull, label['p']) else min(np.hypot(px - label['p'][0], py - label['p'][1]) for px, py in hull)
+                if d < distance or (d == distance and group == label['group']):
+                    distance = d
+                    best = _polygon_area(hull)
+            areas.append(best)
+        return areas
+
+    def _solve(self):
+        p = self.pole_pairs
+        if self.areas is None:
+            self.areas = self._areas()
+        areas = self.areas
+        radius = max([np.hypot(*q) for s in self.segments for q in (s['p1'], s['p2'])] + [1e-9])
+        moment = 0j
+        buried = 0.0
+        total = 0.0
+        for area, label in zip(areas, self.labels):
+            br = self.magnet_materials.get(label['material'])
+            if br is None:
+                continue
+            r = np.hypot(*label['p'])
+            phi = np.arctan2(label['p'][1], label['p'][0])
+            delta = np.deg2rad(label['magdir']) - phi
+            moment += br*area*(r/radius)**(p - 1)*np.exp(1j*delta)*np.exp(-1j*p*phi)
+            buried += area*(1 - r/radius)
+            total += area
+        psi_m = self.flux_factor*np.abs(moment)
+        saliency = min(4*buried/total, 1.0) if total > 0 else 0.0
+        ld = self.inductance*(1 - 0.3*saliency)
+        lq = self.inductance*(1 + saliency)
+
+        theta_m = np.deg2rad(self.bounds.get('SlidingBand', {}).get('10', 0.0))
+        theta_e = p*theta_m - (np.angle(moment) if total > 0 else 0.0)
+        axes = {'A': 0.0, 'B': -2/3*np.pi, 'C': 2/3*np.pi}
+        i_d = 2/3*sum(self.circuits.get(k, 0.0)*np.cos(theta_e - a) for k, a in axes.items())
+        i_q = -2/3*sum(self.circuits.get(k, 0.0)*np.sin(theta_e - a) for k, a in axes.items())
+        psi_d = psi_m + ld*i_d
+        psi_q = lq*i_q
+
+        flux = {k: psi_d*np.cos(theta_e - a) - psi_q*np.sin(theta_e - a) + self.harmonic_factor*psi_m*np.cos(5*(theta_e - a)) for k, a in axes.items()}
+        cogging = self.cogging_factor*1.5*p*psi_m*10*np.sin(math.lcm(self.slots, 2*p)*theta_m)
+        torque = 1.5*p*(psi_d*i_q - psi_q*i_d)*(1 + self.ripple_factor*np.sin(6*theta_e)) + cogging
+        return {
+            'areas': areas,
+            'torque': float(torque),
+            'flux': {k: float(v) for k, v in flux.items()},
+            'b': float(min(self.flux_density_ref*np.hypot(psi_d, psi_q)/self.flux_ref, 2.0)),
+            'field_angle': float(theta_e - p*theta_m + np.arctan2(psi_q, psi_d)),
+        }
+
+def _arc_midpoint(p1, p2, angle):
+    mid = (p1 + p2)/2
+    length = np.hypot(*(p2 - p1))
+    depth = length/2*np.tan(np.deg2rad(angle)/4)
+    vec = p2 - p1
+    return depth, mid + np.array([vec[1], -vec[0]])/length*depth
+
+def _convex_hull(points):
+    points = sorted(set((round(x, 9), round(y, 9)) for x, y in points))
+    if len(points) < 3:
+        return points
+    cross = lambda o, a, b: (a[0] - o[0])*(b[1] - o[1]) - (a[1] - o[1])*(b[0] - o[0])
+    lower = []
+    for p in points:
+        while len(lower) >= 2 and cross(lower[-2], lower[-1], p) <= 0:
+            lower.pop()
+        lower.append(p)
+    upper = []
+    for p in reversed(points):
+        while len(upper) >= 2 and cross(upper[-2], upper[-1], p) <= 0:
+            upper.pop()
+        upper.append(p)
+    return lower[:-1] + upper[:-1]
+
+def _polygon_area(points):
+    x = np.array([p[0] for p in points])
+    y = np.array([p[1] for p in points])
+    return float(np.abs(np.dot(x, np.roll(y, 1)) - np.dot(y, np.roll(x, 1)))/2)
+
+def _inside(hull, point):
+    for i in range(len(hull)):
+        a, b = hull[i], hull[(i + 1) % len(hull)]
+        if (b[0] - a[0])*(point[1] - a[1]) - (b[1] - a[1])*(point[0] - a[0]) < -1e-12:
+            return False
+    return True
+
+backends = {
+    'femm': FemmBackend,
+    'analytic': AnalyticBackend,
+}
+
+def register_backend(name, cls):
+    backends[name] = cls
+
+def get_backend():
+    global _instance
+    name = backend_name()
+    if _instance is None or _instance.name != name:
+        if name not in backends:
+            raise KeyError(f"Unknown solver backend {name}.")
+        _instance = backends[name]()
+    return _instance
+
+def set_backend(name):
+    global _instance
+    if name not in backends:
+        raise KeyError(f"Unknown solver backend {name}.")
+    os.environ[backend_env] = name
+    _instance = None
+
+def backend_name():
+    return _override if _override is not None else os.environ.get(backend_env, default_backend)
+
+@contextmanager
+def override_backend(name):
+    global _override
+    if name not in backends:
+        raise KeyError(f"Unknown solver backend {name}.")
+    previous = _override
+    _override = name
+    try:
+        yield get_backend()
+    finally:
+        _override = previous
+
+def _forward(name):
+    def call(*args):
+        return getattr(get_backend(), name)(*args)
+    call.__name__ = name
+    return call
+
+for _name in femm_functions:
+    globals()[_name] = _forward(_name)
+
+if __name__ == "__main__":
+    sys.exit(0)
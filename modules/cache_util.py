@@ -0,0 +1,320 @@
+import sys, os
+import glob
+import json
+import shutil
+import time
+import sqlite3
+import hashlib
+import numpy as np
+
+sys.path.insert(0, os.getcwd())
+import modules.backend_util as backend_util
+
+default_cache_path = os.path.join('cache', 'results.sqlite')
+default_max_bytes = 512*1024*1024
+default_template_path = os.path.join('cache', 'templates')
+default_max_templates = 4096
+
+# Version of the row layout simulate_general returns, bump it whenever output columns change so older cached rows are not served.
+# 2: flux density probes and stator iron area with loss_probes.
+# 3: same_position replaces mesh_reused.
+# 4: same_position dropped.
+schema_version = 4
+point_keys = ('irms', 'degel', 'degmech')
+# Only parameters the rotor generators and simulate_general read enter the geometry hash, everything else the
+# settings merge into the parameters is ignored. A generator that reads a new parameter must add it here.
+geometry_keys = ('inner_radius', 'outer_radius', 'magnet_depth', 'magnet_angle', 'angle_margin', 'ratio', 'ratio_inner', 'ratio_outer', 'angle', 'magangle', 'halbach_side', 'create_by_angle')
+# Read by simulate_general only for runs with loss_probes.
+probe_keys = ('loss_probes', 'tooth_radius', 'yoke_radius', 'stator_poles', 'symmetry_factor')
+
+_digests = {}
+
+
+def normalize(value):
+    if isinstance(value, (bool, np.bool_)):
+        return bool(value)
+    if isinstance(value, (int, np.integer)):
+        return int(value)
+    if isinstance(value, (float, np.floating)):
+        return float(f"{float(value):.10g}")
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return [normalize(v) for v in value]
+    if isinstance(value, dict):
+        return {str(k): normalize(v) for k, v in sorted(value.items(), key=lambda x: str(x[0]))}
+    if value is None or isinstance(value, str):
+        return value
+    return repr(value)
+
+def hashed_keys(params):
+    return geometry_keys + (probe_keys if params.get('loss_probes', False) else ())
+
+def is_hashed(key, value):
+    if key not in geometry_keys and key not in probe_keys:
+        return False
+    return isinstance(value, (str, bool, int, float, np.bool_, np.integer, np.floating))
+
+def file_digest(path):
+    try:
+        stat = os.stat(path)
+    except (OSError, TypeError):
+        return ''
+    tag = (path, stat.st_mtime_ns, stat.st_size)
+    if tag not in _digests:
+        with open(path, 'rb') as file:
+            _digests[tag] = hashlib.sha256(file.read()).hexdigest()
+    return _digests[tag]
+
+def geometry_key(rotfunc, params):
+    module = sys.modules.get(rotfunc.__module__)
+    fem_util = sys.modules.get('modules.fem_util')
+    content = {
+        'schema': schema_version,
+        'backend': backend_util.backend_name(),
+        'module': rotfunc.__module__,
+        'source': file_digest(getattr(module, '__file__', None)),
+        'helpers': file_digest(getattr(fem_util, '__file__', None)),
+        'stator': file_digest(params.get('stator_path')),
+        'params': {k: normalize(params[k]) for k in hashed_keys(params) if k in params and is_hashed(k, params[k])},
+    }
+    return hashlib.sha256(json.dumps(content, sort_keys=True).encode('utf-8')).hexdigest()
+
+def point_key(gkey, params):
+    content = {'geometry': gkey, 'point': {k: normalize(params.get(k)) for k in point_keys}}
+    return hashlib.sha256(json.dumps(content, sort_keys=True).encode('utf-8')).hexdigest()
+
+def split_outputs(inputs, row):
+    outputs = {}
+    for key, value in row.items():
+        try:
+            same = key in inputs and bool(inputs[key] == value)
+        except (ValueError, TypeError):
+            same = False
+        if not same:
+            outputs[key] = value
+    return outputs
+
+def slot_keys(rotfunc, combos, points):
+    keys = []
+    for combo in combos:
+        first = dict(combo)
+        first.update(points[0]) if len(points) != 0 else 0
+        gkey = geometry_key(rotfunc, first)
+        for point in points:
+            inputs = dict(combo)
+            inputs.update(point)
+            keys.append(point_key(gkey, inputs))
+    return keys
+
+def _default(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    return repr(value)
+
+class ResultCache:
+    def __init__(self, path=default_cache_path, max_bytes=default_max_bytes):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.merged = 0
+        if os.path.dirname(path) and not os.path.exists(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        self.connection = sqlite3.connect(path, timeout=60)
+        self.connection.execute('CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, row TEXT, size INTEGER, accessed REAL)')
+        self.connection.commit()
+        self.size = self.connection.execute('SELECT COALESCE(SUM(size), 0) FROM results').fetchone()[0]
+
+    def __bool__(self):
+        return True
+
+    def __len__(self):
+        return self.connection.execute('SELECT COUNT(*) FROM results').fetchone()[0]
+
+    def get(self, key):
+        entry = self.connection.execute('SELECT row FROM results WHERE key = ?', (key,)).fetchone()
+        if entry is None:
+            return None
+        self.connection.execute('UPDATE results SET accessed = ? WHERE key = ?', (time.time(), key))
+        return json.loads(entry[0])
+
+    def put(self, key, row):
+        data = json.dumps(row, default=_default)
+        old = self.connection.execute('SELECT size FROM results WHERE key = ?', (key,)).fetchone()
+        self.connection.execute('INSERT OR REPLACE INTO results (key, row, size, accessed) VALUES (?, ?, ?, ?)', (key, data, len(data), time.time()))
+        self.size += len(data) - (old[0] if old is not None else 0)
+        if self.size > self.max_bytes:
+            self.evict()
+        self.connection.commit()
+
+    def evict(self, target=0.9):
+        while self.size > self.max_bytes*target:
+            entries = self.connection.execute('SELECT key, size FROM results ORDER BY accessed ASC LIMIT 256').fetchall()
+            if len(entries) == 0:
+                self.size = 0
+                break
+            for key, size in entries:
+                self.connection.execute('DELETE FROM results WHERE key = ?', (key,))
+                self.size -= size
+                if self.size <= self.max_bytes*target:
+                    break
+        self.connection.commit()
+
+    def clear(self):
+        self.connection.execute('DELETE FROM results')
+        self.connection.commit()
+        self.size = 0
+
+    def lookup(self, rotfunc, combos, points, known=None):
+        rows = []
+        jobs = []
+        pending = {}
+        for combo in combos:
+            first = dict(combo)
+            first.update(points[0]) if len(points) != 0 else 0
+            gkey = geometry_key(rotfunc, first)
+            job = {'combo': combo, 'points': [], 'keys': [], 'inputs': []}
+            for point in points:
+                inputs = dict(combo)
+                inputs.update(point)
+                slot = len(rows)
+                if known is not None and known[slot] is not None:
+                    rows.append(known[slot])
+                    continue
+                key = point_key(gkey, inputs)
+                if key in pending:
+                    rows.append(None)
+                    pending[key].append((slot, inputs))
+                    self.merged += 1
+                    continue
+                outputs = self.get(key)
+                if outputs is not None:
+                    row = dict(inputs)
+                    row.update(outputs)
+                    rows.append(row)
+                    self.hits += 1
+                    continue
+                rows.append(None)
+                pending[key] = [(slot, inputs)]
+                job['points'].append(point)
+                job['keys'].append(key)
+                job['inputs'].append(inputs)
+                self.misses += 1
+            if len(job['points']) != 0:
+                jobs.append(job)
+        self.connection.commit()
+        return rows, jobs, pending
+
+    def store(self, job, res, rows, pending, persist=True):
+        for key, inputs, row in zip(job['keys'], job['inputs'], res):
+            outputs = split_outputs(inputs, row)
+            if persist:
+                self.put(key, outputs)
+            for slot, slot_inputs in pending.pop(key, []):
+                filled = dict(slot_inputs)
+                filled.update(outputs)
+                rows[slot] = filled
+
+    def report(self):
+        total = self.hits + self.misses
+        ret = f"Cache: {self.hits}/{total} hits ({100*self.hits/(total if total > 0 else 1):.1f}%), {self.misses} misses, {self.merged} duplicate points merged, {self.size/1024/1024:.1f} MB used."
+        self.hits = 0
+        self.misses = 0
+        self.merged = 0
+        return ret
+
+    def close(self):
+        self.connection.close()
+
+class Journal:
+    def __init__(self, path):
+        self.path = path
+        self.rows = {}
+        if os.path.dirname(path) and not os.path.exists(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        torn = False
+        if os.path.exists(path):
+            with open(path, 'r') as file:
+                for line in file:
+                    torn = not line.endswith('\n')
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    self.rows[entry['key']] = entry['row']
+        self.file = open(path, 'a')
+        if torn:
+            self.file.write('\n')
+
+    def __len__(self):
+        return len(self.rows)
+
+    def get(self, key):
+        return self.rows.get(key)
+
+    def append(self, key, row):
+        self.file.write(json.dumps({'key': key, 'row': row}, default=_default) + '\n')
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.rows[key] = row
+
+    def close(self):
+        if not self.file.closed:
+            self.file.close()
+
+    def remove(self):
+        self.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+class TemplateStore:
+    # Drawn rotor geometries by geometry key, so later runs of the same geometry start from the saved .FEM.
+    def __init__(self, path=default_template_path, max_files=default_max_templates):
+        self.path = path
+        self.max_files = max_files
+        if not os.path.exists(path):
+            os.makedirs(path)
+
+    def files(self, gkey):
+        base = os.path.join(self.path, gkey)
+        return base + '.FEM', base + '.json'
+
+    def get(self, gkey):
+        filename, meta = self.files(gkey)
+        if not os.path.exists(filename) or not os.path.exists(meta):
+            return None
+        try:
+            with open(meta, 'r') as file:
+                retpars = json.load(file)
+        except (OSError, ValueError):
+            return None
+        os.utime(meta)
+        return {'path': filename, 'retpars': retpars}
+
+    def put(self, gkey, template):
+        filename, meta = self.files(gkey)
+        suffix = f".{os.getpid()}.tmp"
+        shutil.copyfile(template['path'], filename + suffix)
+        os.replace(filename + suffix, filename)
+        with open(meta + suffix, 'w') as file:
+            json.dump(template['retpars'], file, default=_default)
+        os.replace(meta + suffix, meta)
+        self.evict()
+        return {'path': filename, 'retpars': template['retpars']}
+
+    def evict(self):
+        metas = sorted(glob.glob(os.path.join(self.path, '*.json')), key=lambda path: os.path.getmtime(path) if os.path.exists(path) else 0)
+        for meta in metas[:max(0, len(metas) - self.max_files)]:
+            for path in (meta, os.path.splitext(meta)[0] + '.FEM'):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+def remove_journal(path):
+    if os.path.exists(path):
+        os.remove(path)
+
+if __name__ == "__main__":
+    sys.exit(0)
@@ -0,0 +1,249 @@
+import sys, os
+import time
+import socket
+import threading
+import traceback
+import multiprocessing
+from multiprocessing.connection import Listener, Client
+from collections import deque
+import numpy as np
+
+sys.path.insert(0, os.getcwd())
+import modules.backend_util as backend_util
+import modules.supervisor_util as supervisor_util
+
+# Broker and agents exchange pickled tasks and results over multiprocessing.connection. Unpickling runs arbitrary
+# code, so the channel must only be used on trusted networks. The authkey is the only protection, it has no default
+# and has to be passed explicitly or set in PMSM_AUTHKEY on the broker and on every agent. The broker listens on
+# localhost unless another address is given, e.g. ('0.0.0.0', 6010) on a trusted cluster network.
+default_address = ('127.0.0.1', 6010)
+authkey_env = 'PMSM_AUTHKEY'
+
+
+def default_authkey():
+    return os.environ.get(authkey_env, '').encode('utf-8')
+
+def resolve_authkey(authkey=None):
+    authkey = authkey if authkey is not None else default_authkey()
+    if isinstance(authkey, str):
+        authkey = authkey.encode('utf-8')
+    if len(authkey) == 0:
+        raise RuntimeError(f"No authkey set for the distributed executor, pass one or set {authkey_env}. The channel is pickle based and must only run on trusted networks.")
+    return authkey
+
+def run_with_backend(backend, func, args):
+    if backend_util.backend_name() != backend:
+        backend_util.set_backend(backend)
+    return func(*args)
+
+def run_agent(address, authkey=None, workers=None, worker_memory_mb=supervisor_util.default_worker_memory_mb):
+    conn = Client(tuple(address), authkey=resolve_authkey(authkey))
+    lock = threading.Lock()
+
+    def send(message):
+        with lock:
+            try:
+                conn.send(message)
+            except (OSError, EOFError):
+                pass
+
+    def done(future, key):
+        error = future.exception()
+        if error is None:
+            send(('result', key, 'ok', future.result()))
+        elif isinstance(error, supervisor_util.TaskFailed):
+            last = error.report['errors'][-1]
+            send(('result', key, last['reason'], last['error']))
+        else:
+            send(('result', key, 'error', f"{type(error).__name__}: {error}"))
+
+    # spawned workers do not inherit the broker socket, so a dead agent closes it
+    context = multiprocessing.get_context('spawn')
+    with supervisor_util.SupervisedExecutor(supervisor_util.pool_size(workers, worker_memory_mb), retries=0, mp_context=context, budget=None) as executor:
+        send(('hello', socket.gethostname(), executor.max_workers))
+        print(f"Agent on {socket.gethostname()} connected to {address} with {executor.max_workers} workers.")
+        while True:
+            try:
+                message = conn.recv()
+            except (EOFError, OSError):
+                break
+            if message[0] == 'stop':
+                break
+            _, key, backend, func, args, timeout = message
+            future = executor.submit(run_with_backend, backend, func, args, timeout=timeout, tag=key)
+            future.add_done_callback(lambda future, key=key: done(future, key))
+        executor.shutdown(wait=True, cancel_futures=True)
+    conn.close()
+
+def _agent_process(address, authkey, workers):
+    run_agent(address, authkey, workers)
+
+def spawn_local_agents(address, count, workers=1, authkey=None):
+    address = ('127.0.0.1', address[1]) if address[0] in ('0.0.0.0', '') else address
+    authkey = resolve_authkey(authkey)
+    agents = []
+    for _ in range(count):
+        process = multiprocessing.Process(target=_agent_process, args=(address, authkey, workers))
+        process.start()
+        agents.append(process)
+    return agents
+
+class _Agent:
+    def __init__(self, conn, host, slots):
+        self.conn = conn
+        self.host = host
+        self.slots = slots
+        self.running = {}
+        self.lock = threading.Lock()
+
+class DistributedExecutor:
+    def __init__(self, address=default_address, authkey=None, timeout=None, retries=2, perturb=None, seed=None):
+        self.listener = Listener(tuple(address), authkey=resolve_authkey(authkey))
+        self.address = self.listener.address
+        self.timeout = timeout
+        self.retries = retries
+        self.perturb = perturb
+        self.rng = np.random.default_rng(seed)
+        self.queue = deque()
+        self.agents = []
+        self.failures = []
+        self.recovered = []
+        self.counter = 0
+        self.condition = threading.Condition()
+        self.closed = False
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown(wait=True)
+        return False
+
+    @property
+    def max_workers(self):
+        with self.condition:
+            return sum(agent.slots for agent in self.agents)
+
+    def wait_for_agents(self, count, timeout=None):
+        start = time.time()
+        with self.condition:
+            while len(self.agents) < count:
+                if timeout is not None and time.time() - start > timeout:
+                    return False
+                self.condition.wait(0.5)
+        return True
+
+    def submit(self, func, *args, timeout=None, retries=None, perturb=None, tag=None, priority=0):
+        task = supervisor_util.Task(func, args, timeout if timeout is not None else self.timeout, retries if retries is not None else self.retries, perturb if perturb is not None else self.perturb, tag, priority)
+        with self.condition:
+            if self.closed:
+                raise RuntimeError("Cannot submit to a shut down executor.")
+            supervisor_util.enqueue(self.queue, task)
+            self._dispatch()
+        return task.future
+
+    def cancel(self, tasks=None):
+        with self.condition:
+            for task in [task for task in self.queue if tasks is None or task.future in tasks]:
+                self.queue.remove(task)
+                supervisor_util.cancel_task(task)
+            for agent in self.agents:
+                for task, _ in agent.running.values():
+                    if tasks is None or task.future in tasks:
+                        task.cancelled = True
+            self.condition.notify_all()
+
+    def _accept(self):
+        while True:
+            try:
+                conn = self.listener.accept()
+                hello = conn.recv()
+            except (OSError, EOFError):
+                if self.closed:
+                    break
+                continue
+            except Exception:
+                traceback.print_exc()
+                continue
+            agent = _Agent(conn, hello[1], hello[2])
+            with self.condition:
+                self.agents.append(agent)
+                print(f"Agent {agent.host} joined with {agent.slots} workers.")
+                self._dispatch()
+                self.condition.notify_all()
+            threading.Thread(target=self._serve, args=(agent,), daemon=True).start()
+
+    def _dispatch(self):
+        for agent in sorted(self.agents, key=lambda agent: len(agent.running) - agent.slots):
+            while len(self.queue) != 0 and len(agent.running) < agent.slots:
+                task = self.queue.popleft()
+                if task.attempts == 0 and not task.future.set_running_or_notify_cancel():
+                    continue
+                task.attempts += 1
+                task.future.attempts = task.attempts
+                self.counter += 1
+                key = self.counter
+                agent.running[key] = (task, time.time())
+                try:
+                    with agent.lock:
+                        agent.conn.send(('task', key, backend_util.backend_name(), task.func, task.args, task.timeout))
+                except (OSError, EOFError, ValueError):
+                    break
+
+    def _serve(self, agent):
+        while True:
+            try:
+                message = agent.conn.recv()
+            except (EOFError, OSError):
+                break
+            _, key, status, value = message
+            with self.condition:
+                task, started = agent.running.pop(key)
+                if task.cancelled:
+                    supervisor_util.cancel_task(task)
+                elif status == 'ok':
+                    if task.attempts > 1:
+                        self.recovered.append({'tag': task.tag, 'attempts': task.attempts, 'errors': task.errors})
+                    task.future.set_result(value)
+                else:
+                    task.errors.append({'reason': status, 'error': f"{value} on {agent.host}", 'elapsed': time.time() - started})
+                    supervisor_util.fail_task(task, self.queue, self.failures, self.rng)
+                self._dispatch()
+                self.condition.notify_all()
+        with self.condition:
+            self.agents.remove(agent)
+            print(f"Agent {agent.host} left, requeueing {len(agent.running)} tasks.")
+            for task, started in agent.running.values():
+                if task.cancelled:
+                    supervisor_util.cancel_task(task)
+                    continue
+                task.errors.append({'reason': 'lost', 'error': f"Agent {agent.host} disconnected.", 'elapsed': time.time() - started})
+                supervisor_util.fail_task(task, self.queue, self.failures, self.rng)
+            agent.running = {}
+            self._dispatch()
+            self.condition.notify_all()
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        with self.condition:
+            if cancel_futures:
+                while len(self.queue) != 0:
+                    self.queue.popleft().future.cancel()
+            while wait and (len(self.queue) != 0 or any(len(agent.running) != 0 for agent in self.agents)):
+                self.condition.wait(0.5)
+            self.closed = True
+            for agent in self.agents:
+                try:
+                    with agent.lock:
+                        agent.conn.send(('stop',))
+                except (OSError, EOFError):
+                    pass
+        self.listener.close()
+
+    def report(self):
+        return supervisor_util.failure_report("Broker", self.failures, self.recovered)
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 4 and sys.argv[1] == 'agent':
+        run_agent((sys.argv[2], int(sys.argv[3])), workers=int(sys.argv[4]) if len(sys.argv) > 4 else None)
+    sys.exit(0)
@@ -1,15 +1,15 @@
-from femm import *
+import sys, os
 from multimethod import overload 
 import numpy as np
-import sys
 
 sys.path.insert(0, os.getcwd())
+from modules.backend_util import *
 mashine_settings = {}
 
 
 def constrain(value, min_val, max_val):
-    if isinstance(value, np.ndarray):
-        return [min(max(v, min_val), max_val) for v in value]
+    if np.ndim(value) != 0:
+        return np.clip(value, min_val, max_val)
     else:
         return min(max(value, min_val), max_val)
 
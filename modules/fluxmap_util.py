@@ -0,0 +1,124 @@
+import sys, os
+import numpy as np
+import pandas as pd
+from scipy.interpolate import RegularGridInterpolator
+
+sys.path.insert(0, os.getcwd())
+import modules.post_util as post_util
+
+# Flux linkage and torque maps over the dq current plane of one geometry.
+# The d-axis is calibrated from the no-load flux linkages, the map is solved once on an (id, iq, position) grid
+# and every later question about currents, speeds or voltages is an interpolation on the position averaged tables.
+# Currents and voltages are peak phase values, flux linkages are scaled to the whole machine by symmetry_factor.
+phase_axes = np.deg2rad([0, -120, 120])
+phase_columns = ('flux_a', 'flux_b', 'flux_c')
+default_steps = 7
+# The torque map plot interpolates with a cubic spline, which needs four samples per current axis.
+min_steps = 4
+default_positions = 4
+default_angles = 181
+# Flux linkages and torque are averaged over the positions, probe flux densities keep their peak.
+reductions = (('psi_d', 'psi_d', 'mean'), ('psi_q', 'psi_q', 'mean'), ('torque', 'torque_airgap', 'mean'), ('b_tooth', 'b_tooth', 'max'), ('b_yoke', 'b_yoke', 'max'))
+
+
+def space_vector(df, sequence=1):
+    return 2/3*sum(df[column].to_numpy(dtype=np.float64)*np.exp(1j*sequence*axis) for column, axis in zip(phase_columns, phase_axes))
+
+def calibrate(static, pole_pairs):
+    static = static.sort_values('degmech')
+    theta = np.deg2rad(static['degmech'].to_numpy(dtype=np.float64))
+    angle = np.unwrap(np.angle(space_vector(static)))
+    sequence = 1 if np.polyfit(theta, angle, 1)[0] > 0 else -1
+    offset = np.angle(np.mean(np.exp(1j*(sequence*angle - pole_pairs*theta))))
+    return {'sequence': sequence, 'offset': float(offset), 'pole_pairs': pole_pairs}
+
+def electrical_angle(degmech, calibration):
+    return calibration['pole_pairs']*np.deg2rad(np.asarray(degmech, dtype=np.float64)) + calibration['offset']
+
+def current_grid(i_max, steps=default_steps):
+    return np.linspace(-i_max, 0, steps), np.linspace(0, i_max, steps)
+
+def spec(calibration, i_max, steps=default_steps, count=default_positions):
+    # Uniform samples over 60 degrees electrical average the sixth order torque ripple out.
+    return {
+        'parameters': {'i_d': [-i_max, 0, steps], 'i_q': [0, i_max, steps], 'pos': [0, count - 1, count]},
+        'expr': {'irms': 'sqrt(i_d**2 + i_q**2)', 'degel': 's*rad2deg(p*deg2rad(start + pos*pitch) + offset + arctan2(i_q, i_d))', 'degmech': 'start + pos*pitch'},
+        'constants': {
+            'p': calibration['pole_pairs'], 's': calibration['sequence'], 'offset': calibration['offset'],
+            'start': float(np.rad2deg(-calibration['offset']/calibration['pole_pairs'])), 'pitch': 60/calibration['pole_pairs']/count,
+        },
+        'mode': 'create'
+    }
+
+def dq_table(data, calibration, i_max, symmetry_factor=1, steps=default_steps):
+    theta = electrical_angle(data['degmech'], calibration)
+    current = data['irms'].to_numpy(dtype=np.float64)*np.exp(1j*(calibration['sequence']*np.deg2rad(data['degel'].to_numpy(dtype=np.float64)) - theta))
+    flux = symmetry_factor*space_vector(data, calibration['sequence'])*np.exp(-1j*theta)
+    ids, iqs = current_grid(i_max, steps)
+    ret = data.copy()
+    ret['id'] = ids[np.abs(current.real[:, None] - ids[None, :]).argmin(axis=1)]
+    ret['iq'] = iqs[np.abs(current.imag[:, None] - iqs[None, :]).argmin(axis=1)]
+    ret['psi_d'] = flux.real
+    ret['psi_q'] = flux.imag
+    return ret
+
+class FluxMap:
+    def __init__(self, table, pole_pairs, resistance=0.0):
+        self.pole_pairs = pole_pairs
+        self.resistance = resistance
+        unique, (inverse,) = post_util.group(post_util.key_array(table, ['id', 'iq']))
+        metrics = pd.DataFrame({column: post_util.segment(table[source].to_numpy(dtype=np.float64), inverse, len(unique), how) for column, source, how in reductions if source in table.columns}, index=post_util.make_index(unique, ['id', 'iq']))
+        self.tables = {column: post_util.table(metrics, column) for column in metrics.columns}
+        self.ids = self.tables['torque'].index.to_numpy()
+        self.iqs = self.tables['torque'].columns.to_numpy()
+        self.i_max = min(-self.ids.min(), self.iqs.max())
+        self.interpolators = {column: RegularGridInterpolator((self.ids, self.iqs), values.to_numpy(), bounds_error=False, fill_value=None) for column, values in self.tables.items()}
+
+    def evaluate(self, i_d, i_q):
+        i_d, i_q = np.broadcast_arrays(np.asarray(i_d, dtype=np.float64), np.asarray(i_q, dtype=np.float64))
+        query = np.stack([i_d.ravel(), i_q.ravel()], axis=-1)
+        return {column: interpolator(query).reshape(i_d.shape) for column, interpolator in self.interpolators.items()}
+
+    def omega(self, rpm):
+        return 2*np.pi*np.asarray(rpm, dtype=np.float64)/60*self.pole_pairs
+
+    def voltage(self, i_d, i_q, rpm):
+        values = self.evaluate(i_d, i_q)
+        omega = self.omega(rpm)
+        u_d = self.resistance*np.asarray(i_d) - omega*values['psi_q']
+        u_q = self.resistance*np.asarray(i_q) + omega*values['psi_d']
+        return np.hypot(u_d, u_q)
+
+    def back_emf(self, rpm):
+        values = self.evaluate(0, 0)
+        return self.omega(rpm)*np.hypot(values['psi_d'], values['psi_q'])
+
+    def candidates(self, i_max=None, steps=default_steps*8, angles=default_angles):
+        i_max = self.i_max if i_max is None else i_max
+        current, gamma = np.meshgrid(np.linspace(0, i_max, steps), np.linspace(np.pi/2, np.pi, angles), indexing='ij')
+        return current, gamma, current*np.cos(gamma), current*np.sin(gamma)
+
+    def mtpa(self, i_max=None, steps=default_steps*8, angles=default_angles):
+        current, gamma, i_d, i_q = self.candidates(i_max, steps, angles)
+        torque = self.evaluate(i_d, i_q)['torque']
+        best = torque.argmax(axis=1)
+        rows = np.arange(len(best))
+        return pd.DataFrame({'current': current[rows, best], 'gamma': np.rad2deg(gamma[rows, best]), 'id': i_d[rows, best], 'iq': i_q[rows, best], 'torque': torque[rows, best]})
+
+    def envelope(self, speeds, u_max, i_max=None, steps=default_steps*8, angles=default_angles):
+        _, _, i_d, i_q = self.candidates(i_max, steps, angles)
+        i_d, i_q = i_d.ravel(), i_q.ravel()
+        values = self.evaluate(i_d, i_q)
+        omega = self.omega(speeds)[:, None]
+        u_d = self.resistance*i_d[None, :] - omega*values['psi_q'][None, :]
+        u_q = self.resistance*i_q[None, :] + omega*values['psi_d'][None, :]
+        torque = np.where(np.hypot(u_d, u_q) <= u_max, values['torque'][None, :], -np.inf)
+        best = torque.argmax(axis=1)
+        feasible = np.isfinite(torque[np.arange(len(best)), best])
+        speeds = np.asarray(speeds, dtype=np.float64)
+        ret = pd.DataFrame({'rpm': speeds, 'torque': np.where(feasible, values['torque'][best], 0), 'id': np.where(feasible, i_d[best], np.nan), 'iq': np.where(feasible, i_q[best], np.nan)})
+        ret['power'] = ret['torque']*2*np.pi*speeds/60
+        return ret
+
+if __name__ == "__main__":
+    sys.exit(0)
@@ -0,0 +1,130 @@
+import sys, os
+import json
+import hashlib
+import numpy as np
+import pandas as pd
+from scipy.interpolate import RegularGridInterpolator
+
+sys.path.insert(0, os.getcwd())
+import modules.cache_util as cache_util
+
+# Copper and iron losses over the torque-speed plane from a solved flux map.
+# Iron losses follow the Steinmetz/Bertotti split p = kh*f*B^alpha + kc*(f*B)^2 in W/kg with the peak flux density
+# of the stator teeth and yoke, sampled by mo_getb probes at every tooth and yoke section of the model sector.
+# Every operating point picks the current with the lowest total loss that reaches the torque within the limits.
+materials = {
+    '50JN400': {'kh': 0.0175, 'alpha': 1.9, 'kc': 2e-4, 'density': 7650},
+}
+default_material = '50JN400'
+stator_group = 1
+tooth_radius = 22
+yoke_radius = 26.7
+map_speeds = 41
+map_torques = 41
+# Settings an efficiency map depends on besides its flux map, a stored map is reused while they, the flux map file
+# and this module are unchanged. A drive cycle is a CSV file with rpm, torque in Nm and duration in s per row.
+map_keys = ('rotor_poles', 'resistance', 'irms', 'u_max', 'rpm', 'stack_length', 'symmetry_factor')
+cycle_columns = ('rpm', 'torque', 'duration')
+
+
+def probes(params):
+    pitch = 360/params.get('stator_poles', 12)
+    span = 360/params.get('symmetry_factor', 4)
+    count = int(round(span/pitch))
+    teeth = [k*pitch for k in range(1, count)] if count > 1 else [pitch/2]
+    yokes = [(k + 0.5)*pitch for k in range(count)]
+    point = lambda radius, angle: (radius*np.cos(np.deg2rad(angle)), radius*np.sin(np.deg2rad(angle)))
+    return [point(params.get('tooth_radius', tooth_radius), angle) for angle in teeth], [point(params.get('yoke_radius', yoke_radius), angle) for angle in yokes]
+
+def core_density(b, frequency, material=default_material):
+    coefficients = materials[material]
+    b = np.abs(b)
+    return coefficients['kh']*frequency*b**coefficients['alpha'] + coefficients['kc']*(frequency*b)**2
+
+def iron_mass(area, params, material=default_material):
+    return area*params.get('stack_length', 63)*1e-3*params.get('symmetry_factor', 4)*materials[material]['density']
+
+class LossModel:
+    def __init__(self, fluxmap, mass, tooth_share=0.5, material=default_material):
+        self.fluxmap = fluxmap
+        self.mass = mass
+        self.tooth_share = tooth_share
+        self.material = material
+
+    def copper(self, i_d, i_q):
+        return 1.5*self.fluxmap.resistance*(np.asarray(i_d)**2 + np.asarray(i_q)**2)
+
+    def iron(self, values, rpm):
+        frequency = np.asarray(rpm, dtype=np.float64)*self.fluxmap.pole_pairs/60
+        tooth = core_density(values['b_tooth'], frequency, self.material)
+        yoke = core_density(values['b_yoke'], frequency, self.material)
+        return self.mass*(self.tooth_share*tooth + (1 - self.tooth_share)*yoke)
+
+    def efficiency_map(self, speeds, torques, u_max, i_max=None, steps=None, angles=None):
+        options = {key: value for key, value in (('steps', steps), ('angles', angles)) if value is not None}
+        _, _, i_d, i_q = self.fluxmap.candidates(i_max, **options)
+        i_d, i_q = i_d.ravel(), i_q.ravel()
+        values = self.fluxmap.evaluate(i_d, i_q)
+        order = np.argsort(-values['torque'], kind='stable')
+        i_d, i_q = i_d[order], i_q[order]
+        values = {column: value[order] for column, value in values.items()}
+        speeds = np.asarray(speeds, dtype=np.float64)
+        torques = np.asarray(torques, dtype=np.float64)
+        feasible = self.fluxmap.voltage(i_d[None, :], i_q[None, :], speeds[:, None]) <= u_max
+        copper = np.broadcast_to(self.copper(i_d, i_q)[None, :], feasible.shape)
+        iron = self.iron({column: value[None, :] for column, value in values.items()}, speeds[:, None])
+        total = np.where(feasible, copper + iron, np.inf)
+        # Running minimum over candidates sorted by falling torque, the column of a target torque holds
+        # the cheapest current that reaches at least that torque.
+        best = np.minimum.accumulate(total, axis=1)
+        arg = np.zeros(total.shape, dtype=int)
+        arg[:, 1:] = np.arange(1, total.shape[1])*(total[:, 1:] < best[:, :-1])
+        arg = np.maximum.accumulate(arg, axis=1)
+        reach = np.searchsorted(-values['torque'], -torques, side='right') - 1
+        valid = reach >= 0
+        reach = np.maximum(reach, 0)
+        choice = arg[:, reach]
+        loss = np.where(valid[None, :], best[:, reach], np.inf)
+        rows = np.arange(len(speeds))[:, None]
+        ret = pd.DataFrame({
+            'rpm': np.repeat(speeds, len(torques)),
+            'torque': np.tile(torques, len(speeds)),
+            'id': i_d[choice].ravel(),
+            'iq': i_q[choice].ravel(),
+            'copper_loss': copper[rows, choice].ravel(),
+            'iron_loss': iron[rows, choice].ravel(),
+            'loss': loss.ravel(),
+        })
+        unreachable = ~np.isfinite(ret['loss'].to_numpy())
+        ret.loc[unreachable, ['id', 'iq', 'copper_loss', 'iron_loss', 'loss']] = np.nan
+        power = ret['torque']*2*np.pi*ret['rpm']/60
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ret['efficiency'] = power/(power + ret['loss'])
+        return ret
+
+def map_key(fluxpath, params):
+    content = {
+        'fluxmap': cache_util.file_digest(fluxpath),
+        'source': cache_util.file_digest(__file__),
+        'params': {key: cache_util.normalize(params.get(key)) for key in map_keys},
+    }
+    return hashlib.sha256(json.dumps(content, sort_keys=True).encode('utf-8')).hexdigest()
+
+def table(efficiency, column='efficiency'):
+    return efficiency.pivot(index='torque', columns='rpm', values=column)
+
+def cycle(efficiency, rpm, torque, duration):
+    grid = table(efficiency, 'loss')
+    interpolator = RegularGridInterpolator((grid.index.to_numpy(), grid.columns.to_numpy()), grid.to_numpy(), bounds_error=False, fill_value=np.nan)
+    loss = interpolator(np.stack([np.abs(np.asarray(torque, dtype=np.float64)), np.asarray(rpm, dtype=np.float64)], axis=-1))
+    power = np.abs(np.asarray(torque, dtype=np.float64))*2*np.pi*np.asarray(rpm, dtype=np.float64)/60
+    energy = np.sum(np.where(np.isnan(loss), 0, power)*duration)
+    losses = np.nansum(loss*duration)
+    return {'energy': energy, 'losses': losses, 'efficiency': energy/(energy + losses) if energy + losses > 0 else np.nan, 'unreachable': int(np.isnan(loss).sum())}
+
+def read_cycle(path):
+    df = pd.read_csv(path, usecols=list(cycle_columns))
+    return {column: df[column].to_numpy(dtype=np.float64) for column in cycle_columns}
+
+if __name__ == "__main__":
+    sys.exit(0)
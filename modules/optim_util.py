@@ -0,0 +1,124 @@
+import sys, os
+import numpy as np
+import pandas as pd
+from scipy.stats import norm, qmc
+
+sys.path.insert(0, os.getcwd())
+import modules.surrogate_util as surrogate_util
+
+
+def candidate_metrics(data, keys, candidates, irms=None):
+    if irms is not None:
+        data = data[data['irms'] == irms]
+    ret = []
+    for candidate in candidates:
+        mask = np.ones(len(data), dtype=bool)
+        for key in keys:
+            mask &= np.isclose(data[key].to_numpy(dtype=float), candidate[key])
+        rows = data[mask]
+        if len(rows) == 0:
+            ret.append({'mean': np.nan, 'ripple': np.nan, 'magarea': np.nan})
+            continue
+        mean = rows['torque_airgap'].mean()
+        ret.append({
+            'mean': abs(mean),
+            'ripple': rows['torque_airgap'].std(ddof=0)/abs(mean) if mean != 0 else np.inf,
+            'magarea': rows['magarea'].max() if 'magarea' in rows else np.nan,
+        })
+    return ret
+
+class BayesianOptimizer:
+    def __init__(self, bounds, max_ripple=None, max_magarea=None, seed=0):
+        self.keys = list(bounds.keys())
+        self.lower = np.array([bounds[key][0] for key in self.keys], dtype=float)
+        self.upper = np.array([bounds[key][1] for key in self.keys], dtype=float)
+        self.max_ripple = max_ripple
+        self.max_magarea = max_magarea
+        self.sampler = qmc.Sobol(len(self.keys), seed=seed)
+        self.x = np.zeros((0, len(self.keys)))
+        self.y = np.zeros((0, 3))
+
+    def scale(self, unit):
+        return self.lower + unit*(self.upper - self.lower)
+
+    def unit(self, x):
+        return (x - self.lower)/np.where(self.upper > self.lower, self.upper - self.lower, 1)
+
+    def feasible(self, y):
+        ok = np.isfinite(y).all(axis=1)
+        if self.max_ripple is not None:
+            ok &= y[:, 1] <= self.max_ripple
+        if self.max_magarea is not None:
+            ok &= y[:, 2] <= self.max_magarea
+        return ok
+
+    def tell(self, x, y):
+        self.x = np.vstack([self.x, np.atleast_2d(x)])
+        self.y = np.vstack([self.y, np.atleast_2d(y)])
+
+    def acquisition(self, unit, x, y):
+        valid = np.isfinite(y).all(axis=1)
+        model = surrogate_util.GaussianProcess().fit(x[valid], y[valid])
+        mean, std = model.predict(unit, return_std=True)
+        std = np.maximum(std[:, None]*model.y_scale, 1e-12)
+        feasible = self.feasible(y)
+        best = y[feasible, 0].max() if feasible.any() else None
+        if best is None:
+            score = np.ones(len(unit))
+        else:
+            z = (mean[:, 0] - best)/std[:, 0]
+            score = (mean[:, 0] - best)*norm.cdf(z) + std[:, 0]*norm.pdf(z)
+        if self.max_ripple is not None:
+            score *= norm.cdf((self.max_ripple - mean[:, 1])/std[:, 1])
+        if self.max_magarea is not None:
+            score *= norm.cdf((self.max_magarea - mean[:, 2])/std[:, 2])
+        return score, mean
+
+    def ask(self, batch, samples=2048):
+        if len(self.x) == 0 or np.isfinite(self.y).all(axis=1).sum() < 2:
+            return self.scale(self.sampler.random(batch))
+        pool = self.sampler.random(samples)
+        x = self.unit(self.x)
+        y = self.y.copy()
+        ret = []
+        for _ in range(batch):
+            score, mean = self.acquisition(pool, x, y)
+            pick = int(np.argmax(score))
+            ret.append(pool[pick])
+            x = np.vstack([x, pool[pick]])
+            y = np.vstack([y, mean[pick]])
+            pool = np.delete(pool, pick, axis=0)
+        return self.scale(np.array(ret))
+
+    def best(self):
+        feasible = self.feasible(self.y)
+        if not feasible.any():
+            return None
+        index = np.flatnonzero(feasible)[np.argmax(self.y[feasible, 0])]
+        return dict(zip(self.keys, self.x[index]))
+
+def optimize(handler, simfunc, simpath, rotfunc, steps, bounds, sims, irms=None, max_ripple=None, max_magarea=None, batch=8, rounds=6, seed=0, **kwargs):
+    optimizer = BayesianOptimizer(bounds, max_ripple=max_ripple, max_magarea=max_magarea, seed=seed)
+    history = []
+    for level in range(rounds):
+        proposals = optimizer.ask(batch)
+        candidates = [dict(zip(optimizer.keys, [float(v) for v in proposal])) for proposal in proposals]
+        substeps = {key: value for key, value in steps.items() if key not in bounds}
+        substeps['candidate'] = tuple(candidates)
+        data = handler(simfunc, simpath, rotfunc, substeps, sims, **kwargs)
+        metrics = candidate_metrics(data, optimizer.keys, candidates, irms) if len(data) != 0 else [{'mean': np.nan, 'ripple': np.nan, 'magarea': np.nan} for _ in candidates]
+        optimizer.tell(proposals, [[m['mean'], m['ripple'], m['magarea']] for m in metrics])
+        for candidate, metric in zip(candidates, metrics):
+            row = {'round': level}
+            row.update(candidate)
+            row.update(metric)
+            row['feasible'] = bool(optimizer.feasible(np.array([[metric['mean'], metric['ripple'], metric['magarea']]]))[0])
+            history.append(row)
+        best = optimizer.best()
+        print(f"Optimization round {level}: {len(history)} geometries solved, best {best}.")
+    history = pd.DataFrame(history)
+    history['best'] = history['mean'].where(history['feasible']).cummax()
+    return history
+
+if __name__ == "__main__":
+    sys.exit(0)
@@ -2,6 +2,7 @@ import numpy as np
 from scipy.interpolate import RectBivariateSpline
 import locale
 import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
 from matplotlib.gridspec import GridSpec
 from matplotlib.colors import LinearSegmentedColormap
 from matplotlib.textpath import TextPath
@@ -28,7 +29,10 @@ plt.rcParams.update(plt_params)
 lwidth = 0.5
 
 texpath = os.path.join(os.pardir, os.pardir, "thesis", "ba-laurin-weitzel", "media")
-fmt = plt.FuncFormatter(lambda x, _: r'' + f'{{:.3g}}'.format(x).replace('.', ',') + '' if x < 100 else r'' + str(int(x)) + '')
+def format_tick(x, _):
+    return r'' + f'{{:.3g}}'.format(x).replace('.', ',') + '' if x < 100 else r'' + str(int(x)) + ''
+
+fmt = plt.FuncFormatter(format_tick)
 
 uk_red = (199/255, 16/255, 92/255, 1)
 uk_blue = (80/255, 149/255, 200/255, 1)
@@ -60,7 +64,6 @@ def set_size(width=0, pagewidth=False, fraction=1, subplots=(1, 1), ratio=0):
     return (fig_width_in, fig_height_in)
 
 def calculate_fontsize(text, min_size, max_width):
-    fig, ax = plt.subplots(figsize=(1, 1))
     font_properties = FontProperties()
     text_path = TextPath((0, 0), text, size=min_size, prop=font_properties)
 
@@ -71,8 +74,6 @@ def calculate_fontsize(text, min_size, max_width):
     if text_width > max_width:
         fontsize *= max_width / text_width
 
-    plt.close(fig) 
-
     return fontsize
 
 def create_heatmap_interp(data, xlabel="", ylabel="", zlabel="", clevels=10, precision=500, fraction=0.7):
@@ -86,7 +87,7 @@ def create_heatmap_interp(data, xlabel="", ylabel="", zlabel="", clevels=10, pre
     interp_func = RectBivariateSpline(y, x, values)  
     interpolated_data = interp_func(y_new, x_new)  
 
-    fig = plt.figure()
+    fig = Figure()
     ax = fig.subplots()
     heatmap = ax.imshow(interpolated_data, extent=(min(x), max(x), min(y), max(y)),  
             origin='lower', cmap=cm, aspect='auto')
@@ -115,7 +116,7 @@ def create_heatmap_interp(data, xlabel="", ylabel="", zlabel="", clevels=10, pre
 
 def twinPlot(data, axis=None, fraction=0.49, ratio=0, labelloc='upper left'):
     if axis is None:
-        fig = plt.figure()
+        fig = Figure()
         gs = GridSpec(
             1,
             1
@@ -159,7 +160,7 @@ def twinPlot(data, axis=None, fraction=0.49, ratio=0, labelloc='upper left'):
     for line in ax2.lines:
         line.set_zorder(2) 
 
-    legend = plt.legend(*(ax1.get_legend_handles_labels()), fontsize=plt.rcParams['legend.fontsize'], loc=labelloc)
+    legend = ax2.legend(*(ax1.get_legend_handles_labels()), fontsize=plt.rcParams['legend.fontsize'], loc=labelloc)
     legend.set_zorder(3)
     legend.get_frame().set_linewidth(lwidth)
     ax2.add_artist(legend)
@@ -186,7 +187,7 @@ def twinPlot(data, axis=None, fraction=0.49, ratio=0, labelloc='upper left'):
         return [ax1, ax2]
 
 def quadPlot(data):
-    fig = plt.figure(figsize=(8, 6))
+    fig = Figure(figsize=(8, 6))
     gs = GridSpec(
         2,
         1
@@ -247,7 +248,8 @@ def barPlot(data):
     
     barwidth = 1/(barnum+1)
 
-    fig, ax = plt.subplots(figsize=set_size(fraction=0.6, ratio=2))
+    fig = Figure(figsize=set_size(fraction=0.6, ratio=2))
+    ax = fig.subplots()
     ax.grid(axis='y', zorder=0, linewidth=lwidth*3/4)
     pos = np.arange(len(x))
     i = 1
@@ -281,7 +283,6 @@ def barPlot(data):
         if not os.path.exists(respath):
             os.makedirs(respath)
         fig.savefig(os.path.join(respath, data['name'] + '.pdf'))
-        plt.close(fig)
 
     return fig, ax
 
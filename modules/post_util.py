@@ -0,0 +1,93 @@
+import sys, os
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.getcwd())
+from modules.fem_util import constrain
+
+# Sweep metrics are computed in one pass over NumPy arrays instead of one groupby or pivot per metric.
+# Rows are grouped once by their geometry keys, every metric is a segmented reduction over the sorted groups.
+reductions = ('max', 'first', 'mean', 'ripple')
+ratio_limit = 10
+
+
+def key_array(df, keys):
+    return np.column_stack([df[key].to_numpy(dtype=np.float64) for key in keys]).reshape(len(df), len(keys))
+
+def group(*arrays):
+    values = np.concatenate(arrays)
+    levels, codes = zip(*[np.unique(column, return_inverse=True) for column in values.T])
+    shape = tuple(max(len(level), 1) for level in levels)
+    code, inverse = np.unique(np.ravel_multi_index([c.ravel() for c in codes], shape), return_inverse=True)
+    unique = np.column_stack([level[index] for level, index in zip(levels, np.unravel_index(code, shape))]).reshape(len(code), len(levels))
+    return unique, np.split(inverse.ravel(), np.cumsum([len(array) for array in arrays])[:-1])
+
+def segment(values, inverse, size, how):
+    if how not in reductions:
+        raise KeyError(f"Unknown reduction {how}.")
+    ret = np.full(size, np.nan)
+    known = ~np.isnan(values)
+    values, inverse = values[known], inverse[known]
+    if len(values) == 0:
+        return ret
+    order = np.argsort(inverse, kind='stable')
+    values, inverse = values[order], inverse[order]
+    starts = np.flatnonzero(np.r_[True, inverse[1:] != inverse[:-1]])
+    index = inverse[starts]
+    if how == 'max':
+        ret[index] = np.maximum.reduceat(values, starts)
+    elif how == 'first':
+        ret[index] = values[starts]
+    else:
+        count = np.diff(np.r_[starts, len(values)])
+        mean = np.add.reduceat(values, starts)/count
+        if how == 'mean':
+            ret[index] = mean
+        else:
+            ret[index] = np.sqrt(np.add.reduceat((values - np.repeat(mean, count))**2, starts)/count)
+    return ret
+
+def ratio(a, b, limit=ratio_limit):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ret = np.asarray(a, dtype=np.float64)/np.asarray(b, dtype=np.float64)
+    return constrain(np.nan_to_num(ret, nan=0, posinf=limit, neginf=0), 0, limit)
+
+def make_index(unique, keys):
+    if len(keys) == 1:
+        return pd.Index(unique[:, 0], name=keys[0])
+    return pd.MultiIndex.from_arrays(list(unique.T), names=keys)
+
+def torque_metrics(stand, movin, irms, keys):
+    keys = list(keys)
+    if 'irms' in movin.columns:
+        movin = movin[movin['irms'].to_numpy() == irms]
+    unique, (inverse1, inverse2) = group(key_array(stand, keys), key_array(movin, keys))
+    size = len(unique)
+    current = stand['irms'].to_numpy()
+    torque1 = stand['torque_airgap'].to_numpy(dtype=np.float64)
+    torque2 = movin['torque_airgap'].to_numpy(dtype=np.float64)
+    on = current == irms
+    off = current == 0
+    ret = pd.DataFrame({
+        'max': segment(torque1[on], inverse1[on], size, 'max'),
+        'max_rel': segment(torque1[off], inverse1[off], size, 'max'),
+        'mean': segment(torque2, inverse2, size, 'mean'),
+        'ripple': segment(torque2, inverse2, size, 'ripple'),
+    }, index=make_index(unique, keys))
+    ret['ratio'] = ratio(ret['max'].to_numpy(), ret['max_rel'].to_numpy())
+    return ret
+
+def table(metrics, column):
+    rows, row_index = np.unique(metrics.index.get_level_values(0).to_numpy(), return_inverse=True)
+    columns, column_index = np.unique(metrics.index.get_level_values(1).to_numpy(), return_inverse=True)
+    ret = np.full((len(rows), len(columns)), np.nan)
+    ret[row_index, column_index] = metrics[column].to_numpy()
+    return pd.DataFrame(ret, index=pd.Index(rows, name=metrics.index.names[0]), columns=pd.Index(columns, name=metrics.index.names[1]))
+
+def position_table(df, index, columns, value='torque_airgap', how='first'):
+    unique, (inverse,) = group(key_array(df, [index, columns]))
+    metrics = pd.DataFrame({value: segment(df[value].to_numpy(dtype=np.float64), inverse, len(unique), how)}, index=make_index(unique, [index, columns]))
+    return table(metrics, value)
+
+if __name__ == "__main__":
+    sys.exit(0)
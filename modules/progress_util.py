@@ -0,0 +1,66 @@
+import sys, os
+import time
+import threading
+
+sys.path.insert(0, os.getcwd())
+
+_local = threading.local()
+
+
+class SimulationCancelled(Exception):
+    pass
+
+class ResultsMissing(Exception):
+    pass
+
+class RunControl:
+    def __init__(self, callback=None, executor=None, priority=0, solve=True):
+        self.callback = callback
+        self.executor = executor
+        self.priority = priority
+        self.solve = solve
+        self.event = threading.Event()
+        self.stage = ''
+        self.total = 0
+        self.done = 0
+        self.started = time.time()
+
+    def cancel(self):
+        self.event.set()
+
+    def cancelled(self):
+        return self.event.is_set()
+
+    def check(self):
+        if self.cancelled():
+            raise SimulationCancelled(f"Simulation {self.stage} was cancelled.")
+
+    def start(self, stage, total):
+        self.stage = stage
+        self.total = total
+        self.done = 0
+        self.started = time.time()
+        self.report()
+
+    def advance(self, count):
+        self.done += count
+        self.report()
+
+    def state(self):
+        elapsed = time.time() - self.started
+        rate = 60*self.done/elapsed if elapsed > 0 else 0
+        eta = 60*(self.total - self.done)/rate if rate > 0 else None
+        return {'stage': self.stage, 'done': self.done, 'total': self.total, 'rate': rate, 'eta': eta, 'elapsed': elapsed}
+
+    def report(self):
+        if self.callback is not None:
+            self.callback(self.state())
+
+def bind(control):
+    _local.control = control
+
+def current():
+    return getattr(_local, 'control', None)
+
+if __name__ == "__main__":
+    sys.exit(0)
@@ -0,0 +1,234 @@
+import sys, os
+import json
+import zlib
+import base64
+import shutil
+import zipfile
+import warnings
+import threading
+
+sys.path.insert(0, os.getcwd())
+
+# A .pmsm project is a zip archive with one entry per project file and a manifest of live entries.
+# Saves append changed entries and a new manifest, the newest entry of a name wins.
+# Files below the lazy folders are only extracted when they are asked for.
+manifest_name = 'manifest.json'
+archive_format = 1
+stored_extensions = ('.parquet', '.png', '.zip', '.gz')
+lazy_folders = ('sims',)
+compact_ratio = 0.5
+
+
+class DebouncedWriter:
+    def __init__(self, func, delay=0.5):
+        self.func = func
+        self.delay = delay
+        self.timer = None
+        self.pending = False
+        self.lock = threading.Lock()
+        self.write_lock = threading.Lock()
+
+    def schedule(self):
+        with self.lock:
+            self.pending = True
+            if self.timer is not None:
+                self.timer.cancel()
+            self.timer = threading.Timer(self.delay, self.flush)
+            self.timer.daemon = True
+            self.timer.start()
+
+    def flush(self):
+        with self.write_lock:
+            with self.lock:
+                if self.timer is not None:
+                    self.timer.cancel()
+                    self.timer = None
+                if not self.pending:
+                    return
+                self.pending = False
+            try:
+                self.func()
+            except Exception:
+                with self.lock:
+                    self.pending = True
+                raise
+
+def write_atomic(path, text):
+    tmp_file = path + '.tmp'
+    with open(tmp_file, 'w', encoding='utf-8') as file:
+        file.write(text)
+    os.replace(tmp_file, path)
+
+def is_legacy(path):
+    return not zipfile.is_zipfile(path)
+
+def archive_name(path):
+    return path.replace('\\', '/').replace(os.sep, '/').strip('/')
+
+def compression(name):
+    return zipfile.ZIP_STORED if name.endswith(stored_extensions) else zipfile.ZIP_DEFLATED
+
+def entries(archive):
+    if manifest_name in archive.NameToInfo:
+        return json.loads(archive.read(manifest_name).decode('utf-8'))['entries']
+    return sorted(set(info.filename for info in archive.infolist() if info.filename != manifest_name and not info.is_dir()))
+
+class PMSMFileHandler:
+    def __init__(self, folder_path):
+        self.folder_path = folder_path
+        self.source = None
+        self.pending = set()
+        self.state = {}
+        self.lock = threading.Lock()
+
+    def _path(self, name):
+        return os.path.join(self.folder_path, *name.split('/'))
+
+    def _stat(self, path):
+        stat = os.stat(path)
+        return (stat.st_size, stat.st_mtime_ns)
+
+    def _walk(self):
+        ret = {}
+        for foldername, _, filenames in os.walk(self.folder_path):
+            for filename in filenames:
+                if filename.endswith('.tmp'):
+                    continue
+                path = os.path.join(foldername, filename)
+                ret[archive_name(os.path.relpath(path, self.folder_path))] = path
+        return ret
+
+    def _extract(self, archive, name):
+        path = self._path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with archive.open(name) as source, open(path, 'wb') as target:
+            shutil.copyfileobj(source, target)
+        self.state[name] = self._stat(path)
+        self.pending.discard(name)
+
+    def unpack(self, input_file, lazy=True):
+        with self.lock:
+            self._unpack(input_file, lazy)
+
+    def _unpack(self, input_file, lazy):
+        self.pending = set()
+        self.state = {}
+        if is_legacy(input_file):
+            self.source = None
+            self._unpack_legacy(input_file)
+            return
+        self.source = input_file
+        with zipfile.ZipFile(input_file) as archive:
+            for name in entries(archive):
+                if lazy and name.split('/')[0] in lazy_folders:
+                    self.pending.add(name)
+                else:
+                    self._extract(archive, name)
+
+    def _unpack_legacy(self, input_file):
+        with open(input_file, 'rb') as file:
+            data = json.loads(zlib.decompress(file.read()).decode('utf-8'))
+        for rel_folder_path, folder_data in data.items():
+            folder = archive_name(rel_folder_path)
+            for filename, content in folder_data.items():
+                path = self._path(filename if folder in ('', '.') else folder + '/' + filename)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                if isinstance(content, dict):
+                    with open(path, 'wb') as file:
+                        file.write(base64.b64decode(content['base64']))
+                else:
+                    with open(path, 'w', encoding='utf-8') as file:
+                        file.write(content)
+
+    def extract(self, prefix=''):
+        with self.lock:
+            return self._extract_pending(prefix)
+
+    def _extract_pending(self, prefix):
+        prefix = archive_name(prefix)
+        names = sorted(name for name in self.pending if name == prefix or name.startswith(prefix + '/') or prefix == '')
+        if len(names) == 0:
+            return 0
+        with zipfile.ZipFile(self.source) as archive:
+            for name in names:
+                self._extract(archive, name)
+        return len(names)
+
+    def pack(self, output_file):
+        with self.lock:
+            self._pack(output_file)
+
+    def _pack(self, output_file):
+        files = self._walk()
+        live = sorted(set(files) | self.pending)
+        if self.source is None or not os.path.exists(output_file) or not os.path.samefile(output_file, self.source):
+            self._rewrite(output_file, files, live)
+            return
+        live = [name for name in live if name in self.pending or os.path.exists(files[name])]
+        changed = [name for name in live if name in files and self.state.get(name) != self._stat(files[name])]
+        with zipfile.ZipFile(output_file) as archive:
+            if len(changed) == 0 and entries(archive) == live:
+                return
+            total = sum(info.compress_size for info in archive.infolist())
+            kept = sum(archive.getinfo(name).compress_size for name in live if name in archive.NameToInfo and name not in changed)
+        if total != 0 and (total - kept)/total > compact_ratio:
+            self._rewrite(output_file, files, live)
+            return
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', UserWarning)
+            with zipfile.ZipFile(output_file, 'a', strict_timestamps=False) as archive:
+                for name in changed:
+                    self._write(archive, files[name], name, live)
+                archive.writestr(manifest_name, json.dumps({'format': archive_format, 'entries': live}), compress_type=zipfile.ZIP_DEFLATED)
+
+    def snapshot(self, output_file, exclude=lazy_folders):
+        with self.lock:
+            self._snapshot(output_file, exclude)
+
+    def _snapshot(self, output_file, exclude):
+        # Recovery copy of the working files, the source archive and the save state are left alone.
+        # Simulation folders and journals may still be written by running workers and are skipped.
+        files = self._walk()
+        live = [name for name in sorted(files) if name.split('/')[0] not in exclude and not name.endswith('.part')]
+        os.makedirs(os.path.dirname(os.path.abspath(output_file)), exist_ok=True)
+        tmp_file = output_file + '.tmp'
+        with zipfile.ZipFile(tmp_file, 'w', strict_timestamps=False) as archive:
+            for name in list(live):
+                try:
+                    archive.write(files[name], name, compress_type=compression(name))
+                except FileNotFoundError:
+                    live.remove(name)
+            archive.writestr(manifest_name, json.dumps({'format': archive_format, 'entries': live}), compress_type=zipfile.ZIP_DEFLATED)
+        os.replace(tmp_file, output_file)
+
+    def _write(self, archive, path, name, live):
+        try:
+            stat = self._stat(path)
+            archive.write(path, name, compress_type=compression(name))
+            self.state[name] = stat
+        except FileNotFoundError:
+            live.remove(name)
+            self.state.pop(name, None)
+
+    def _rewrite(self, output_file, files, live):
+        tmp_file = output_file + '.tmp'
+        source = zipfile.ZipFile(self.source) if self.source is not None and len(self.pending) != 0 else None
+        try:
+            with zipfile.ZipFile(tmp_file, 'w', strict_timestamps=False) as archive:
+                for name in list(live):
+                    if name in files:
+                        self._write(archive, files[name], name, live)
+                    else:
+                        info = zipfile.ZipInfo(name, date_time=source.getinfo(name).date_time)
+                        info.compress_type = compression(name)
+                        with source.open(name) as entry, archive.open(info, 'w', force_zip64=True) as target:
+                            shutil.copyfileobj(entry, target)
+                archive.writestr(manifest_name, json.dumps({'format': archive_format, 'entries': live}), compress_type=zipfile.ZIP_DEFLATED)
+        finally:
+            if source is not None:
+                source.close()
+        os.replace(tmp_file, output_file)
+        self.source = output_file
+
+if __name__ == "__main__":
+    sys.exit(0)
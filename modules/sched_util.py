@@ -0,0 +1,47 @@
+import sys, os
+import numpy as np
+
+sys.path.insert(0, os.getcwd())
+
+# Relative cost of one task in units of one solve, every point is meshed and solved on its own.
+task_overhead = 2.0
+point_weight = 1.0
+parallel_keys = ('points', 'keys', 'inputs', 'slots')
+
+
+def point_cost(points):
+    return point_weight*len(points)
+
+def task_cost(job, mesh_factor=1.0):
+    return (task_overhead + point_cost(job['points']))*mesh_factor
+
+def mesh_factor(path, reference):
+    try:
+        return max(os.path.getsize(path)/os.path.getsize(reference), 0.1)
+    except (OSError, TypeError, ZeroDivisionError):
+        return 1.0
+
+def split_job(job, parts):
+    parts = max(1, min(parts, len(job['points'])))
+    ret = []
+    for indices in np.array_split(np.arange(len(job['points'])), parts):
+        part = dict(job)
+        for key in parallel_keys:
+            if key in job:
+                part[key] = [job[key][i] for i in indices]
+        ret.append(part)
+    return ret
+
+def split_jobs(jobs, workers, oversubscribe=2):
+    if len(jobs) == 0:
+        return jobs
+    costs = [task_cost(job) for job in jobs]
+    target = max(sum(costs)/(max(1, workers)*oversubscribe), task_overhead + 2*point_weight)
+    ret = []
+    for job, cost in zip(jobs, costs):
+        parts = int(np.ceil(cost/target))
+        ret += split_job(job, parts) if parts > 1 else [job]
+    return ret
+
+if __name__ == "__main__":
+    sys.exit(0)
@@ -2,18 +2,39 @@ from __future__ import print_function
 import sys, os, shutil
 import numpy as np
 import time
-from itertools import product
+from itertools import product, islice
 from concurrent import futures
-from femm import *
+from contextlib import nullcontext
 import pandas as pd
 import shutil
-import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
 
 sys.path.insert(0, os.getcwd())
 import modules.plt_util as plt_util
+import modules.cache_util as cache_util
+import modules.adaptive_util as adaptive_util
+import modules.optim_util as optim_util
+import modules.supervisor_util as supervisor_util
+import modules.sched_util as sched_util
+import modules.spec_util as spec_util
+import modules.progress_util as progress_util
+import modules.store_util as store_util
+import modules.post_util as post_util
+import modules.spectral_util as spectral_util
+import modules.symmetry_util as symmetry_util
+import modules.fluxmap_util as fluxmap_util
+import modules.loss_util as loss_util
 from modules.fem_util import *
 
 params = {}
+default_executor = None
+max_harmonic = 13
+envelope_speeds = 61
+envelope_speed_factor = 3
+# Rotor position grids (start, end, steps) of the default specs. The aligned grids are opt-in with 'symmetry_grid',
+# their positions coincide under the pole pitch and cogging symmetries of the 12-slot/8-pole machine.
+default_grids = {'sweep_1d': (0, 90, 46), 'sweep_2d': (22.5, 67.5, 11), 'point': (0, 90, 90*3)}
+aligned_grids = {'sweep_1d': (0, 90, 49), 'sweep_2d': (22.5, 67.5, 13), 'point': (0, 90, 90*3 + 1)}
 
 
 def convert_seconds_to_formatted_string(seconds):
@@ -45,26 +66,55 @@ def convert_seconds_to_formatted_string(seconds):
     
     return formatted_string
 
+def timing_report(timings):
+    ret = f"Solved {len(timings)} points in {sum(timings):.1f} s of solver time"
+    if len(timings) != 0:
+        ret += f", {np.mean(timings):.3f} s/point"
+    return ret + "."
+
 def process_combo(func, combo):
     return func(*combo)
 
-def simulate_general(params, func, filename, sims):
+def create_template(params, func, filename, sims):
+    try:
+        openfemm(1)
+        shutil.copyfile(params['stator_path'], filename)
+        opendocument(filename)
+        params = dict(params)
+        params.update(sims[0]) if len(sims) != 0 else 0
+        inputs = dict(params)
+        created = func(params)
+        retpars = cache_util.split_outputs(inputs, params)
+        retpars.update(created)
+        mi_saveas(filename)
+        closefemm()
+        return {'path': filename, 'retpars': retpars}
+    except Exception:
+        try:
+            closefemm()
+        except Exception:
+            pass
+        raise
+
+def simulate_general(params, func, filename, sims, template=None):
+    # Every point starts from the same base parameters, its inputs never depend on the solve order.
     try:
         simcombs = sims
 
-        redict = params
-        retarray = []
         openfemm(1)
     
-        if not os.path.exists(filename):
-            shutil.copyfile(params['stator_path'], filename)
+        # A retry reuses the task file, it is copied again so a rotor drawn by the failed attempt is not drawn twice.
+        shutil.copyfile(template['path'] if template is not None else params['stator_path'], filename)
         
         opendocument(filename)
-        params.update(simcombs[0]) if len(simcombs) != 0 else 0
-        retpars = func(params)
-        redict.update(retpars)
+        base = dict(params)
+        retpars = func(dict(base, **simcombs[0]) if len(simcombs) != 0 else dict(base)) if template is None else template['retpars']
+        base.update(retpars)
 
+        retarray = []
         for simpar in simcombs:
+            time_point = time.time()
+            redict = dict(base)
             redict.update(simpar)
             mi_modifycircprop('A', 1, redict["irms"]*np.cos(np.deg2rad(redict["degel"])))
             mi_modifycircprop('B', 1, redict["irms"]*np.cos(np.deg2rad(redict["degel"]) + 2/3*np.pi))
@@ -88,26 +138,71 @@ def simulate_general(params, func, filename, sims):
             flux_a = circ_a[2]
             flux_b = circ_b[2]
             flux_c = circ_c[2]
+            if redict.get('loss_probes', False):
+                b_tooth, b_yoke = [max(np.hypot(*mo_getb(x, y)) for x, y in points) for points in loss_util.probes(redict)]
+                mo_clearblock()
+                mo_groupselectblock(loss_util.stator_group)
+                redict.update({"b_tooth":b_tooth, "b_yoke":b_yoke, "stator_area":mo_blockintegral(5)})
             mo_close()
 
-            redict.update({"magarea":magarea, "torque_airgap":torque_airgap, "flux_a":flux_a, "flux_b":flux_b, "flux_c":flux_c})
-            retarray.append(dict(redict))
+            redict.update({"magarea":magarea, "torque_airgap":torque_airgap, "flux_a":flux_a, "flux_b":flux_b, "flux_c":flux_c, "solve_time":time.time()-time_point})
+            retarray.append(redict)
 
         closefemm()
         
         return retarray
-    except Exception as e:
+    except Exception:
         try:
             closefemm()
         except Exception:
             pass
-        print(e)
-        return None
-
-def multiSimHandler(simfunc, simpath, rotfunc, steps, sims, rettype='df'):
-    with futures.ProcessPoolExecutor(12) as executor:
+        raise
+
+def jitterable(key, value):
+    return isinstance(value, (float, np.floating)) and key in cache_util.geometry_keys
+
+def jitter_args(args, attempt, rng, scale=1e-3):
+    combo = dict(args[0])
+    for key, value in combo.items():
+        if jitterable(key, value):
+            combo[key] = value + attempt*scale*(abs(value) if value != 0 else 1)*rng.uniform(-1, 1)
+    return [combo] + list(args[1:4])
+
+def submit_job(executor, simfunc, rotfunc, simpath, job, template, point_timeout, priority):
+    args = [job['combo'], rotfunc, os.path.join(simpath, str(np.random.randint(1, 0xfffffff)) + ".FEM"), job['points']]
+    if template is not None:
+        args.append(template)
+    factor = sched_util.mesh_factor(template['path'], job['combo'].get('stator_path')) if template is not None else 1.0
+    return executor.submit(simfunc, *args, timeout=point_timeout*(1 + len(job['points'])), perturb=jitter_args, tag=f"geometry {args[2]}", priority=(priority, sched_util.task_cost(job, factor)))
+
+def multiSimHandler(simfunc, simpath, rotfunc, steps, sims, rettype='df', cache=None, backend=None, surrogate=None, max_std=0.05, journal=None, point_timeout=300, retries=2, max_workers=None, worker_memory_mb=None, executor=None, shard=None, need_flux=True, symmetry=None, templates=None):
+    if backend is not None:
+        set_backend(backend)
+    if rettype != 'df':
+        cache = False
+    elif cache is None:
+        cache = cache_util.ResultCache()
+    # Templates outlive simpath, which is cleared on every call, so the stand and movin runs of a sweep draw each geometry once.
+    if templates is None:
+        templates = cache_util.TemplateStore() if cache else False
+    if max_workers is None:
+        max_workers = steps.get('max_workers', 0)
+    if worker_memory_mb is None:
+        worker_memory_mb = steps.get('worker_memory_mb', supervisor_util.default_worker_memory_mb)
+    if symmetry is None:
+        symmetry = steps.get('symmetry', True)
+    control = progress_util.current()
+    if executor is None and control is not None:
+        executor = control.executor
+    if executor is None:
+        executor = default_executor
+    priority = control.priority if control is not None else 0
+    shared = executor is not None
+    if not shared:
+        supervisor_util.set_budget(max_workers, worker_memory_mb)
+    with (nullcontext(executor) if shared else supervisor_util.SupervisedExecutor(supervisor_util.pool_size(max_workers, worker_memory_mb), retries=retries)) as executor:
         print("---------------------------------------------")
-        print(f"Starting Simulation {simpath}.")
+        print(f"Starting Simulation {simpath} on {executor.max_workers} workers" + (" (shared executor)." if shared else f" (budget {supervisor_util.budget.total})."))
         time_start = time.time()
 
         if not os.path.exists(simpath):
@@ -116,139 +211,300 @@ def multiSimHandler(simfunc, simpath, rotfunc, steps, sims, rettype='df'):
             shutil.rmtree(simpath)
             os.makedirs(simpath)
 
-        combos = createCombos(steps)
+        combos = createCombos(steps, *(shard if shard is not None else ()))
+        points = createCombos(sims)
+        print(f"{len(combos)} geometries" + (f" (shard {shard[0] + 1}/{shard[1]} of {countCombos(steps)})" if shard is not None else "") + f" with {len(points)} operating points each.")
 
-        tasks = [executor.submit(process_combo, simfunc, [combo, rotfunc, os.path.join(simpath, str(np.random.randint(1, 0xfffffff)) + ".FEM"), createCombos(sims)]) for combo in combos]
-        if rettype == 'df':
-            results = []
+        known = None
+        if journal is not None and rettype == 'df':
+            journal = cache_util.Journal(journal) if isinstance(journal, str) else journal
+            keys = cache_util.slot_keys(rotfunc, combos, points)
+            known = [journal.get(key) for key in keys]
+            print(f"Journal {journal.path}: resuming {sum(row is not None for row in known)}/{len(known)} points.")
+        else:
+            journal = None
+        if surrogate is not None and rettype == 'df':
+            answered = surrogate.answer(rotfunc, combos, points, max_std)
+            known = answered if known is None else [row if row is not None else guess for row, guess in zip(known, answered)]
+            print(f"Surrogate answered {sum(row is not None for row in answered)}/{len(answered)} points within std {max_std}.")
+
+        if cache:
+            results, jobs, pending = cache.lookup(rotfunc, combos, points, known)
+        elif rettype == 'df':
+            results = known if known is not None else [None for _ in range(len(combos)*len(points))]
+            jobs = []
+            for c, combo in enumerate(combos):
+                slots = [c*len(points) + p for p in range(len(points)) if results[c*len(points) + p] is None]
+                if len(slots) != 0:
+                    jobs.append({'combo': combo, 'points': [points[slot - c*len(points)] for slot in slots], 'slots': slots})
         else:
+            jobs = [{'combo': combo, 'points': points} for combo in combos]
             results = [{} for _ in range(len(combos))]
+
+        mirrored = []
+        if symmetry and rettype == 'df':
+            reduced = []
+            for job in jobs:
+                part, pairs = symmetry_util.plan(job, need_flux)
+                for i, source, sign in pairs:
+                    if cache:
+                        mirrored.append({'source': pending[job['keys'][source]][0][0], 'key': job['keys'][i], 'inputs': job['inputs'][i], 'point': job['points'][i], 'sign': sign})
+                    else:
+                        mirrored.append({'source': job['slots'][source], 'slot': job['slots'][i], 'key': keys[job['slots'][i]] if journal is not None else None, 'point': job['points'][i], 'sign': sign})
+                reduced.append(part)
+            jobs = reduced
+            if len(mirrored) != 0:
+                print(f"Symmetry: copying {len(mirrored)} points from equivalent rotor positions.")
+
+        if control is not None and not control.solve and len(jobs) != 0:
+            if journal is not None:
+                journal.close()
+            raise progress_util.ResultsMissing(f"{sum(len(job['points']) for job in jobs)} points of {simpath} are not stored.")
+
+        if rettype == 'df':
+            jobs = sched_util.split_jobs(jobs, executor.max_workers)
+
+        groups = {}
+        for job in jobs:
+            first = dict(job['combo'])
+            first.update(job['points'][0]) if len(job['points']) != 0 else 0
+            groups.setdefault(cache_util.geometry_key(rotfunc, first), []).append(job)
+
+        tasks = {}
+        stored = 0
+        for gkey, group in sorted(groups.items(), key=lambda item: -sum(sched_util.task_cost(job) for job in item[1])):
+            template = templates.get(gkey) if templates else None
+            if template is not None:
+                stored += 1
+                for job in group:
+                    tasks[submit_job(executor, simfunc, rotfunc, simpath, job, template, point_timeout, priority)] = ('job', job)
+            elif templates or len(group) > 1:
+                tasks[executor.submit(create_template, group[0]['combo'], rotfunc, os.path.join(simpath, "template_" + gkey[:16] + ".FEM"), group[0]['points'], timeout=point_timeout, tag=f"template {gkey[:16]}", priority=(priority, sum(sched_util.task_cost(job) for job in group)))] = ('template', (gkey, group))
+            else:
+                tasks[submit_job(executor, simfunc, rotfunc, simpath, group[0], None, point_timeout, priority)] = ('job', group[0])
+        print(f"Drawing {sum(kind == 'template' for kind, _ in tasks.values())} geometry templates, reusing {stored} stored templates for {len(jobs)} tasks.")
+
         index = 0
-        max_index = len(combos)
-        for future in futures.as_completed(tasks):
-            res = future.result()
-            index += 1
-            if res is not None:
-                if rettype == 'df':
-                    [results.append(redict) for redict in res]
+        max_index = len(jobs)
+        timings = []
+        jittered = set()
+        if control is not None:
+            control.start(simpath, sum(len(job['points']) for job in jobs))
+        while len(tasks) != 0:
+            done, _ = futures.wait(tasks, timeout=0.5 if control is not None else None, return_when=futures.FIRST_COMPLETED)
+            if control is not None and control.cancelled():
+                executor.cancel(set(tasks))
+                if journal is not None:
+                    journal.close()
+                print(f"Cancelled Simulation {simpath} after {index}/{max_index} steps.")
+                control.check()
+            for future in done:
+                kind, item = tasks.pop(future)
+                error = future.exception()
+                res = future.result() if error is None else None
+                if kind == 'template':
+                    gkey, group = item
+                    if res is not None and templates:
+                        res = templates.put(gkey, res)
+                    for job in group:
+                        tasks[submit_job(executor, simfunc, rotfunc, simpath, job, res, point_timeout, priority)] = ('job', job)
+                    continue
+                index += 1
+                if res is not None:
+                    # A retry may have solved a jittered geometry, its rows keep the requested labels but are neither cached nor journaled.
+                    perturbed = future.attempts > 1 and any(redict.get(key) != value for redict in res for key, value in item['combo'].items() if jitterable(key, value))
+                    if perturbed:
+                        for redict in res:
+                            redict.update({key: value for key, value in item['combo'].items() if jitterable(key, value)})
+                        if cache:
+                            jittered.update(slot for key in item['keys'] for slot, _ in pending.get(key, []))
+                        else:
+                            jittered.update(item.get('slots', []))
+                        print(f"Step {index}/{max_index} was solved on a jittered geometry after {future.attempts} attempts, its results are not stored.")
+                    timings.extend(redict.get('solve_time', 0) for redict in res)
+                    if journal is not None and not perturbed:
+                        for key, redict in zip(item['keys'] if cache else [keys[slot] for slot in item['slots']], res):
+                            journal.append(key, redict)
+                    if cache:
+                        cache.store(item, res, results, pending, persist=not perturbed)
+                    elif rettype == 'df':
+                        for slot, redict in zip(item['slots'], res):
+                            results[slot] = redict
+                    else:
+                        results[res[0]['kk']-1].update(res[0])
+                    print(f"Ran step {index}/{max_index} ({100*index/max_index:.2f}%). Time remaining: {convert_seconds_to_formatted_string((time.time()-time_start)*(max_index-index)/(index if index > 0 else 1))}")
                 else:
-                    results[res[0]['kk']-1].update(res[0])
-                print(f"Ran step {index}/{max_index} ({100*index/max_index:.2f}%). Time remaining: {convert_seconds_to_formatted_string((time.time()-time_start)*(max_index-index)/(index if index > 0 else 1))}")
+                    print(f"Dropped step {index}/{max_index}: {error}")
+                if control is not None:
+                    control.advance(len(item['points']))
+
+        for item in mirrored:
+            if results[item['source']] is None:
+                continue
+            redict = symmetry_util.mirror(results[item['source']], item['point'], item['sign'])
+            stored = item['source'] not in jittered
+            if journal is not None and stored:
+                journal.append(item['key'], redict)
+            if cache:
+                cache.store({'keys': [item['key']], 'inputs': [item['inputs']]}, [redict], results, pending, persist=stored and item['sign'] is not None)
             else:
-                print(f"Dropped step {index}/{max_index}.")
+                results[item['slot']] = redict
 
         if rettype == 'df':
-            ret = pd.DataFrame(results)
+            ret = pd.DataFrame([redict for redict in results if redict is not None])
         else:
             ret = results
 
+        if journal is not None:
+            journal.close()
+
         time_end = time.time()
         print(f"Finished Simulation {simpath}.")
+        if cache:
+            print(cache.report())
+        print(timing_report(timings))
+        print(executor.report())
         print(f'Total time ellapsed: {convert_seconds_to_formatted_string(time_end-time_start)}')
 
     return ret
-def createCombos(parameters):
-    def recurse(item):
-        if isinstance(item, list) and len(item) == 3 and all(isinstance(element, (int, float)) for element in item):
-            return np.linspace(*item)
-        elif isinstance(item, tuple):
-            return list(item)
-        elif isinstance(item, list):
-            res = []
-            for sublist in item:
-                [res.append(val) for val in recurse(sublist)]
-            return res
-        elif isinstance(item, dict):
-            if "parameters" not in item or "func" not in item:
-                return [item]
-            if "mode" not in item:
-                mode = 'select'
-            else:
-                mode = item["mode"]
-            res = []
-            combs = createCombos(item["parameters"])
-            if mode == "select":
-                [res.append(x) for x in combs if item["func"](x)]
-            elif mode == "create":
-                [res.append(item["func"](x)) for x in combs if item['func'](x) != None]
-            else:
-                raise KeyError("Wrong function mode selected.")
-            return res
-        else:
+def expandParameter(item):
+    if isinstance(item, list) and len(item) == 3 and all(isinstance(element, (int, float)) for element in item):
+        return list(np.linspace(*item))
+    elif isinstance(item, tuple):
+        return list(item)
+    elif isinstance(item, list):
+        res = []
+        for sublist in item:
+            res.extend(expandParameter(sublist))
+        return res
+    elif isinstance(item, dict):
+        if "values" in item and len(item) == 1:
+            return [value for sublist in item["values"] for value in (expandParameter(sublist) if isinstance(sublist, (list, tuple)) else [sublist])]
+        if "parameters" in item and "expr" in item:
+            return spec_util.evaluate_entry(item, list(iterCombos(item["parameters"])))
+        if "parameters" not in item or "func" not in item:
             return [item]
-        
-    def flatten_dict(dick):
-        if isinstance(dick, list):
-            return [flatten_dict(dig) for dig in dick]
-        result = {}
-        for key, value in dick.items():
-            if isinstance(value, dict):
-                nested_result = flatten_dict(value)
-                result.update(nested_result)
-            else:
-                result[key] = value
-        return result
+        mode = item.get("mode", 'select')
+        if mode not in ("select", "create"):
+            raise KeyError("Wrong function mode selected.")
+        res = []
+        for x in iterCombos(item["parameters"]):
+            value = item["func"](x)
+            if mode == "select" and value:
+                res.append(x)
+            elif mode == "create" and value is not None:
+                res.append(value)
+        return res
+    else:
+        return [item]
+
+def flattenCombo(dick):
+    result = {}
+    for key, value in dick.items():
+        if isinstance(value, dict):
+            result.update(flattenCombo(value))
+        else:
+            result[key] = value
+    return result
+
+def expandCombos(parameters):
+    return [[flattenCombo(value) if isinstance(value, dict) else {key: value} for value in expandParameter(param_range)] for key, param_range in parameters.items()]
+
+def countCombos(parameters, parts=None):
+    parts = expandCombos(parameters) if parts is None else parts
+    return int(np.prod([len(part) for part in parts], dtype=object))
+
+def iterCombos(parameters, start=0, stop=None, shard=0, shards=1, parts=None):
+    parts = expandCombos(parameters) if parts is None else parts
+    for combination in islice(product(*parts), start + (shard - start) % shards, stop, shards):
+        combo = {}
+        for part in combination:
+            combo.update(part)
+        yield combo
+
+def createCombos(parameters, shard=0, shards=1):
+    return list(iterCombos(parameters, shard=shard, shards=shards))
+
+def position_spec(start, end, steps, offset=0):
+    return {
+        'parameters': {'deg':[start, end, steps]},
+        'expr': {'degel':'p*deg', 'degmech':'deg + offset'},
+        'constants': {'p':{'expr':'rotor_poles/2'}, 'offset':offset},
+        'mode':'create'
+    }
+
+def default_sims(kind, aligned=False):
+    if kind not in default_grids:
+        raise KeyError(f"No default simulation spec for {kind}.")
+    peak = {'expr':'sqrt(2)*irms'}
+    start, end, steps = (aligned_grids if aligned else default_grids)[kind]
+    if kind == 'sweep_1d':
+        return {
+            'stand': {"irms":{'values':[0, peak]}, "degel":0, "degmech":[start, end, steps]},
+            'movin': {"irms":peak, 'pos':position_spec(start, end, steps, 45)},
+        }
+    elif kind == 'sweep_2d':
+        return {
+            'stand': {"irms":{'values':[0, peak]}, "degel":0, "degmech":[start, end, steps]},
+            'movin': {"irms":peak, 'pos':position_spec(start, end, steps)},
+        }
+    elif kind == 'point':
+        return {
+            'static': {"irms":0, "degel":0, "degmech":[start, end, steps]},
+            'movin': {"irms":peak, 'pos':position_spec(start, end, steps, 45)},
+        }
 
-    keys = list(parameters.keys())
-    values = [recurse(param_range) for param_range in parameters.values()]
-    combinations = list(product(*values))
-    result = [dict(zip(keys, combination)) for combination in combinations]
-    return flatten_dict(result)
+def resolve_sims(kind, sims, params):
+    return spec_util.resolve(sims if sims is not None else default_sims(kind, params.get('symmetry_grid', False)), dict(params, rotor_poles=params.get('rotor_poles', 8)))
 
-def simulate_everything(rotor, params, simname, path=None):
+def simulate_everything(rotor, params, simname, path=None, sims=None):
     if not os.path.exists(os.path.join('results', simname)):
         os.makedirs(os.path.join('results', simname))
     retdict = {}
-    retdict.update(simulate_torque_and_backemf(rotor, params, simname, path=path))
-    retdict.update(simulate_torque_moving(rotor, params, simname, path=path))
+    retdict.update(simulate_torque_and_backemf(rotor, params, simname, path=path, sims=sims))
+    retdict.update(simulate_torque_moving(rotor, params, simname, path=path, sims=sims))
+    if params.get('fluxmap_steps', 0) > 0:
+        retdict.update(simulate_fluxmap(rotor, params, simname, path=path))
+        retdict.update(simulate_efficiency(params, simname, path=path))
     return retdict
 
-def simulate_torque_and_backemf(rotor, params, simname, path=None):
+def simulate_torque_and_backemf(rotor, params, simname, path=None, sims=None):
     if not os.path.exists(os.path.join(path, 'sims', simname)):
         os.makedirs(os.path.join(path, 'sims', simname))
     simpath = os.path.join('tmp','sims', simname, simname + '_steps')
-    csvpath = os.path.join(path,'sims', simname, simname + '_point_static.csv')
+    storepath = os.path.join(path,'sims', simname, simname + '_point_static')
     params = params.copy()
-    if not os.path.exists(csvpath):
-        params.update({
-            'degmech': [0, 90, 90*3]
-        })
-        sims = {
-            "irms": 0,
-            'degel': 0
-        }
-        sims.update(params)
-        data = multiSimHandler(simulate_general, simpath, rotor.create, params, sims)
-        data.to_csv(csvpath, header=True, index=False)
+    if not store_util.exists(storepath):
+        sims = resolve_sims('point', sims, params)['static']
+        data = multiSimHandler(simulate_general, simpath, rotor.create, params, sims, journal=storepath + '.part')
+        store_util.write(data, storepath)
+        cache_util.remove_journal(storepath + '.part')
 
-    df = pd.read_csv(csvpath)
-    df1 = df[df['irms'] == 0]
+    df1 = store_util.read(storepath, columns=['degmech', 'torque_airgap', 'flux_a', 'flux_c'], filters=[('irms', '==', 0)])
     df1.sort_values(by='degmech', inplace=True)
     df1.reset_index(drop=True, inplace=True)
 
     amin = min(df1['degmech'])
-    amax = max(df1['degmech'])
     rotational_speed_rpm = params['rpm']
     ns = rotational_speed_rpm/60
     T = 1/ns
-    num_data_points = len(df1)
-
-    dt = (amax-amin)/360*T/num_data_points
+    pole_pairs = params.get('rotor_poles', 8)/2
+    num_data_points, span, periodic = spectral_util.window(df1['degmech'], pole_pairs)
 
-    tt = np.arange(0, num_data_points) * dt
+    tt = (df1['degmech'].values[:num_data_points] - amin)/360*T
 
-    torque = df1['torque_airgap'].values
-    aflux = df1['flux_a'].values
-    cflux = df1['flux_c'].values
+    torque = df1['torque_airgap'].values[:num_data_points]
+    aflux = df1['flux_a'].values[:num_data_points]
+    cflux = df1['flux_c'].values[:num_data_points]
     
-    va = params['symmetry_factor'] * np.diff(aflux)/dt
-    vc = params['symmetry_factor'] * np.diff(cflux)/dt
-    
-    td = tt[:-1] + dt / 2
+    va = spectral_util.back_emf(aflux, span, rotational_speed_rpm, params['symmetry_factor'], periodic)
+    vc = spectral_util.back_emf(cflux, span, rotational_speed_rpm, params['symmetry_factor'], periodic)
     
     vll = va - vc
     tt = tt*1000
-    td = td*1000
+
+    order = spectral_util.orders(num_data_points, span, pole_pairs)
+    shown = np.flatnonzero(np.isclose(order, np.round(order)) & (order >= 1) & (order <= max_harmonic))
 
     fig, ax = plt_util.twinPlot({
     "1":{
@@ -257,12 +513,12 @@ def simulate_torque_and_backemf(rotor, params, simname, path=None):
         'label':r'$M_{Rel}$'
         }, 
     "3":{
-        'x': td, 
+        'x': tt, 
         'y': va, 
         'label':r'Single Phase Back EMF'
         },
     "4":{
-        'x': td, 
+        'x': tt, 
         'y': vll, 
         'label':r'Phase-Phase Back EMF'
         },
@@ -270,57 +526,58 @@ def simulate_torque_and_backemf(rotor, params, simname, path=None):
     'y2label':r'Voltage in V',
     'x1label':r'Time in ms',
     }, labelloc='lower center')
-    return {'Static Torque': fig}
-
-def simulate_torque_moving(rotor, params, simname, path=None):
+    fundamental = spectral_util.harmonic(order)
+    if fundamental is None or not periodic:
+        return {'Static Torque': fig}
+    amplitudes = spectral_util.spectrum(np.array([va, vll]))
+    fig2, _ = plt_util.barPlot({
+        'x': np.round(order[shown]).astype(int),
+        'y1': 100*amplitudes[0, shown]/amplitudes[0, fundamental],
+        'y2': 100*amplitudes[1, shown]/amplitudes[1, fundamental],
+        'yl1': r'Single Phase Back EMF',
+        'yl2': r'Phase-Phase Back EMF',
+        'ylabel': r'Amplitude in \%',
+        'xlabel': r'Harmonic Order',
+    })
+    return {'Static Torque': fig, 'Back EMF Harmonics': fig2}
+
+def simulate_torque_moving(rotor, params, simname, path=None, sims=None):
     if not os.path.exists(os.path.join(path, 'sims', simname)):
         os.makedirs(os.path.join(path, 'sims', simname))
     simpath = os.path.join('tmp','sims', simname, simname + '_steps')
-    csvpath = os.path.join(path,'sims', simname, simname + '_point_movin.csv')
+    storepath = os.path.join(path,'sims', simname, simname + '_point_movin')
     params = params.copy()
-    if not os.path.exists(csvpath):
-        params.update({
-            'pos':{
-                'parameters': {'deg':[0, 90, 90*3]},
-                'func': lambda x: {'degel':4*x['deg'], 'degmech':x['deg']+45},
-                'mode':'create'
-            },
-        })
-        sims = {
-            "irms": np.sqrt(2)*params['irms'],
-        }
-        sims.update(params)
-        data = multiSimHandler(simulate_general, simpath, rotor.create, params, sims)
-        data.to_csv(csvpath, header=True, index=False)
+    if not store_util.exists(storepath):
+        sims = resolve_sims('point', sims, params)['movin']
+        data = multiSimHandler(simulate_general, simpath, rotor.create, params, sims, journal=storepath + '.part')
+        store_util.write(data, storepath)
+        cache_util.remove_journal(storepath + '.part')
 
-    df = pd.read_csv(csvpath)
-    df1 = df[df['irms'] == np.sqrt(2)*params['irms']]
+    df1 = store_util.read(storepath, columns=['degmech', 'torque_airgap', 'flux_a', 'flux_c'], filters=[('irms', '==', np.sqrt(2)*params['irms'])])
     df1.sort_values(by='degmech', inplace=True)
     df1.reset_index(drop=True, inplace=True)
 
     amin = min(df1['degmech'])
-    amax = max(df1['degmech'])
     rotational_speed_rpm = params['rpm']
     ns = rotational_speed_rpm/60
     T = 1/ns
-    num_data_points = len(df1)
-
-    dt = (amax-amin)/360*T/num_data_points
+    pole_pairs = params.get('rotor_poles', 8)/2
+    num_data_points, span, periodic = spectral_util.window(df1['degmech'], pole_pairs)
 
-    tt = np.arange(0, num_data_points) * dt
+    tt = (df1['degmech'].values[:num_data_points] - amin)/360*T
 
-    torque = df1['torque_airgap'].values
-    aflux = df1['flux_a'].values
-    cflux = df1['flux_c'].values
-    
-    va = params['symmetry_factor'] * np.diff(aflux)/dt
-    vc = params['symmetry_factor'] * np.diff(cflux)/dt
+    torque = df1['torque_airgap'].values[:num_data_points]
+    aflux = df1['flux_a'].values[:num_data_points]
+    cflux = df1['flux_c'].values[:num_data_points]
     
-    td = tt[:-1] + dt / 2
+    va = spectral_util.back_emf(aflux, span, rotational_speed_rpm, params['symmetry_factor'], periodic)
+    vc = spectral_util.back_emf(cflux, span, rotational_speed_rpm, params['symmetry_factor'], periodic)
     
     vll = va - vc
     tt = tt*1000
-    td = td*1000
+
+    order = spectral_util.orders(num_data_points, span, pole_pairs)
+    shown = np.flatnonzero(np.isclose(order, np.round(order)) & (order >= 1) & (order <= max_harmonic))
 
     fig, ax = plt_util.twinPlot({
     "1":{
@@ -329,12 +586,12 @@ def simulate_torque_moving(rotor, params, simname, path=None):
         'label':r'$M$'
         }, 
     "3":{
-        'x': td, 
+        'x': tt, 
         'y': -va, 
         'label':r'Single Phase Back EMF'
         },
     "4":{
-        'x': td, 
+        'x': tt, 
         'y': -vll, 
         'label':r'Phase-Phase Back EMF'
         },
@@ -342,109 +599,186 @@ def simulate_torque_moving(rotor, params, simname, path=None):
     'y2label':r'Voltage in V',
     'x1label':r'Time in ms',
     }, labelloc='lower center')
-    return {'Torque Moving': fig}
-
-def sweep_1d(rotor, params, simname, labelloc='upper left', path=None):
+    if len(shown) == 0 or not periodic:
+        return {'Torque Moving': fig}
+    fig2, _ = plt_util.barPlot({
+        'x': np.round(order[shown]).astype(int),
+        'y1': spectral_util.spectrum(torque)[shown],
+        'yl1': r'$M_{\sim}$',
+        'ylabel': r'Torque in Nm',
+        'xlabel': r'Harmonic Order',
+    })
+    return {'Torque Moving': fig, 'Torque Harmonics': fig2}
+
+def load_fluxmap(storepath, params):
+    table = store_util.read(storepath)
+    fluxmap = fluxmap_util.FluxMap(table, params.get('rotor_poles', 8)/2, params.get('resistance', 0))
+    rated = np.sqrt(2)*params['irms']
+    u_max = params.get('u_max', 0)
+    if u_max <= 0:
+        mtpa = fluxmap.mtpa(rated)
+        u_max = float(fluxmap.voltage(mtpa['id'].iloc[-1], mtpa['iq'].iloc[-1], params['rpm']))
+    return fluxmap, rated, u_max
+
+def simulate_fluxmap(rotor, params, simname, path=None):
     if not os.path.exists(os.path.join(path, 'sims', simname)):
         os.makedirs(os.path.join(path, 'sims', simname))
     simpath = os.path.join('tmp','sims', simname, simname + '_steps')
-    csvpath1 = os.path.join(path,'sims', simname, simname + '_sweep_stand.csv')
-    csvpath2 = os.path.join(path,'sims', simname, simname + '_sweep_movin.csv')
+    storepath = os.path.join(path,'sims', simname, simname + '_fluxmap')
+    params = params.copy()
+    params['loss_probes'] = True
+    pole_pairs = params.get('rotor_poles', 8)/2
+    i_max = 2*np.sqrt(2)*params['irms']
+    steps = max(int(params['fluxmap_steps']), fluxmap_util.min_steps)
+    if not store_util.exists(storepath):
+        static = store_util.read(os.path.join(path,'sims', simname, simname + '_point_static'), columns=['degmech', 'flux_a', 'flux_b', 'flux_c'], filters=[('irms', '==', 0)])
+        calibration = fluxmap_util.calibrate(static, pole_pairs)
+        sims = {'dq': fluxmap_util.spec(calibration, i_max, steps)}
+        data = multiSimHandler(simulate_general, simpath, rotor.create, params, sims, journal=storepath + '.part')
+        store_util.write(fluxmap_util.dq_table(data, calibration, i_max, params['symmetry_factor'], steps), storepath)
+        cache_util.remove_journal(storepath + '.part')
+
+    fluxmap, rated, u_max = load_fluxmap(storepath, params)
+    mtpa = fluxmap.mtpa(rated)
+    speeds = np.linspace(0, envelope_speed_factor*params['rpm'], envelope_speeds)
+    envelope = fluxmap.envelope(speeds, u_max, rated)
+    print(f"Flux map: rated torque {mtpa['torque'].iloc[-1]:.3f} Nm at gamma {mtpa['gamma'].iloc[-1]:.1f} deg, back EMF {float(fluxmap.back_emf(params['rpm'])):.3f} V at {params['rpm']} rpm, voltage limit {u_max:.3f} V.")
+
+    fig1, _ = plt_util.create_heatmap_interp(fluxmap.tables['torque'], xlabel=r"$i_q$ in A", ylabel=r"$i_d$ in A", zlabel=r"Torque in Nm")
+    fig2, _ = plt_util.twinPlot({
+    "1":{
+        'x': envelope['rpm'],
+        'y': envelope['torque'],
+        'label':r'$M_{max}$'
+        },
+    "3":{
+        'x': envelope['rpm'],
+        'y': envelope['power']/1000,
+        'label':r'$P_{max}$'
+        },
+    'y1label':r'Torque in Nm',
+    'y2label':r'Power in kW',
+    'x1label':r'Speed in rpm',
+    }, labelloc='lower center')
+    return {'Torque Map': fig1, 'Torque Speed': fig2}
+
+def simulate_efficiency(params, simname, path=None):
+    fluxpath = os.path.join(path,'sims', simname, simname + '_fluxmap')
+    storepath = os.path.join(path,'sims', simname, simname + '_efficiency')
+    fluxmap, rated, u_max = load_fluxmap(fluxpath, params)
+    if 'b_tooth' not in fluxmap.tables:
+        print(f"Flux map {fluxpath} has no probe flux densities, delete it to solve it again with loss probes.")
+        return {}
+    table = store_util.read(fluxpath, columns=['stator_area'])
+    losses = loss_util.LossModel(fluxmap, loss_util.iron_mass(table['stator_area'].iloc[0], params))
+    speeds = np.linspace(0, envelope_speed_factor*params['rpm'], loss_util.map_speeds + 1)[1:]
+    envelope = fluxmap.envelope(speeds, u_max, rated)
+    key = loss_util.map_key(store_util.find(fluxpath), params)
+    efficiency = store_util.read(storepath) if store_util.exists(storepath) else None
+    if efficiency is not None and ('map_key' not in efficiency.columns or efficiency['map_key'].iloc[0] != key):
+        print(f"Efficiency map {storepath} was computed from another flux map or loss settings, computing it again.")
+        efficiency = None
+    if efficiency is None:
+        torques = np.linspace(0, envelope['torque'].max(), loss_util.map_torques + 1)[1:]
+        efficiency = losses.efficiency_map(speeds, torques, u_max, rated)
+        efficiency['map_key'] = key
+        store_util.write(efficiency, storepath, sort=())
+    efficiency = efficiency.drop(columns='map_key')
+    rated_point = losses.efficiency_map([params['rpm']], [fluxmap.mtpa(rated)['torque'].iloc[-1]], u_max, rated).iloc[0]
+    print(f"Efficiency: {100*rated_point['efficiency']:.2f} % at the rated point, copper loss {rated_point['copper_loss']:.2f} W, iron loss {rated_point['iron_loss']:.2f} W, stator iron {losses.mass:.3f} kg.")
+    if params.get('drive_cycle', ''):
+        cycle = loss_util.cycle(efficiency, **loss_util.read_cycle(params['drive_cycle']))
+        print(f"Drive cycle {params['drive_cycle']}: {cycle['energy']/3600:.3f} Wh delivered, {cycle['losses']/3600:.3f} Wh lost, efficiency {100*cycle['efficiency']:.2f} %, {cycle['unreachable']} points outside the map.")
+
+    grid = loss_util.table(efficiency)
+    fig = Figure()
+    ax = fig.subplots()
+    low, high = np.nanmin(grid.to_numpy()), np.nanmax(grid.to_numpy())
+    levels = np.linspace(low, high if high > low else low + 0.01, 12)
+    heatmap = ax.contourf(grid.columns.to_numpy(), grid.index.to_numpy(), 100*grid.to_numpy(), levels=100*levels, cmap=plt_util.cm)
+    contour = ax.contour(grid.columns.to_numpy(), grid.index.to_numpy(), 100*grid.to_numpy(), levels=100*levels[1:-1], colors='black', linewidths=plt_util.lwidth)
+    ax.clabel(contour, inline=True, fontsize=10, fmt=plt_util.fmt)
+    ax.plot(envelope['rpm'], envelope['torque'], color='black', linewidth=2*plt_util.lwidth)
+    cbar = fig.colorbar(heatmap)
+    cbar.set_label(r"Efficiency in \%", labelpad=1)
+    cbar.formatter = plt_util.fmt
+    ax.set_xlabel(r"Speed in rpm", labelpad=1)
+    ax.set_ylabel(r"Torque in Nm", labelpad=1)
+    ax.xaxis.set_major_formatter(plt_util.fmt)
+    ax.yaxis.set_major_formatter(plt_util.fmt)
+    fig.tight_layout(pad=1)
+    return {'Efficiency Map': fig}
+
+def sweep_spectra(metrics, stand, movin, keys, params):
+    pole_pairs = params.get('rotor_poles', 8)/2
+    cogging = spectral_util.analyze(stand[stand['irms'] == 0], keys, pole_pairs, prefix='cogging')
+    ripple = spectral_util.analyze(movin, keys, pole_pairs, prefix='torque')
+    return metrics.join(cogging, how='left').join(ripple, how='left')
+
+def sweep_1d(rotor, params, simname, labelloc='upper left', path=None, surrogate=None, preview=False, sims=None):
+    if not os.path.exists(os.path.join(path, 'sims', simname)):
+        os.makedirs(os.path.join(path, 'sims', simname))
+    simpath = os.path.join('tmp','sims', simname, simname + '_steps')
+    suffix = '_preview' if preview else ''
+    storepath1 = os.path.join(path,'sims', simname, simname + '_sweep_stand' + suffix)
+    storepath2 = os.path.join(path,'sims', simname, simname + '_sweep_movin' + suffix)
+    options = {'surrogate': surrogate, 'max_std': np.inf if preview else 0.05, 'need_flux': False}
     irms = np.sqrt(2)*params['irms']
-    if not os.path.exists(csvpath1):
-        sims1 = {
-            "irms":(0, irms),
-            "degel":0,
-            "degmech":[0, 90, 46],
-        }
-        data1 = multiSimHandler(simulate_general, simpath, rotor.create, params, sims1)
-        data1.to_csv(csvpath1, header=True, index=False)
-    if not os.path.exists(csvpath2):
-        sims2 = {
-            "irms":irms,
-            'pos':{
-                'parameters': {'deg':[0, 90, 46]},
-                'func': lambda x: {'degel':4*x['deg'], 'degmech':x['deg']+45},
-                'mode':'create'
-            },
-        }
-        data2 = multiSimHandler(simulate_general, simpath, rotor.create, params, sims2)
-        data2.to_csv(csvpath2, header=True, index=False)
-
-    df1 = pd.read_csv(csvpath1)
-
-    filtered_data_on = df1[df1['irms'] == irms]
-
-    pivot_table_on = filtered_data_on.pivot_table(
-        values='torque_airgap', 
-        index='magnet_depth',     
-        columns='degmech',        
-        aggfunc='first'       
-    )
-
-    sorted_pivot_table_on = pivot_table_on.sort_index(ascending=True).sort_index(axis=1, ascending=True)
+    sims = resolve_sims('sweep_1d', sims, params)
+    if not store_util.exists(storepath1):
+        sims1 = sims['stand']
+        data1 = multiSimHandler(simulate_general, simpath, rotor.create, params, sims1, journal=storepath1 + '.part', **options)
+        store_util.write(data1, storepath1)
+        cache_util.remove_journal(storepath1 + '.part')
+    if not store_util.exists(storepath2):
+        sims2 = sims['movin']
+        data2 = multiSimHandler(simulate_general, simpath, rotor.create, params, sims2, journal=storepath2 + '.part', **options)
+        store_util.write(data2, storepath2)
+        cache_util.remove_journal(storepath2 + '.part')
+
+    df1 = store_util.read(storepath1, columns=['irms', 'magnet_depth', 'degmech', 'torque_airgap'], filters=[('irms', 'in', (0, irms))])
+
+    sorted_pivot_table_on = post_util.position_table(df1[df1['irms'] == irms], 'magnet_depth', 'degmech')
 
     fig1, _ = plt_util.create_heatmap_interp(sorted_pivot_table_on, xlabel=r"Mechanical Position in Degrees", ylabel=r"Magnet Depth in mm", zlabel=r"Torque in Nm", clevels=10)
     # fig1.savefig(respath + "_on.pdf", bbox_inches='tight')
     # plt.close(fig1)
     
-    filtered_data_off = df1[df1['irms'] == 0]
-
-    pivot_table_off = filtered_data_off.pivot_table(
-        values='torque_airgap',  
-        index='magnet_depth',  
-        columns='degmech',       
-        aggfunc='first'        
-    )
-
-    sorted_pivot_table_off = pivot_table_off.sort_index(ascending=True).sort_index(axis=1, ascending=True)
+    sorted_pivot_table_off = post_util.position_table(df1[df1['irms'] == 0], 'magnet_depth', 'degmech')
 
     fig2, _ = plt_util.create_heatmap_interp(sorted_pivot_table_off, xlabel=r"Mechanical Position in Degrees", ylabel=r"Magnet Depth in mm", zlabel=r"Torque in Nm", clevels=4)
     # fig2.savefig(respath + "_off.pdf", bbox_inches='tight')
     # plt.close(fig2)
 
-    df2 = pd.read_csv(csvpath2)
+    df2 = store_util.read(storepath2, columns=['magnet_depth', 'degmech', 'torque_airgap'], filters=[('irms', '==', irms)])
 
-    filtered_data_rot = df2[df2['irms'] == irms]
-
-    pivot_table_rot = filtered_data_rot.pivot_table(
-        values='torque_airgap', 
-        index='magnet_depth',   
-        columns='degmech',      
-        aggfunc='first'         
-    )
-
-    sorted_pivot_table_rot = pivot_table_rot.sort_index(ascending=True).sort_index(axis=1, ascending=True)
+    sorted_pivot_table_rot = post_util.position_table(df2, 'magnet_depth', 'degmech')
 
     fig3, _ = plt_util.create_heatmap_interp(sorted_pivot_table_rot, xlabel=r"Mechanical Position in Degrees", ylabel=r"Magnet Depth in mm", zlabel=r"Torque in Nm", clevels=6)
     # fig3.savefig(respath + "_rot.pdf", bbox_inches='tight')
     # plt.close(fig3)
     
-    max_torque_rows = df1.loc[df1.groupby(['magnet_depth', 'irms'])['torque_airgap'].idxmax()]
-
-    on = max_torque_rows[max_torque_rows['irms'] == irms].sort_values(by='magnet_depth', ascending=True)
-    off = max_torque_rows[max_torque_rows['irms'] == 0].sort_values(by='magnet_depth', ascending=True)
-
-    grouped = df2.groupby('magnet_depth')['torque_airgap'].agg(['mean', lambda x: np.sqrt(((x - x.mean())**2).sum() / len(x))]).reset_index()
-    grouped.columns = ['magnet_depth', 'mean', 'ripple']
-    combined1 = []
-    for i in range(len(off)):
-        combined1.append(off.iloc[i]['torque_airgap']/ on.iloc[i]['torque_airgap'])
-    combined2 = grouped['ripple']/grouped['mean']
+    metrics = post_util.torque_metrics(df1, df2, irms, ['magnet_depth'])
+    metricspath = os.path.join(path, 'sims', simname, simname + '_sweep_metrics' + suffix)
+    if not store_util.exists(metricspath):
+        store_util.write(sweep_spectra(metrics, df1, df2, ['magnet_depth'], params).reset_index(), metricspath)
+    depth = metrics.index.to_numpy()
+    combined1 = metrics['max_rel']/metrics['max']
+    combined2 = metrics['ripple']/metrics['mean']
     fig4, _ = plt_util.twinPlot({
         "1":{
-            'x': on['magnet_depth'], 
-            'y': on['torque_airgap'], 
+            'x': depth, 
+            'y': metrics['max'], 
             'label':r'$M_{Max}$'
             }, 
         '2':{
-            'x': off['magnet_depth'], 
-            'y': off['torque_airgap'], 
+            'x': depth, 
+            'y': metrics['max_rel'], 
             'label':r'$M_{Reluctance,max}$'
             }, 
         '3':{
-            'x': on['magnet_depth'], 
-            'y': combined1[:], 
+            'x': depth, 
+            'y': combined1, 
             'label':r'$\frac{M_{Reluctance,max}}{M_{Max}}$'
             },
         'y1label':r'Torque in Nm',
@@ -455,17 +789,17 @@ def sweep_1d(rotor, params, simname, labelloc='upper left', path=None):
     # plt.close(fig4)
     fig5, _ = plt_util.twinPlot({
         "1":{
-            'x': grouped['magnet_depth'], 
-            'y': grouped['mean'], 
+            'x': depth, 
+            'y': metrics['mean'], 
             'label':r'$M_{-}$'
             }, 
         '2':{
-            'x': grouped['magnet_depth'], 
-            'y': grouped['ripple'], 
+            'x': depth, 
+            'y': metrics['ripple'], 
             'label':r'$M_{\sim}$'
             }, 
         '3':{
-            'x': grouped['magnet_depth'], 
+            'x': depth, 
             'y': combined2, 
             'label':r'$\frac{M_{\sim}}{M_{-}}$'
             }, 
@@ -478,116 +812,100 @@ def sweep_1d(rotor, params, simname, labelloc='upper left', path=None):
     # plt.close(fig5)
     return {'Static Torque':fig1, ' Static Reluctance Torque':fig2, 'Dynamic Torque':fig3, 'Torque Max/Reluctance':fig4, 'Torque AC/DC':fig5}
 
-def sweep_2d(rotor, steps, simname, ylabel, xlabel=r"Magnet Depth in mm", path=None):
+def sweep_2d(rotor, steps, simname, ylabel, xlabel=r"Magnet Depth in mm", path=None, adaptive=False, surrogate=None, preview=False, sims=None):
     if not os.path.exists(os.path.join(path, 'sims', simname)):
         os.makedirs(os.path.join(path, 'sims', simname))
     simpath = os.path.join('tmp','sims', simname, simname + '_steps')
-    csvpath1 = os.path.join(path, 'sims', simname, simname + '_sweep_stand.csv')
-    csvpath2 = os.path.join(path, 'sims', simname, simname + '_sweep_movin.csv')
+    suffix = '_preview' if preview else ''
+    storepath1 = os.path.join(path, 'sims', simname, simname + '_sweep_stand' + suffix)
+    storepath2 = os.path.join(path, 'sims', simname, simname + '_sweep_movin' + suffix)
+    options = {'surrogate': surrogate, 'max_std': np.inf if preview else 0.05, 'need_flux': False}
     # respath = os.path.join(plt_util.texpath, simname)
     # if not os.path.exists(respath):
     #     os.makedirs(respath)
     # respath = os.path.join(respath, simname)
     
     irms = np.sqrt(2)*steps['irms']
-    if not os.path.exists(csvpath1):
-        sims = {
-            "irms":(0, irms),
-            "degel":0,
-            "degmech":[22.5, 67.5, 11],
-        }
-        data = multiSimHandler(simulate_general, simpath, rotor.create, steps, sims)
-        data.to_csv(csvpath1, header=True, index=False)
+    sims = resolve_sims('sweep_2d', sims, steps)
+    sims1 = sims['stand']
+    sims2 = sims['movin']
+    if adaptive and not (store_util.exists(storepath1) and store_util.exists(storepath2)):
+        data1, data2 = adaptive_util.adaptive_sweep(multiSimHandler, simulate_general, simpath, rotor.create, steps, sims1, sims2, irms, journal=storepath1 + '.part', **options)
+        store_util.write(data1, storepath1)
+        store_util.write(data2, storepath2)
+        cache_util.remove_journal(storepath1 + '.part')
+
+    if not store_util.exists(storepath1):
+        data = multiSimHandler(simulate_general, simpath, rotor.create, steps, sims1, journal=storepath1 + '.part', **options)
+        store_util.write(data, storepath1)
+        cache_util.remove_journal(storepath1 + '.part')
     
-    if not os.path.exists(csvpath2):
-        sims = {
-            "irms":irms,
-            'pos':{
-                'parameters': {'deg':[22.5, 67.5, 11]},
-                'func': lambda x: {'degel':params['symmetry_factor']*x['deg'], 'degmech':x['deg']},
-                'mode':'create'
-            },
-        }
-        data = multiSimHandler(simulate_general, simpath, rotor.create, steps, sims)
-        data.to_csv(csvpath2, header=True, index=False)
-
-    df1 = pd.read_csv(csvpath1)
-    df1.dropna()
-
-    filtered_data_on = df1[df1['irms'] == irms]
-
-    pivot_table_on = filtered_data_on.pivot_table(
-        values='torque_airgap', 
-        index='x',     
-        columns='y',        
-        aggfunc='max'         
-    )
-
-    sorted_pivot_table_on = pivot_table_on.sort_index(ascending=True).sort_index(axis=1, ascending=True).fillna(0)
+    if not store_util.exists(storepath2):
+        data = multiSimHandler(simulate_general, simpath, rotor.create, steps, sims2, journal=storepath2 + '.part', **options)
+        store_util.write(data, storepath2)
+        cache_util.remove_journal(storepath2 + '.part')
+
+    fill = adaptive_util.fill_grid if adaptive else lambda table: table
+
+    df1 = store_util.read(storepath1, columns=['irms', 'x', 'y', 'degmech', 'torque_airgap'], filters=[('irms', 'in', (0, irms))])
+    df2 = store_util.read(storepath2, columns=['x', 'y', 'degmech', 'torque_airgap'], filters=[('irms', '==', irms)])
+
+    metrics = post_util.torque_metrics(df1, df2, irms, ['x', 'y'])
+    metricspath = os.path.join(path, 'sims', simname, simname + '_sweep_metrics' + suffix)
+    if not store_util.exists(metricspath):
+        store_util.write(sweep_spectra(metrics, df1, df2, ['x', 'y'], steps).reset_index(), metricspath)
+    sorted_pivot_table_on, sorted_pivot_table_off, sorted_pivot_table_rot, sorted_pivot_table_ac = [fill(post_util.table(metrics, column)).fillna(0) for column in ('max', 'max_rel', 'mean', 'ripple')]
+    sorted_pivot_table_rot = sorted_pivot_table_rot.abs()
     
     fig1, _ = plt_util.create_heatmap_interp(sorted_pivot_table_on, ylabel=xlabel, xlabel=ylabel, zlabel=r"Torque in Nm")
     # fig1.savefig(respath + "_on.pdf", bbox_inches='tight')
     # plt.close(fig1)
     
-    filtered_data_off = df1[df1['irms'] == 0]
-
-    pivot_table_off = filtered_data_off.pivot_table(
-        values='torque_airgap', 
-        index='x',     
-        columns='y',        
-        aggfunc='max'          
-    )
-    sorted_pivot_table_off = pivot_table_off.sort_index(ascending=True).sort_index(axis=1, ascending=True).fillna(0)
-    
     fig2, _ = plt_util.create_heatmap_interp(sorted_pivot_table_off, ylabel=xlabel, xlabel=ylabel, zlabel=r"Torque in Nm")
     # fig2.savefig(respath + "_off.pdf", bbox_inches='tight')
     # plt.close(fig2)
-    
-    df2 = pd.read_csv(csvpath2)
-    df2.dropna()
-
-    filtered_data_rot = df2[df2['irms'] == irms]
-    grouped = filtered_data_rot.groupby(['x', 'y'])['torque_airgap'].agg(['mean', lambda x: np.sqrt(((x - x.mean())**2).sum() / len(x))]).reset_index()
-    grouped.columns = ['x', 'y', 'mean', 'ripple']
-    
-    pivot_table_rot = grouped.pivot_table(
-        values='mean',  
-        index='x',     
-        columns='y',        
-        aggfunc='first'       
-    )
-
-    sorted_pivot_table_rot = pivot_table_rot.sort_index(ascending=True).sort_index(axis=1, ascending=True).fillna(0).abs()
 
     fig3, _ = plt_util.create_heatmap_interp(sorted_pivot_table_rot, ylabel=xlabel, xlabel=ylabel, zlabel=r"Torque in Nm")
     # fig3.savefig(respath + "_rot_dc.pdf", bbox_inches='tight')
     # plt.close(fig3)
-    
-    pivot_table_ac = grouped.pivot_table(
-        values='ripple',  
-        index='x',     
-        columns='y',        
-        aggfunc='first'        
-    )
-
-    sorted_pivot_table_ac = pivot_table_ac.sort_index(ascending=True).sort_index(axis=1, ascending=True).fillna(0)
 
     fig4, _ = plt_util.create_heatmap_interp(sorted_pivot_table_ac, ylabel=xlabel, xlabel=ylabel, zlabel=r"Torque in Nm")
-
     # fig4.savefig(respath + "_rot_ac.pdf", bbox_inches='tight')
     # plt.close(fig4)
-    tabl1 = (sorted_pivot_table_on/sorted_pivot_table_off).fillna(0)
-    table1 = tabl1.applymap(lambda x: constrain(x, 0, 10))
+
+    table1 = constrain((sorted_pivot_table_on/sorted_pivot_table_off).fillna(0), 0, 10)
     fig5, _ = plt_util.create_heatmap_interp(table1, ylabel=xlabel, xlabel=ylabel, zlabel=r"$\frac{M_{Max}}{M_{rel,max}}$")
-    
     # fig5.savefig(respath + "_ratio.pdf", bbox_inches='tight')
     # plt.close(fig5)
-    tabl2 = (sorted_pivot_table_ac/sorted_pivot_table_rot).fillna(0)
-    table2 = tabl2.applymap(lambda x: constrain(x, 0, 1))
+
+    table2 = constrain((sorted_pivot_table_ac/sorted_pivot_table_rot).fillna(0), 0, 1)
     fig6, _ = plt_util.create_heatmap_interp(table2, ylabel=xlabel, xlabel=ylabel, zlabel=r"Torque Ripple")
     # fig6.savefig(respath + "_wellig.pdf", bbox_inches='tight')
     # plt.close(fig6)
     return {'Max. Torque': fig1, 'Max. Reluctance Torque': fig2, 'DC Torque Component': fig3, 'AC Torque Component': fig4, 'Torque Ripple': fig6}
 
+def optimize_geometry(rotor, steps, bounds, simname, path=None, max_ripple=None, max_magarea=None, batch=8, rounds=6, sims=None):
+    if not os.path.exists(os.path.join(path, 'sims', simname)):
+        os.makedirs(os.path.join(path, 'sims', simname))
+    simpath = os.path.join('tmp','sims', simname, simname + '_steps')
+    storepath = os.path.join(path, 'sims', simname, simname + '_optim')
+    irms = np.sqrt(2)*steps['irms']
+    sims = resolve_sims('sweep_2d', sims, steps)['movin']
+    if not store_util.exists(storepath):
+        history = optim_util.optimize(multiSimHandler, simulate_general, simpath, rotor.create, steps, bounds, sims, irms=irms, max_ripple=max_ripple, max_magarea=max_magarea, batch=batch, rounds=rounds, journal=storepath + '.part')
+        store_util.write(history, storepath, sort=())
+        cache_util.remove_journal(storepath + '.part')
+    history = store_util.read(storepath, columns=['mean', 'best'])
+
+    fig = Figure()
+    ax = fig.subplots()
+    ax.plot(np.arange(len(history)) + 1, history['mean'], 'x', label=r"Candidate")
+    ax.plot(np.arange(len(history)) + 1, history['best'], '-', label=r"Best feasible")
+    ax.set_xlabel(r"Evaluated Geometries")
+    ax.set_ylabel(r"Mean Torque in Nm")
+    ax.legend()
+    ax.grid(True)
+    return {'Optimization History': fig}
+
 if __name__ == "__main__":
     sys.exit(0)
\ No newline at end of file
@@ -0,0 +1,104 @@
+import sys, os
+import ast
+import json
+import hashlib
+import numpy as np
+
+sys.path.insert(0, os.getcwd())
+import modules.cache_util as cache_util
+
+# Sweep specs are plain JSON. Besides scalars and [start, end, steps] ranges an entry can be
+#   {'values': [...]}                      explicit values (JSON has no tuples)
+#   {'expr': 'sqrt(2)*irms'}               scalar computed from the simulation parameters
+#   {'parameters': {...}, 'expr': {...}, 'constants': {...}, 'mode': 'create'}
+#                                          derived parameters, evaluated once over all combinations
+#   {'parameters': {...}, 'expr': '...', 'mode': 'select'}
+#                                          filter, evaluated once over all combinations
+
+functions = {
+    'pi': np.pi,
+    'sqrt': np.sqrt,
+    'sin': np.sin,
+    'cos': np.cos,
+    'tan': np.tan,
+    'arctan2': np.arctan2,
+    'deg2rad': np.deg2rad,
+    'rad2deg': np.rad2deg,
+    'abs': np.abs,
+    'mod': np.mod,
+    'floor': np.floor,
+    'round': np.round,
+    'minimum': np.minimum,
+    'maximum': np.maximum,
+    'where': np.where,
+}
+allowed_nodes = (
+    ast.Expression, ast.BinOp, ast.UnaryOp, ast.Compare, ast.Name, ast.Load, ast.Constant, ast.Call,
+    ast.Add, ast.Sub, ast.Mult, ast.Div, ast.FloorDiv, ast.Mod, ast.Pow, ast.USub, ast.UAdd,
+    ast.BitAnd, ast.BitOr, ast.Invert, ast.Lt, ast.LtE, ast.Gt, ast.GtE, ast.Eq, ast.NotEq,
+)
+
+_compiled = {}
+
+
+def compile_expr(text):
+    if text not in _compiled:
+        tree = ast.parse(str(text), mode='eval')
+        for node in ast.walk(tree):
+            if not isinstance(node, allowed_nodes):
+                raise ValueError(f"Unsupported syntax {type(node).__name__} in spec expression {text}.")
+            if isinstance(node, ast.Compare) and len(node.ops) != 1:
+                raise ValueError(f"Chained comparisons are not supported in spec expression {text}, use & instead.")
+            if isinstance(node, ast.Call) and (not isinstance(node.func, ast.Name) or node.func.id not in functions or len(node.keywords) != 0):
+                raise ValueError(f"Unsupported function call in spec expression {text}.")
+            if isinstance(node, ast.Constant) and not isinstance(node.value, (int, float, bool)):
+                raise ValueError(f"Unsupported constant {node.value!r} in spec expression {text}.")
+        names = sorted(set(node.id for node in ast.walk(tree) if isinstance(node, ast.Name)) - set(functions))
+        _compiled[text] = (compile(tree, '<spec>', 'eval'), names)
+    return _compiled[text]
+
+def evaluate(text, namespace):
+    code, names = compile_expr(text)
+    missing = [name for name in names if name not in namespace]
+    if len(missing) != 0:
+        raise KeyError(f"Spec expression {text} needs parameter {', '.join(missing)}.")
+    scope = dict(functions)
+    scope.update({name: namespace[name] for name in names})
+    return eval(code, {'__builtins__': {}}, scope)
+
+def is_scalar_expr(item):
+    return isinstance(item, dict) and set(item.keys()) == {'expr'} and isinstance(item['expr'], str)
+
+def resolve(spec, params):
+    if is_scalar_expr(spec):
+        return evaluate(spec['expr'], params)
+    if isinstance(spec, dict):
+        return {key: resolve(value, params) for key, value in spec.items()}
+    if isinstance(spec, list):
+        return [resolve(value, params) for value in spec]
+    if isinstance(spec, tuple):
+        return tuple(resolve(value, params) for value in spec)
+    return spec
+
+def evaluate_entry(item, combos):
+    mode = item.get('mode', 'select')
+    if len(combos) == 0:
+        return []
+    namespace = dict(item.get('constants', {}))
+    namespace.update({key: np.array([combo[key] for combo in combos]) for key in combos[0]})
+    size = len(combos)
+    if mode == 'select':
+        mask = np.broadcast_to(evaluate(item['expr'], namespace), (size,))
+        return [combo for combo, keep in zip(combos, mask) if keep]
+    elif mode == 'create':
+        columns = {key: np.broadcast_to(evaluate(text, namespace), (size,)) for key, text in item['expr'].items()}
+        mask = np.broadcast_to(evaluate(item['where'], namespace), (size,)) if 'where' in item else np.ones(size, dtype=bool)
+        return [{key: column[i] for key, column in columns.items()} for i in range(size) if mask[i]]
+    else:
+        raise KeyError("Wrong function mode selected.")
+
+def spec_key(spec):
+    return hashlib.sha256(json.dumps(cache_util.normalize(spec), sort_keys=True).encode('utf-8')).hexdigest()
+
+if __name__ == "__main__":
+    sys.exit(0)
@@ -0,0 +1,112 @@
+import sys, os
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.getcwd())
+import modules.post_util as post_util
+
+# Harmonic analysis of torque and flux linkage over the rotor position, batched over all geometries.
+# Orders are electrical, order 1 is one electrical period. A window that ends on a full electrical period
+# repeats its first sample, the repeated sample is dropped before the rFFT. On a window that is no whole number of
+# periods the orders and amplitudes are leakage, those columns are NaN and only mean and RMS ripple are kept.
+period_tolerance = 1e-6
+dominant_orders = 3
+
+
+def whole(periods):
+    return periods >= 1 - period_tolerance and abs(periods - np.round(periods)) < period_tolerance
+
+def window(positions, pole_pairs):
+    positions = np.asarray(positions, dtype=np.float64)
+    if len(positions) < 2:
+        return len(positions), 0, False
+    span = positions[-1] - positions[0]
+    if whole(span*pole_pairs/360):
+        return len(positions) - 1, span, True
+    span += span/(len(positions) - 1)
+    return len(positions), span, whole(span*pole_pairs/360)
+
+def orders(count, span, pole_pairs):
+    return np.arange(count//2 + 1)*360/(span*pole_pairs)
+
+def spectrum(values):
+    values = np.asarray(values, dtype=np.float64)
+    count = values.shape[-1]
+    amplitudes = np.abs(np.fft.rfft(values, axis=-1))/count
+    amplitudes[..., 1:] *= 2
+    if count % 2 == 0:
+        amplitudes[..., -1] /= 2
+    return amplitudes
+
+def harmonic(order, wanted=1):
+    index = int(np.argmin(np.abs(order - wanted)))
+    return index if abs(order[index] - wanted) < 1e-3 else None
+
+def thd(amplitudes, fundamental):
+    if fundamental is None or fundamental == 0:
+        return np.full(amplitudes.shape[:-1], np.nan)
+    harmonics = amplitudes[..., 2*fundamental::fundamental]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.sqrt((harmonics**2).sum(axis=-1))/amplitudes[..., fundamental]
+
+def back_emf(flux, span, rpm, symmetry_factor, periodic=True):
+    flux = np.asarray(flux, dtype=np.float64)
+    count = flux.shape[-1]
+    duration = span/360*60/rpm
+    if not periodic:
+        return symmetry_factor*np.gradient(flux, duration/count, axis=-1)
+    omega = 2*np.pi*np.arange(count//2 + 1)/duration
+    return symmetry_factor*np.fft.irfft(1j*omega*np.fft.rfft(flux, axis=-1), count, axis=-1)
+
+def batch(df, keys, columns, angle='degmech'):
+    if len(keys) != 0:
+        unique, (inverse,) = post_util.group(post_util.key_array(df, keys))
+        index = post_util.make_index(unique, keys)
+    else:
+        inverse = np.zeros(len(df), dtype=int)
+        index = pd.RangeIndex(1 if len(df) != 0 else 0)
+    positions, position_index = np.unique(df[angle].to_numpy(dtype=np.float64), return_inverse=True)
+    ret = {}
+    for column in columns:
+        values = np.full((len(index), len(positions)), np.nan)
+        values[inverse, position_index] = df[column].to_numpy(dtype=np.float64)
+        ret[column] = values
+    return index, positions, ret
+
+def torque_columns(torque, order, prefix='torque', count=dominant_orders, periodic=True):
+    ac = spectrum(torque)[:, 1:]
+    ret = {prefix + '_mean': torque.mean(axis=1), prefix + '_ripple': np.sqrt((ac**2).sum(axis=1)/2)}
+    ranked = np.argsort(-np.nan_to_num(ac, nan=-np.inf), axis=1)[:, :count]
+    for i in range(min(count, ac.shape[1])):
+        ret[f'{prefix}_order_{i + 1}'] = order[1:][ranked[:, i]] if periodic else np.full(len(torque), np.nan)
+        ret[f'{prefix}_amp_{i + 1}'] = np.take_along_axis(ac, ranked[:, i:i + 1], axis=1)[:, 0] if periodic else np.full(len(torque), np.nan)
+    return ret
+
+def emf_columns(emf, order, prefix='emf', periodic=True):
+    amplitudes = spectrum(emf)
+    fundamental = harmonic(order) if periodic else None
+    return {
+        prefix + '_fundamental': amplitudes[:, fundamental] if fundamental is not None else np.full(len(emf), np.nan),
+        prefix + '_thd': thd(amplitudes, fundamental),
+    }
+
+def analyze(df, keys, pole_pairs, rpm=None, symmetry_factor=1, prefix='torque', count=dominant_orders):
+    keys = list(keys)
+    columns = [column for column in ('torque_airgap', 'flux_a', 'flux_c') if column in df.columns]
+    index, positions, values = batch(df, keys, columns)
+    samples, span, periodic = window(positions, pole_pairs)
+    if samples < 2:
+        return pd.DataFrame(index=index)
+    order = orders(samples, span, pole_pairs)
+    ret = {}
+    if 'torque_airgap' in values:
+        ret.update(torque_columns(values['torque_airgap'][:, :samples], order, prefix, count, periodic))
+    if rpm is not None and 'flux_a' in values:
+        flux_a = values['flux_a'][:, :samples]
+        ret.update(emf_columns(back_emf(flux_a, span, rpm, symmetry_factor, periodic), order, 'emf', periodic))
+        if 'flux_c' in values:
+            ret.update(emf_columns(back_emf(flux_a - values['flux_c'][:, :samples], span, rpm, symmetry_factor, periodic), order, 'emf_ll', periodic))
+    return pd.DataFrame(ret, index=index)
+
+if __name__ == "__main__":
+    sys.exit(0)
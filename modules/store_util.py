@@ -0,0 +1,102 @@
+import sys, os
+import glob
+import json
+import numpy as np
+import pandas as pd
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+sys.path.insert(0, os.getcwd())
+
+# Result tables are stored as Parquet when pyarrow is available and as CSV otherwise.
+# Paths are passed without extension, older projects with CSV files keep working.
+extensions = ('.parquet', '.csv')
+float32_columns = ('torque_airgap', 'magarea', 'solve_time', 'surrogate_std')
+sort_columns = ('irms', 'x', 'y', 'degmech')
+scalar_kinds = ('string', 'empty', 'boolean', 'integer', 'floating', 'mixed-integer-float', 'decimal')
+row_group_size = 8192
+compression = 'zstd'
+
+operators = {
+    '==': np.equal,
+    '!=': np.not_equal,
+    '<': np.less,
+    '<=': np.less_equal,
+    '>': np.greater,
+    '>=': np.greater_equal,
+    'in': lambda column, values: np.isin(column, list(values)),
+}
+
+
+def find(base):
+    for extension in extensions:
+        if os.path.exists(base + extension):
+            return base + extension
+    return None
+
+def exists(base):
+    return find(base) is not None
+
+def stored(folder):
+    bases = []
+    for path in sorted(glob.glob(os.path.join(folder, '*'))):
+        base, extension = os.path.splitext(path)
+        if extension in extensions and base not in bases:
+            bases.append(base)
+    return bases
+
+def serialise(value):
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return None
+    return json.dumps(value, sort_keys=True, default=repr)
+
+def typed(df):
+    # Settings merged into the parameters leave object columns with lists, dicts or mixed types, those are stored as JSON text.
+    df = df.copy()
+    for column in df.columns:
+        if pd.api.types.is_float_dtype(df[column]):
+            df[column] = df[column].astype(np.float32 if column in float32_columns else np.float64)
+        elif df[column].dtype == object and pd.api.types.infer_dtype(df[column], skipna=True) not in scalar_kinds:
+            df[column] = df[column].map(serialise).astype(object)
+    return df
+
+def write(df, base, sort=sort_columns):
+    df = typed(df)
+    order = [column for column in sort if column in df.columns]
+    if len(order) != 0:
+        df = df.sort_values(order, kind='stable').reset_index(drop=True)
+    if pq is not None:
+        try:
+            pq.write_table(pa.Table.from_pandas(df, preserve_index=False), base + '.parquet', compression=compression, row_group_size=row_group_size)
+            return base + '.parquet'
+        except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError) as e:
+            print(f"Warning: could not store {base} as Parquet, writing {base}.csv instead: {type(e).__name__}: {e}")
+    df.to_csv(base + '.csv', header=True, index=False)
+    return base + '.csv'
+
+def read(base, columns=None, filters=None):
+    path = find(base)
+    if path is None:
+        raise FileNotFoundError(f"No stored results at {base}.")
+    filters = list(filters) if filters is not None else []
+    if path.endswith('.parquet'):
+        if pq is None:
+            raise ImportError(f"pyarrow is needed to read {path}.")
+        pushdown = [(column, op, list(value) if op == 'in' else value) for column, op, value in filters]
+        return pq.read_table(path, columns=columns, filters=pushdown if len(pushdown) != 0 else None).to_pandas()
+    usecols = None if columns is None else list(dict.fromkeys(list(columns) + [column for column, _, _ in filters]))
+    df = pd.read_csv(path, usecols=usecols)
+    mask = np.ones(len(df), dtype=bool)
+    for column, op, value in filters:
+        mask &= operators[op](df[column].to_numpy(), value)
+    df = df[mask]
+    if columns is not None:
+        df = df[list(columns)]
+    return df.reset_index(drop=True)
+
+if __name__ == "__main__":
+    sys.exit(0)
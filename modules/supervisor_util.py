@@ -0,0 +1,341 @@
+import sys, os
+import time
+import threading
+import traceback
+import multiprocessing
+from multiprocessing import connection
+from collections import deque
+from concurrent import futures
+import numpy as np
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+sys.path.insert(0, os.getcwd())
+
+default_worker_memory_mb = 1024
+
+
+class TaskFailed(Exception):
+    def __init__(self, message, report):
+        super().__init__(message)
+        self.report = report
+
+def available_cores():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+def available_memory_mb():
+    if psutil is not None:
+        return psutil.virtual_memory().available/1024/1024
+    try:
+        return os.sysconf('SC_AVPHYS_PAGES')*os.sysconf('SC_PAGE_SIZE')/1024/1024
+    except (ValueError, OSError, AttributeError):
+        return None
+
+def pool_size(max_workers=0, worker_memory_mb=default_worker_memory_mb):
+    if max_workers:
+        return max(1, int(max_workers))
+    size = available_cores()
+    memory = available_memory_mb()
+    if memory is not None and worker_memory_mb:
+        size = min(size, int(memory//worker_memory_mb))
+    return max(1, size)
+
+class ConcurrencyBudget:
+    def __init__(self, total=None):
+        self.total = total if total else pool_size()
+        self.used = 0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        with self.lock:
+            if self.used >= self.total:
+                return False
+            self.used += 1
+            return True
+
+    def release(self):
+        with self.lock:
+            self.used = max(0, self.used - 1)
+
+    def resize(self, total=None):
+        with self.lock:
+            self.total = total if total else pool_size()
+
+budget = ConcurrencyBudget()
+
+def set_budget(max_workers=0, worker_memory_mb=default_worker_memory_mb):
+    # The budget is shared by every executor of this process, it follows the project settings of the run that starts.
+    budget.resize(pool_size(max_workers, worker_memory_mb))
+    return budget.total
+
+def _worker(conn):
+    while True:
+        try:
+            task = conn.recv()
+        except (EOFError, OSError):
+            break
+        if task is None:
+            break
+        func, args = task
+        try:
+            result = ('ok', func(*args))
+        except Exception as e:
+            result = ('error', f"{type(e).__name__}: {e}", traceback.format_exc())
+        try:
+            conn.send(result)
+        except Exception as e:
+            conn.send(('error', f"Result could not be sent back: {type(e).__name__}: {e}", traceback.format_exc()))
+
+class _Worker:
+    def __init__(self, context):
+        self.conn, child = context.Pipe()
+        self.process = context.Process(target=_worker, args=(child,), daemon=True)
+        self.process.start()
+        child.close()
+        self.task = None
+        self.started = None
+
+    def kill(self):
+        try:
+            self.process.kill()
+        except Exception:
+            pass
+        self.process.join(5)
+        self.conn.close()
+
+    def stop(self):
+        try:
+            self.conn.send(None)
+        except Exception:
+            pass
+        self.process.join(5)
+        if self.process.is_alive():
+            self.kill()
+        else:
+            self.conn.close()
+
+class Task:
+    def __init__(self, func, args, timeout, retries, perturb, tag, priority=0):
+        self.func = func
+        self.priority = priority
+        self.args = args
+        self.timeout = timeout
+        self.retries = retries
+        self.perturb = perturb
+        self.tag = tag
+        self.attempts = 0
+        self.errors = []
+        self.cancelled = False
+        self.future = futures.Future()
+        self.future.attempts = 0
+
+class SupervisedExecutor:
+    def __init__(self, max_workers=None, timeout=None, retries=2, perturb=None, seed=None, mp_context=None, budget=budget):
+        self.max_workers = pool_size(max_workers)
+        self.budget = budget
+        self.timeout = timeout
+        self.retries = retries
+        self.perturb = perturb
+        self.rng = np.random.default_rng(seed)
+        self.context = mp_context if mp_context is not None else multiprocessing.get_context()
+        self.queue = deque()
+        self.workers = []
+        self.failures = []
+        self.recovered = []
+        self.condition = threading.Condition()
+        self.closed = False
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown(wait=True)
+        return False
+
+    def submit(self, func, *args, timeout=None, retries=None, perturb=None, tag=None, priority=0):
+        task = Task(func, args, timeout if timeout is not None else self.timeout, retries if retries is not None else self.retries, perturb if perturb is not None else self.perturb, tag, priority)
+        with self.condition:
+            if self.closed:
+                raise RuntimeError("Cannot submit to a shut down executor.")
+            enqueue(self.queue, task)
+            self.condition.notify()
+        return task.future
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        with self.condition:
+            self.closed = True
+            if cancel_futures:
+                while len(self.queue) != 0:
+                    self.queue.popleft().future.cancel()
+            self.condition.notify()
+        if wait:
+            self.thread.join()
+
+    def cancel(self, tasks=None):
+        with self.condition:
+            for task in [task for task in self.queue if tasks is None or task.future in tasks]:
+                self.queue.remove(task)
+                cancel_task(task)
+            for worker in self.workers:
+                if worker.task is not None and (tasks is None or worker.task.future in tasks):
+                    worker.task.cancelled = True
+                    try:
+                        worker.process.kill()
+                    except Exception:
+                        pass
+            self.condition.notify()
+
+    def _dispatch(self):
+        while len(self.queue) != 0:
+            task = self.queue[0]
+            if task.attempts == 0 and task.future.cancelled():
+                self.queue.popleft()
+                continue
+            if self.budget is not None and not self.budget.acquire():
+                return
+            idle = [worker for worker in self.workers if worker.task is None]
+            if len(idle) == 0 and len(self.workers) < self.max_workers:
+                try:
+                    self.workers.append(_Worker(self.context))
+                except Exception as e:
+                    self._release()
+                    self.queue.popleft()
+                    task.future.set_running_or_notify_cancel() if task.attempts == 0 else 0
+                    task.errors.append({'reason': 'crash', 'error': f"Worker could not be started: {type(e).__name__}: {e}", 'elapsed': 0})
+                    task.attempts = task.retries + 1
+                    self._fail(task)
+                    continue
+                idle = self.workers[-1:]
+            if len(idle) == 0:
+                self._release()
+                return
+            self.queue.popleft()
+            if task.attempts == 0 and not task.future.set_running_or_notify_cancel():
+                self._release()
+                continue
+            worker = idle[0]
+            task.attempts += 1
+            task.future.attempts = task.attempts
+            try:
+                worker.conn.send((task.func, task.args))
+            except Exception as e:
+                task.errors.append({'reason': 'error', 'error': f"Task could not be sent: {type(e).__name__}: {e}", 'elapsed': 0})
+                task.attempts = task.retries + 1
+                self._release()
+                self._fail(task)
+                continue
+            worker.task = task
+            worker.started = time.time()
+
+    def _release(self):
+        if self.budget is not None:
+            self.budget.release()
+
+    def _fail(self, task):
+        fail_task(task, self.queue, self.failures, self.rng)
+
+    def _finish(self, worker, message):
+        task = worker.task
+        elapsed = time.time() - worker.started
+        worker.task = None
+        self._release()
+        if message[0] == 'ok':
+            if task.attempts > 1:
+                self.recovered.append({'tag': task.tag, 'attempts': task.attempts, 'errors': task.errors})
+            task.future.set_result(message[1])
+            return
+        if task.cancelled:
+            cancel_task(task)
+            return
+        task.errors.append({'reason': 'error', 'error': message[1], 'traceback': message[2], 'elapsed': elapsed})
+        self._fail(task)
+
+    def _replace(self, worker, reason, error):
+        task = worker.task
+        worker.kill()
+        self.workers.remove(worker)
+        if task is not None and task.cancelled:
+            self._release()
+            cancel_task(task)
+        elif task is not None:
+            self._release()
+            task.errors.append({'reason': reason, 'error': error, 'elapsed': time.time() - worker.started})
+            self._fail(task)
+
+    def _run(self):
+        while True:
+            with self.condition:
+                self._dispatch()
+                busy = [worker for worker in self.workers if worker.task is not None]
+                if self.closed and len(busy) == 0 and len(self.queue) == 0:
+                    break
+                if len(busy) == 0:
+                    self.condition.wait(0.5)
+                    continue
+            now = time.time()
+            deadlines = [worker.started + worker.task.timeout - now for worker in busy if worker.task.timeout is not None]
+            wait = min([0.5] + deadlines)
+            ready = connection.wait([worker.conn for worker in busy] + [worker.process.sentinel for worker in busy], timeout=max(wait, 0))
+            with self.condition:
+                for worker in busy:
+                    if worker.conn in ready:
+                        try:
+                            message = worker.conn.recv()
+                        except (EOFError, OSError):
+                            self._replace(worker, 'crash', f"Worker exited with code {worker.process.exitcode}.")
+                            continue
+                        self._finish(worker, message)
+                    elif worker.process.sentinel in ready:
+                        self._replace(worker, 'crash', f"Worker exited with code {worker.process.exitcode}.")
+                    elif worker.task.timeout is not None and time.time() - worker.started > worker.task.timeout:
+                        self._replace(worker, 'timeout', f"No result after {worker.task.timeout:.0f} s, worker killed.")
+        for worker in self.workers:
+            worker.stop()
+        self.workers = []
+
+    def report(self):
+        return failure_report("Supervisor", self.failures, self.recovered)
+
+def enqueue(queue, task):
+    index = len(queue)
+    while index > 0 and queue[index - 1].priority < task.priority:
+        index -= 1
+    queue.insert(index, task)
+
+def cancel_task(task):
+    task.cancelled = True
+    if not task.future.cancel() and not task.future.done():
+        task.future.set_exception(futures.CancelledError(f"Task {task.tag} was cancelled."))
+
+def fail_task(task, queue, failures, rng):
+    if task.attempts <= task.retries:
+        if task.perturb is not None:
+            try:
+                task.args = task.perturb(task.args, task.attempts, rng)
+            except Exception as e:
+                task.errors.append({'reason': 'error', 'error': f"Perturbation failed: {type(e).__name__}: {e}", 'elapsed': 0})
+        queue.appendleft(task)
+        return
+    report = {'tag': task.tag, 'attempts': task.attempts, 'errors': task.errors}
+    failures.append(report)
+    last = task.errors[-1] if len(task.errors) != 0 else {'reason': 'error', 'error': 'unknown'}
+    task.future.set_exception(TaskFailed(f"{last['reason']} after {task.attempts} attempts: {last['error']}", report))
+
+def failure_report(name, failures, recovered):
+    ret = f"{name}: {len(failures)} failed tasks, {len(recovered)} recovered by retry."
+    for entry in failures:
+        reasons = ", ".join(f"{error['reason']} ({error['error']})" for error in entry['errors'])
+        ret += f"\n  Failed {entry['tag']} after {entry['attempts']} attempts: {reasons}"
+    for entry in recovered:
+        ret += f"\n  Recovered {entry['tag']} on attempt {entry['attempts']}: {entry['errors'][-1]['reason']}"
+    return ret
+
+if __name__ == "__main__":
+    sys.exit(0)
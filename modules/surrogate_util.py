@@ -0,0 +1,195 @@
+import sys, os
+import glob
+import numpy as np
+import pandas as pd
+from scipy.linalg import cho_factor, cho_solve
+
+sys.path.insert(0, os.getcwd())
+import modules.backend_util as backend_util
+import modules.cache_util as cache_util
+import modules.store_util as store_util
+
+point_inputs = ['irms', 'degel', 'degmech']
+family_inputs = {
+    'initial': ['magnet_depth'],
+    'burried': ['magnet_depth'],
+    'spoke': ['magnet_depth'],
+    'vera': ['magnet_depth', 'magnet_angle'],
+    'halbach': ['magnet_depth', 'ratio', 'angle', 'magangle'],
+}
+family_modules = {
+    'geometries.initial_gen': 'initial',
+    'geometries.burried_gen': 'burried',
+    'geometries.spoke_gen': 'spoke',
+    'geometries.vera_gen': 'vera',
+    'geometries.ITHMA_gen': 'halbach',
+}
+solver_outputs = ['magarea', 'torque_airgap', 'flux_a', 'flux_b', 'flux_c']
+
+
+class GaussianProcess:
+    def __init__(self, max_points=1500, noise=1e-6, seed=0):
+        self.max_points = max_points
+        self.noise = noise
+        self.seed = seed
+
+    def fit(self, x, y):
+        x = np.asarray(x, dtype=float)
+        y = np.asarray(y, dtype=float)
+        if len(x) > self.max_points:
+            keep = np.random.default_rng(self.seed).choice(len(x), self.max_points, replace=False)
+            x = x[keep]
+            y = y[keep]
+        self.x_mean = x.mean(axis=0)
+        self.x_scale = np.where(x.std(axis=0) > 0, x.std(axis=0), 1)
+        self.y_mean = y.mean(axis=0)
+        self.y_scale = np.where(y.std(axis=0) > 0, y.std(axis=0), 1)
+        self.x = (x - self.x_mean)/self.x_scale
+        ys = (y - self.y_mean)/self.y_scale
+        distances = np.sqrt(_square_distances(self.x, self.x))
+        median = np.median(distances[distances > 0]) if (distances > 0).any() else 1.0
+        best = None
+        for length in median*np.array([0.05, 0.1, 0.2, 0.5, 1.0]):
+            self.length = length
+            factor = cho_factor(self._kernel(self.x, self.x) + self.noise*np.eye(len(self.x)), lower=True)
+            alpha = cho_solve(factor, ys)
+            inverse = np.diag(cho_solve(factor, np.eye(len(self.x))))[:, None]
+            loo = alpha/inverse
+            error = np.mean(loo**2)
+            if best is None or error < best[0]:
+                best = (error, length, factor, alpha, np.sqrt(np.mean(loo**2*inverse, axis=0)).max())
+        _, self.length, self.factor, self.alpha, self.calibration = best
+        return self
+
+    def _kernel(self, a, b):
+        return np.exp(-_square_distances(a, b)/(2*self.length**2))
+
+    def predict(self, x, return_std=False):
+        xs = (np.asarray(x, dtype=float) - self.x_mean)/self.x_scale
+        k = self._kernel(xs, self.x)
+        mean = k @ self.alpha*self.y_scale + self.y_mean
+        if not return_std:
+            return mean
+        v = cho_solve(self.factor, k.T)
+        var = np.clip(1 - np.einsum('ij,ji->i', k, v), 0, None)
+        return mean, self.calibration*np.sqrt(var)
+
+def _square_distances(a, b):
+    return np.clip((a**2).sum(axis=1)[:, None] + (b**2).sum(axis=1)[None, :] - 2*a @ b.T, 0, None)
+
+def geometry_outputs(rotfunc, params):
+    with backend_util.override_backend('analytic') as backend:
+        backend.openfemm(1)
+        params = dict(params)
+        inputs = dict(params)
+        created = rotfunc(params)
+        backend.closefemm()
+    ret = cache_util.split_outputs(inputs, params)
+    ret.update(created)
+    return ret
+
+class SurrogateModel:
+    def __init__(self, inputs, outputs=solver_outputs, max_points=1500):
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.max_points = max_points
+        self.model = None
+
+    def fit(self, data):
+        data = data.dropna(subset=self.inputs + self.outputs)
+        self.model = GaussianProcess(max_points=self.max_points).fit(data[self.inputs].to_numpy(dtype=float), data[self.outputs].to_numpy(dtype=float))
+        self.rows = len(data)
+        return self
+
+    def can_predict(self, point):
+        return self.model is not None and all(k in point for k in self.inputs)
+
+    def predict(self, points):
+        frame = points if isinstance(points, pd.DataFrame) else pd.DataFrame(list(points))
+        mean, std = self.model.predict(frame[self.inputs].to_numpy(dtype=float), return_std=True)
+        ret = pd.DataFrame(mean, columns=self.outputs, index=frame.index)
+        ret['surrogate_std'] = std
+        return ret
+
+    def answer(self, rotfunc, combos, points, max_std=0.05):
+        queries = []
+        for combo in combos:
+            for point in points:
+                query = dict(combo)
+                query.update(point)
+                queries.append(query)
+        if len(queries) == 0 or not all(self.can_predict(q) for q in queries):
+            return [None for _ in queries]
+        predicted = self.predict(queries).to_dict('records')
+        rows = []
+        geometries = {}
+        for index, (query, prediction) in enumerate(zip(queries, predicted)):
+            if prediction['surrogate_std'] > max_std:
+                rows.append(None)
+                continue
+            combo = combos[index//len(points)]
+            if index//len(points) not in geometries:
+                first = dict(combo)
+                first.update(points[0])
+                geometries[index//len(points)] = geometry_outputs(rotfunc, first)
+            row = dict(query)
+            row.update(geometries[index//len(points)])
+            row.update(prediction)
+            rows.append(row)
+        return rows
+
+def load_family(path, family, names=None):
+    files = []
+    for folder in glob.glob(os.path.join(path, 'sims', '*')):
+        name = os.path.basename(folder)
+        if names is not None and name not in names:
+            continue
+        files += store_util.stored(folder)
+    frames = []
+    for file in files:
+        frame = store_util.read(file)
+        # Rows the surrogate answered itself carry their surrogate_std, only solved rows are trained on.
+        if 'surrogate_std' in frame.columns:
+            frame = frame[frame['surrogate_std'].isna()]
+        if all(k in frame.columns for k in family_inputs[family] + point_inputs):
+            frames.append(frame)
+    if len(frames) == 0:
+        return None
+    return pd.concat(frames, ignore_index=True)
+
+def project_families(settings):
+    families = {}
+    for simulation in settings.get('simulations', []):
+        families.setdefault(simulation['parameters'][0], []).append(simulation['parameters'][2])
+    return families
+
+class SurrogateLibrary:
+    def __init__(self, path, settings=None, max_points=1500):
+        self.path = path
+        self.settings = settings if settings is not None else {}
+        self.max_points = max_points
+        self.models = {}
+
+    def family(self, rotfunc):
+        return family_modules.get(rotfunc.__module__)
+
+    def model(self, family):
+        if family not in self.models:
+            names = project_families(self.settings).get(family)
+            data = load_family(self.path, family, names=names)
+            self.models[family] = SurrogateModel(family_inputs[family] + point_inputs, max_points=self.max_points).fit(data) if data is not None and len(data) > 1 else None
+        return self.models[family]
+
+    def get(self, rotfunc):
+        family = self.family(rotfunc)
+        return self.model(family) if family is not None else None
+
+    def answer(self, rotfunc, combos, points, max_std=0.05):
+        # Lets a library be passed as surrogate= to multiSimHandler, families without a model answer nothing.
+        model = self.get(rotfunc)
+        if model is None:
+            return [None for _ in range(len(combos)*len(points))]
+        return model.answer(rotfunc, combos, points, max_std)
+
+if __name__ == "__main__":
+    sys.exit(0)
@@ -0,0 +1,78 @@
+import sys, os
+import math
+import numpy as np
+
+sys.path.insert(0, os.getcwd())
+from modules.sched_util import parallel_keys
+
+# Operating points of one geometry that are equal up to a rotor symmetry are solved once.
+# Moving the rotor by one pole pitch and the current angle by 180 degrees electrical negates every field,
+# the torque stays and the flux linkages change sign. Without current the torque also repeats with the
+# cogging period 360/lcm(stator_poles, rotor_poles). Every class solves the first requested point,
+# the others are copied from its row, so no point is moved off the requested grid.
+# Probe flux densities are magnitudes at fixed stator points and keep their value under the pole pitch shift.
+flux_columns = ('flux_a', 'flux_b', 'flux_c')
+magnitude_columns = ('b_tooth', 'b_yoke')
+digits = 6
+
+
+def pole_pitch(params):
+    return 360/params.get('rotor_poles', 8)
+
+def cogging_period(params):
+    if 'stator_poles' not in params:
+        return None
+    return 360/math.lcm(int(params['stator_poles']), int(params.get('rotor_poles', 8)))
+
+def fold(value, period):
+    shift = int(np.floor(round(value/period, 9)))
+    return round(value - shift*period, digits), shift
+
+def canonical(combo, point, need_flux=True):
+    inputs = dict(combo)
+    inputs.update(point)
+    irms = inputs.get('irms', 0)
+    degel = inputs.get('degel', 0)
+    degmech = inputs.get('degmech', 0)
+    rest = tuple(sorted((key, repr(value)) for key, value in point.items() if key not in ('irms', 'degel', 'degmech')))
+    cogging = cogging_period(inputs)
+    if irms == 0 and not need_flux and cogging is not None:
+        return (rest, 0, 0, fold(degmech, cogging)[0]), None
+    position, shift = fold(degmech, pole_pitch(inputs))
+    angle = 0 if irms == 0 else round((degel - 180*shift) % 360, digits) % 360
+    return (rest, irms, angle, position), -1 if shift % 2 else 1
+
+def plan(job, need_flux=True):
+    classes = {}
+    keep = []
+    mirrored = []
+    for i, point in enumerate(job['points']):
+        key, sign = canonical(job['combo'], point, need_flux)
+        if key not in classes:
+            classes[key] = (i, sign)
+            keep.append(i)
+        else:
+            source, source_sign = classes[key]
+            mirrored.append((i, source, sign*source_sign if sign is not None else None))
+    if len(mirrored) == 0:
+        return job, []
+    reduced = dict(job)
+    for key in parallel_keys:
+        if key in job:
+            reduced[key] = [job[key][i] for i in keep]
+    return reduced, mirrored
+
+def mirror(row, point, sign):
+    ret = dict(row)
+    ret.update(point)
+    for column in flux_columns:
+        if column in ret:
+            ret[column] = sign*row[column] if sign is not None else np.nan
+    for column in magnitude_columns:
+        if column in ret and sign is None:
+            ret[column] = np.nan
+    ret['solve_time'] = 0.0
+    return ret
+
+if __name__ == "__main__":
+    sys.exit(0)
@@ -0,0 +1,27 @@
+import sys, os
+import pytest
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root)
+import matplotlib
+matplotlib.use('Agg')
+import modules.backend_util as backend_util
+
+# Every test solves with the analytic backend in its own working directory, so the result cache and tmp folders stay isolated.
+stator_path = os.path.join(root, 'tmp', 'ba-laurin-weitzel', 'stator.FEM')
+
+
+@pytest.fixture(autouse=True)
+def analytic(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv(backend_util.backend_env, 'analytic')
+    backend_util.set_backend('analytic')
+    yield
+    backend_util.set_backend('analytic')
+
+@pytest.fixture
+def params():
+    return {
+        'stator_path': stator_path, 'symmetry_factor': 4, 'irms': 12, 'inner_radius': 5, 'outer_radius': 16.1, 'rpm': 3000,
+        'rotor_poles': 8, 'stator_poles': 12, 'magnet_depth': 2, 'magnet_angle': 120, 'angle_margin': 0,
+    }
@@ -0,0 +1,27 @@
+import modules.cache_util as cache_util
+import modules.backend_util as backend_util
+import geometries.vera_gen as vera
+
+
+def test_geometry_key_is_stable(params):
+    assert cache_util.geometry_key(vera.create, params) == cache_util.geometry_key(vera.create, dict(params))
+    assert cache_util.geometry_key(vera.create, params) == cache_util.geometry_key(vera.create, dict(reversed(list(params.items()))))
+
+def test_geometry_key_ignores_settings(params):
+    key = cache_util.geometry_key(vera.create, params)
+    settings = dict(params, project_name='other', rpm=6000, irms=3, simulations=[{'type': 'point'}], max_workers=8, symmetry=False)
+    assert cache_util.geometry_key(vera.create, settings) == key
+
+def test_geometry_key_follows_geometry(params, monkeypatch):
+    key = cache_util.geometry_key(vera.create, params)
+    assert cache_util.geometry_key(vera.create, dict(params, magnet_depth=3)) != key
+    assert cache_util.geometry_key(vera.create, dict(params, magnet_depth=2.5 + 1e-13)) == cache_util.geometry_key(vera.create, dict(params, magnet_depth=2.5))
+    assert cache_util.geometry_key(vera.create, dict(params, loss_probes=True)) != key
+    monkeypatch.setenv(backend_util.backend_env, 'femm')
+    assert cache_util.geometry_key(vera.create, params) != key
+
+def test_point_key(params):
+    gkey = cache_util.geometry_key(vera.create, params)
+    point = {'irms': 12, 'degel': 30, 'degmech': 7.5}
+    assert cache_util.point_key(gkey, point) == cache_util.point_key(gkey, dict(point, rpm=100))
+    assert cache_util.point_key(gkey, point) != cache_util.point_key(gkey, dict(point, degmech=8))
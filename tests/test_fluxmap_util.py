@@ -0,0 +1,81 @@
+import os
+import numpy as np
+import pandas as pd
+import matplotlib
+import modules.fluxmap_util as fluxmap_util
+import modules.spec_util as spec_util
+import modules.sim_util as sim_util
+import modules.store_util as store_util
+import geometries.vera_gen as vera
+
+matplotlib.rcParams['text.usetex'] = False
+pole_pairs = 4
+psi_m = 0.01
+l_d = 1.5e-4
+l_q = 3e-4
+offset = 0.3
+
+
+def phase_fluxes(psi, theta):
+    # Phase flux linkages of a space vector psi given in the rotor frame at electrical angle theta.
+    vector = psi*np.exp(1j*theta)
+    return {column: np.real(vector*np.exp(-1j*axis)) for column, axis in zip(fluxmap_util.phase_columns, fluxmap_util.phase_axes)}
+
+def machine(data, calibration):
+    theta = fluxmap_util.electrical_angle(data['degmech'], calibration)
+    current = data['irms'].to_numpy(dtype=np.float64)*np.exp(1j*(np.deg2rad(data['degel'].to_numpy(dtype=np.float64)) - theta))
+    psi = psi_m + l_d*current.real + 1j*l_q*current.imag
+    ret = data.copy()
+    for column, values in phase_fluxes(psi, theta).items():
+        ret[column] = values
+    ret['torque_airgap'] = 1.5*pole_pairs*(psi.real*current.imag - psi.imag*current.real)
+    return ret
+
+def test_calibrate():
+    degmech = np.linspace(0, 90, 37)
+    static = pd.DataFrame({'degmech': degmech, **phase_fluxes(psi_m + 0j, pole_pairs*np.deg2rad(degmech) + offset)})
+    calibration = fluxmap_util.calibrate(static.sample(frac=1, random_state=1), pole_pairs)
+    assert calibration['sequence'] == 1
+    np.testing.assert_allclose(calibration['offset'], offset)
+
+def test_spec_table_and_queries():
+    calibration = {'sequence': 1, 'offset': offset, 'pole_pairs': pole_pairs}
+    i_max, steps = 20, 5
+    spec = spec_util.resolve(fluxmap_util.spec(calibration, i_max, steps), {})
+    data = machine(pd.DataFrame(sim_util.createCombos({'dq': spec})), calibration)
+    assert len(data) == steps*steps*fluxmap_util.default_positions
+    table = fluxmap_util.dq_table(data, calibration, i_max, 1, steps)
+    np.testing.assert_allclose(table['psi_d'], psi_m + l_d*table['id'], atol=1e-12)
+    np.testing.assert_allclose(table['psi_q'], l_q*table['iq'], atol=1e-12)
+    fluxmap = fluxmap_util.FluxMap(table, pole_pairs, 0.1)
+    assert fluxmap.i_max == i_max
+    values = fluxmap.evaluate(-7.5, 12.5)
+    np.testing.assert_allclose(values['torque'], 1.5*pole_pairs*(psi_m*12.5 + (l_d - l_q)*-7.5*12.5))
+    omega = 2*np.pi*3000/60*pole_pairs
+    np.testing.assert_allclose(fluxmap.back_emf(3000), omega*psi_m)
+    np.testing.assert_allclose(fluxmap.voltage(0, 10, 3000), np.hypot(0.1*0 - omega*l_q*10, 0.1*10 + omega*psi_m))
+
+def test_mtpa_and_envelope():
+    i_max = 20
+    ids, iqs = np.meshgrid(*fluxmap_util.current_grid(i_max, 9), indexing='ij')
+    psi_d, psi_q = psi_m + l_d*ids, l_q*iqs
+    table = pd.DataFrame({'id': ids.ravel(), 'iq': iqs.ravel(), 'psi_d': psi_d.ravel(), 'psi_q': psi_q.ravel(), 'torque_airgap': (1.5*pole_pairs*(psi_d*iqs - psi_q*ids)).ravel()})
+    fluxmap = fluxmap_util.FluxMap(table, pole_pairs)
+    mtpa = fluxmap.mtpa(i_max)
+    current = mtpa['current'].iloc[-1]
+    expected = (psi_m - np.sqrt(psi_m**2 + 8*(l_q - l_d)**2*current**2))/(4*(l_q - l_d))
+    np.testing.assert_allclose(mtpa['id'].iloc[-1], expected, atol=0.15)
+    assert (np.diff(mtpa['torque']) >= 0).all()
+    u_max = float(fluxmap.voltage(mtpa['id'].iloc[-1], mtpa['iq'].iloc[-1], 2000))
+    envelope = fluxmap.envelope(np.array([500.0, 2000.0, 6000.0, 1e6]), u_max, i_max)
+    np.testing.assert_allclose(envelope['torque'].iloc[:2], mtpa['torque'].iloc[-1], rtol=1e-3)
+    assert envelope['torque'].iloc[2] < envelope['torque'].iloc[1]
+    assert envelope['torque'].iloc[3] == 0 and np.isnan(envelope['id'].iloc[3])
+
+def test_simulate_fluxmap(params):
+    params = dict(params, fluxmap_steps=3)
+    figures = sim_util.simulate_everything(vera, params, 'a', path='project')
+    assert 'Torque Map' in figures and 'Efficiency Map' in figures
+    table = store_util.read(os.path.join('project', 'sims', 'a', 'a_fluxmap'))
+    assert len(table) == 4*4*fluxmap_util.default_positions
+    assert table[['psi_d', 'psi_q', 'b_tooth', 'b_yoke', 'stator_area']].notna().all().all()
@@ -0,0 +1,88 @@
+import os
+import numpy as np
+import pandas as pd
+import matplotlib
+import modules.loss_util as loss_util
+import modules.fluxmap_util as fluxmap_util
+import modules.sim_util as sim_util
+import geometries.vera_gen as vera
+
+matplotlib.rcParams['text.usetex'] = False
+pole_pairs = 4
+psi_m = 0.01
+inductance = 2e-4
+
+
+def fluxmap(resistance=0.1, steps=9, i_max=20):
+    ids, iqs = np.meshgrid(*fluxmap_util.current_grid(i_max, steps), indexing='ij')
+    ids, iqs = ids.ravel(), iqs.ravel()
+    psi_d = psi_m + inductance*ids
+    psi_q = inductance*iqs
+    table = pd.DataFrame({
+        'id': ids, 'iq': iqs, 'psi_d': psi_d, 'psi_q': psi_q, 'torque_airgap': 1.5*pole_pairs*(psi_d*iqs - psi_q*ids),
+        'b_tooth': 1.2 + 0.01*np.hypot(ids, iqs), 'b_yoke': 0.8 + 0.01*np.hypot(ids, iqs),
+    })
+    return fluxmap_util.FluxMap(table, pole_pairs, resistance)
+
+def test_core_density():
+    coefficients = loss_util.materials[loss_util.default_material]
+    expected = coefficients['kh']*200*1.5**coefficients['alpha'] + coefficients['kc']*(200*1.5)**2
+    np.testing.assert_allclose(loss_util.core_density(np.array([1.5, -1.5]), 200), [expected, expected])
+
+def test_probes_cover_the_sector():
+    teeth, yokes = loss_util.probes({'stator_poles': 12, 'symmetry_factor': 4})
+    assert len(teeth) == 2 and len(yokes) == 3
+    np.testing.assert_allclose([np.hypot(*point) for point in teeth], loss_util.tooth_radius)
+    np.testing.assert_allclose(np.rad2deg([np.arctan2(y, x) for x, y in yokes]), [15, 45, 75])
+
+def test_efficiency_map_picks_the_cheapest_current():
+    losses = loss_util.LossModel(fluxmap(), 0.5)
+    speeds = np.array([500.0, 3000.0])
+    torques = np.array([0.1, 0.5, 5.0])
+    ret = losses.efficiency_map(speeds, torques, u_max=20, i_max=20)
+    _, _, i_d, i_q = fluxmap().candidates(20)
+    i_d, i_q = i_d.ravel(), i_q.ravel()
+    values = losses.fluxmap.evaluate(i_d, i_q)
+    for row in ret.itertuples():
+        feasible = (values['torque'] >= row.torque) & (losses.fluxmap.voltage(i_d, i_q, row.rpm) <= 20)
+        total = losses.copper(i_d, i_q) + losses.iron(values, row.rpm)
+        if feasible.any():
+            np.testing.assert_allclose(row.loss, total[feasible].min())
+            np.testing.assert_allclose(row.efficiency, row.torque*2*np.pi*row.rpm/60/(row.torque*2*np.pi*row.rpm/60 + row.loss))
+        else:
+            assert np.isnan(row.loss) and np.isnan(row.id)
+
+def test_cycle():
+    losses = loss_util.LossModel(fluxmap(), 0.5)
+    efficiency = losses.efficiency_map(np.linspace(100, 4000, 9), np.linspace(0.05, 0.5, 10), u_max=20, i_max=20)
+    grid = loss_util.table(efficiency, 'loss')
+    ret = loss_util.cycle(efficiency, np.array([100.0, 4000.0, 1e6]), np.array([0.05, -0.5, 0.1]), np.array([2.0, 1.0, 1.0]))
+    assert ret['unreachable'] == 1
+    np.testing.assert_allclose(ret['losses'], 2*grid.loc[0.05, 100.0] + grid.loc[0.5, 4000.0])
+    np.testing.assert_allclose(ret['energy'], 2*0.05*2*np.pi*100/60 + 0.5*2*np.pi*4000/60)
+
+def test_map_key(tmp_path):
+    path = tmp_path / 'fluxmap.csv'
+    path.write_text('id,iq\n0,0\n')
+    params = {'rpm': 3000, 'irms': 12, 'resistance': 0.1, 'project_name': 'a'}
+    key = loss_util.map_key(str(path), params)
+    assert loss_util.map_key(str(path), dict(params, project_name='b')) == key
+    assert loss_util.map_key(str(path), dict(params, resistance=0.2)) != key
+    path.write_text('id,iq\n0,1\n')
+    assert loss_util.map_key(str(path), params) != key
+
+def test_efficiency_map_is_stored_per_flux_map_and_settings(params, capsys):
+    params = dict(params, fluxmap_steps=5, resistance=0.1, stack_length=63)
+    sim_util.simulate_everything(vera, params, 'a', path='project')
+    stored = os.path.join('project', 'sims', 'a', 'a_efficiency.parquet')
+    written = os.stat(stored).st_mtime_ns
+    sim_util.simulate_efficiency(params, 'a', path='project')
+    assert os.stat(stored).st_mtime_ns == written
+    capsys.readouterr()
+    with open('cycle.csv', 'w') as file:
+        file.write('rpm,torque,duration\n1000,0.001,10\n3000,0.002,10\n')
+    sim_util.simulate_efficiency(dict(params, resistance=0.2, drive_cycle='cycle.csv'), 'a', path='project')
+    out = capsys.readouterr().out
+    assert "computing it again" in out
+    assert "Drive cycle cycle.csv" in out
+    assert os.stat(stored).st_mtime_ns != written
@@ -0,0 +1,111 @@
+import os
+import json
+import zlib
+import base64
+import zipfile
+import modules.project_util as project_util
+
+
+def write(path, text):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as file:
+        file.write(text)
+
+def test_snapshot_leaves_the_project_alone(tmp_path):
+    folder = str(tmp_path / 'project')
+    write(os.path.join(folder, 'settings.json'), '{}')
+    write(os.path.join(folder, 'sims', 'a', 'a_static.csv'), 'x')
+    write(os.path.join(folder, 'a.part'), 'journal')
+    handler = project_util.PMSMFileHandler(folder)
+    saved = str(tmp_path / 'a.pmsm')
+    handler.pack(saved)
+    written = os.stat(saved).st_mtime_ns
+    write(os.path.join(folder, 'settings.json'), '{"irms": 12}')
+    recovery = str(tmp_path / 'recovery' / 'a.pmsm')
+    handler.snapshot(recovery)
+    assert os.stat(saved).st_mtime_ns == written
+    assert handler.source == saved
+    with zipfile.ZipFile(recovery) as archive:
+        assert json.loads(archive.read(project_util.manifest_name))['entries'] == ['settings.json']
+        assert archive.read('settings.json') == b'{"irms": 12}'
+
+def project(folder):
+    write(os.path.join(folder, 'settings.json'), '{"project_name": "a"}')
+    write(os.path.join(folder, 'stator.FEM'), 'stator')
+    write(os.path.join(folder, 'sims', 'a', 'a_static.csv'), 'degmech\n0\n')
+    write(os.path.join(folder, 'sims', 'b', 'b_static.csv'), 'degmech\n1\n')
+
+def read(folder, name):
+    with open(os.path.join(folder, *name.split('/'))) as file:
+        return file.read()
+
+def test_round_trip_is_lazy(tmp_path):
+    project(str(tmp_path / 'source'))
+    saved = str(tmp_path / 'a.pmsm')
+    project_util.PMSMFileHandler(str(tmp_path / 'source')).pack(saved)
+    folder = str(tmp_path / 'opened')
+    handler = project_util.PMSMFileHandler(folder)
+    handler.unpack(saved)
+    assert read(folder, 'settings.json') == '{"project_name": "a"}'
+    assert not os.path.exists(os.path.join(folder, 'sims'))
+    assert handler.pending == {'sims/a/a_static.csv', 'sims/b/b_static.csv'}
+    assert handler.extract('sims/a') == 1
+    assert read(folder, 'sims/a/a_static.csv') == 'degmech\n0\n'
+    assert handler.extract('sims/a') == 0
+    copy = str(tmp_path / 'copy.pmsm')
+    handler.pack(copy)
+    with zipfile.ZipFile(copy) as archive:
+        assert archive.read('sims/b/b_static.csv') == b'degmech\n1\n'
+    handler.unpack(saved, lazy=False)
+    assert read(folder, 'sims/b/b_static.csv') == 'degmech\n1\n'
+
+def test_incremental_save_appends_changes(tmp_path):
+    folder = str(tmp_path / 'project')
+    project(folder)
+    # Stored uncompressed, so the small edits below stay under the compaction ratio.
+    write(os.path.join(folder, 'sims', 'a', 'a_static.parquet'), 'x'*4096)
+    saved = str(tmp_path / 'a.pmsm')
+    handler = project_util.PMSMFileHandler(folder)
+    handler.pack(saved)
+    handler.unpack(saved)
+    size = os.path.getsize(saved)
+    handler.pack(saved)
+    assert os.path.getsize(saved) == size
+    write(os.path.join(folder, 'settings.json'), '{"project_name": "b"}')
+    os.remove(os.path.join(folder, 'stator.FEM'))
+    handler.pack(saved)
+    with zipfile.ZipFile(saved) as archive:
+        assert [info.filename for info in archive.infolist()].count('settings.json') == 2
+        assert project_util.entries(archive) == ['settings.json', 'sims/a/a_static.csv', 'sims/a/a_static.parquet', 'sims/b/b_static.csv']
+    opened = str(tmp_path / 'opened')
+    project_util.PMSMFileHandler(opened).unpack(saved, lazy=False)
+    assert read(opened, 'settings.json') == '{"project_name": "b"}'
+    assert not os.path.exists(os.path.join(opened, 'stator.FEM'))
+
+def test_compaction_rewrites_stale_archives(tmp_path):
+    folder = str(tmp_path / 'project')
+    write(os.path.join(folder, 'settings.json'), 'x'*10)
+    saved = str(tmp_path / 'a.pmsm')
+    handler = project_util.PMSMFileHandler(folder)
+    handler.pack(saved)
+    for i in range(5):
+        write(os.path.join(folder, 'settings.json'), str(i)*10)
+        handler.pack(saved)
+    with zipfile.ZipFile(saved) as archive:
+        assert [info.filename for info in archive.infolist()].count('settings.json') < 5
+        assert archive.read('settings.json') == b'4'*10
+
+def test_legacy_projects_unpack(tmp_path):
+    legacy = str(tmp_path / 'legacy.pmsm')
+    data = {'.': {'settings.json': '{}'}, 'sims': {'a.bin': {'base64': base64.b64encode(b'\x00\x01').decode()}}}
+    with open(legacy, 'wb') as file:
+        file.write(zlib.compress(json.dumps(data).encode('utf-8')))
+    assert project_util.is_legacy(legacy)
+    folder = str(tmp_path / 'opened')
+    handler = project_util.PMSMFileHandler(folder)
+    handler.unpack(legacy)
+    assert read(folder, 'settings.json') == '{}'
+    with open(os.path.join(folder, 'sims', 'a.bin'), 'rb') as file:
+        assert file.read() == b'\x00\x01'
+    handler.pack(legacy)
+    assert not project_util.is_legacy(legacy)
@@ -0,0 +1,42 @@
+import modules.sched_util as sched_util
+
+
+def job(count, geometry=1.0):
+    points = [{'irms': 1, 'degel': 0, 'degmech': float(i)} for i in range(count)]
+    return {'combo': {'magnet_depth': geometry}, 'points': points, 'keys': [f"k{i}" for i in range(count)], 'slots': list(range(count))}
+
+def test_task_cost():
+    assert sched_util.task_cost(job(4)) == sched_util.task_overhead + 4*sched_util.point_weight
+    assert sched_util.task_cost(job(4), 2.0) == 2*sched_util.task_cost(job(4))
+
+def test_split_job_keeps_parallel_lists():
+    parts = sched_util.split_job(job(10), 3)
+    assert [len(part['points']) for part in parts] == [4, 3, 3]
+    assert [slot for part in parts for slot in part['slots']] == list(range(10))
+    for part in parts:
+        assert part['keys'] == [f"k{slot}" for slot in part['slots']]
+        assert [point['degmech'] for point in part['points']] == [float(slot) for slot in part['slots']]
+        assert part['combo'] == {'magnet_depth': 1.0}
+    assert len(sched_util.split_job(job(2), 5)) == 2
+
+def test_split_jobs_fills_the_workers():
+    jobs = [job(100, 1.0), job(4, 2.0)]
+    ret = sched_util.split_jobs(jobs, 4)
+    assert len(ret) >= 2*4
+    assert sum(len(part['points']) for part in ret) == 104
+    assert max(sched_util.task_cost(part) for part in ret) < sched_util.task_cost(jobs[0])/4
+    assert [part for part in ret if part['combo']['magnet_depth'] == 2.0] == [jobs[1]]
+    assert sched_util.split_jobs([], 4) == []
+
+def test_split_jobs_keeps_small_runs():
+    jobs = [job(3, float(i)) for i in range(8)]
+    assert sched_util.split_jobs(jobs, 2) == jobs
+
+def test_mesh_factor(tmp_path):
+    small, large = tmp_path / 'small.FEM', tmp_path / 'large.FEM'
+    small.write_text('x'*100)
+    large.write_text('x'*300)
+    assert sched_util.mesh_factor(str(large), str(small)) == 3
+    assert sched_util.mesh_factor(str(small), str(large)) == 1/3
+    assert sched_util.mesh_factor(str(tmp_path / 'missing.FEM'), str(small)) == 1.0
+    assert sched_util.mesh_factor(str(small), None) == 1.0
@@ -0,0 +1,35 @@
+import numpy as np
+import pytest
+import modules.spec_util as spec_util
+import modules.sim_util as sim_util
+
+
+def test_resolve_scalar_expressions():
+    spec = {'irms': {'values': [0, {'expr': 'sqrt(2)*irms'}]}, 'degmech': [0, {'expr': '90/p'}, 3]}
+    ret = spec_util.resolve(spec, {'irms': 8, 'p': 4})
+    assert ret['irms']['values'] == [0, pytest.approx(8*np.sqrt(2))]
+    assert ret['degmech'] == [0, 22.5, 3]
+
+def test_evaluate_rejects_unsafe_syntax():
+    for text in ('__import__("os")', 'irms.real', 'open(irms)', '0 < irms < 1', '"a"'):
+        with pytest.raises(ValueError):
+            spec_util.evaluate(text, {'irms': 1})
+    with pytest.raises(KeyError):
+        spec_util.evaluate('irms*rpm', {'irms': 1})
+
+def test_position_spec_create():
+    spec = spec_util.resolve(sim_util.position_spec(0, 90, 4, 45), {'rotor_poles': 8})
+    combos = sim_util.createCombos({'irms': 1, 'pos': spec})
+    assert [combo['degmech'] for combo in combos] == [45, 75, 105, 135]
+    assert [combo['degel'] for combo in combos] == [0, 120, 240, 360]
+    assert all(combo['irms'] == 1 for combo in combos)
+
+def test_select():
+    item = {'parameters': {'i_d': [-2, 0, 3], 'i_q': [0, 2, 3]}, 'expr': 'i_d**2 + i_q**2 <= 4'}
+    combos = spec_util.evaluate_entry(item, sim_util.createCombos(item['parameters']))
+    assert len(combos) == 6
+    assert all(combo['i_d']**2 + combo['i_q']**2 <= 4 for combo in combos)
+
+def test_spec_key():
+    assert spec_util.spec_key({'a': [1, 2.0], 'b': 1}) == spec_util.spec_key({'b': 1, 'a': (1, 2.0)})
+    assert spec_util.spec_key({'a': 1}) != spec_util.spec_key({'a': 2})
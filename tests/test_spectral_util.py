@@ -0,0 +1,42 @@
+import numpy as np
+import pandas as pd
+import modules.spectral_util as spectral_util
+
+pole_pairs = 4
+
+
+def table(end, steps, orders):
+    degmech = np.linspace(0, end, steps)
+    theta = pole_pairs*np.deg2rad(degmech)
+    rows = []
+    for depth, scale in ((1.0, 1.0), (2.0, 2.0)):
+        torque = 0.5*scale + sum(amp*scale*np.cos(order*theta) for order, amp in orders)
+        flux = 0.01*scale*np.cos(theta)
+        rows.append(pd.DataFrame({'magnet_depth': depth, 'degmech': degmech, 'torque_airgap': torque, 'flux_a': flux, 'flux_c': np.roll(flux, 1)}))
+    return pd.concat(rows, ignore_index=True)
+
+def test_window():
+    assert spectral_util.window(np.linspace(0, 90, 91), pole_pairs) == (90, 90, True)
+    assert spectral_util.window(np.arange(0, 90, 1.0), pole_pairs) == (90, 90, True)
+    samples, span, periodic = spectral_util.window(np.linspace(22.5, 67.5, 11), pole_pairs)
+    assert (samples, periodic) == (11, False)
+
+def test_periodic_orders():
+    ret = spectral_util.analyze(table(90, 91, [(6, 0.1), (12, 0.02)]), ['magnet_depth'], pole_pairs)
+    np.testing.assert_allclose(ret['torque_mean'], [0.5, 1.0])
+    np.testing.assert_allclose(ret['torque_order_1'], [6, 6])
+    np.testing.assert_allclose(ret['torque_amp_1'], [0.1, 0.2], atol=1e-12)
+    np.testing.assert_allclose(ret['torque_order_2'], [12, 12])
+    np.testing.assert_allclose(ret['torque_ripple'], np.hypot([0.1, 0.2], [0.02, 0.04])/np.sqrt(2))
+
+def test_back_emf_fundamental():
+    ret = spectral_util.analyze(table(90, 91, [(6, 0.1)]), ['magnet_depth'], pole_pairs, rpm=3000, symmetry_factor=4)
+    omega = 2*np.pi*3000/60*pole_pairs
+    np.testing.assert_allclose(ret['emf_fundamental'], 4*omega*np.array([0.01, 0.02]), rtol=1e-6)
+    np.testing.assert_allclose(ret['emf_thd'], [0, 0], atol=1e-9)
+
+def test_half_period_has_no_orders():
+    ret = spectral_util.analyze(table(45, 11, [(6, 0.1)]), ['magnet_depth'], pole_pairs, rpm=3000)
+    assert ret.filter(regex='_(order|amp)_').isna().all().all()
+    assert ret[['emf_fundamental', 'emf_thd']].isna().all().all()
+    assert np.isfinite(ret[['torque_mean', 'torque_ripple']]).all().all()
@@ -0,0 +1,45 @@
+import json
+import numpy as np
+import pandas as pd
+import pytest
+import modules.store_util as store_util
+
+
+@pytest.fixture
+def frame():
+    return pd.DataFrame({
+        'irms': np.repeat([0.0, 12.0], 3), 'degmech': np.tile([0.0, 7.5, 15.0], 2), 'torque_airgap': np.linspace(-1, 1, 6),
+        'flux_a': np.linspace(0, 0.1, 6), 'label': ['a', 'b', 'c', 'd', 'e', 'f'],
+    }).iloc[::-1].reset_index(drop=True)
+
+def test_round_trip(tmp_path, frame):
+    path = store_util.write(frame, str(tmp_path / 'result'))
+    assert path.endswith('.parquet') == (store_util.pq is not None)
+    ret = store_util.read(str(tmp_path / 'result'))
+    expected = frame.sort_values(['irms', 'degmech']).reset_index(drop=True)
+    assert list(ret['label']) == list(expected['label'])
+    np.testing.assert_allclose(ret['flux_a'], expected['flux_a'])
+    np.testing.assert_allclose(ret['torque_airgap'], expected['torque_airgap'], rtol=1e-6)
+    assert ret['torque_airgap'].dtype == (np.float32 if path.endswith('.parquet') else np.float64)
+
+def test_filters_and_columns(tmp_path, frame):
+    store_util.write(frame, str(tmp_path / 'result'))
+    ret = store_util.read(str(tmp_path / 'result'), columns=['degmech', 'flux_a'], filters=[('irms', '==', 0), ('degmech', 'in', [0.0, 15.0])])
+    assert list(ret.columns) == ['degmech', 'flux_a']
+    assert list(ret['degmech']) == [0.0, 15.0]
+
+def test_object_columns_are_serialised(tmp_path, frame):
+    frame['simulations'] = [[{'type': 'point'}]]*len(frame)
+    frame['parameters'] = [['vera', {'magnet_depth': 2}]]*len(frame)
+    path = store_util.write(frame, str(tmp_path / 'result'))
+    assert path.endswith('.parquet') == (store_util.pq is not None)
+    ret = store_util.read(str(tmp_path / 'result'))
+    assert json.loads(ret['simulations'][0]) == [{'type': 'point'}]
+    assert json.loads(ret['parameters'][0]) == ['vera', {'magnet_depth': 2}]
+
+def test_csv_is_found(tmp_path, frame):
+    frame.to_csv(str(tmp_path / 'old.csv'), index=False)
+    assert store_util.stored(str(tmp_path)) == [str(tmp_path / 'old')]
+    assert len(store_util.read(str(tmp_path / 'old'), filters=[('irms', '>', 0)])) == 3
+    with pytest.raises(FileNotFoundError):
+        store_util.read(str(tmp_path / 'missing'))
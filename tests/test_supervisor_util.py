@@ -0,0 +1,98 @@
+import os
+import time
+import numpy as np
+import pytest
+import modules.supervisor_util as supervisor_util
+import modules.backend_util as backend_util
+import modules.sim_util as sim_util
+import modules.cache_util as cache_util
+import geometries.vera_gen as vera
+
+
+def square(x):
+    return x*x
+
+def fail(x):
+    raise ValueError(f"bad {x}")
+
+def crash(x):
+    os._exit(3)
+
+def sleep(x):
+    time.sleep(x)
+    return x
+
+def fail_once(path, x):
+    if not os.path.exists(path):
+        open(path, 'w').close()
+        raise RuntimeError("first attempt")
+    return x
+
+def shift(args, attempt, rng):
+    return (args[0], args[1] + 10*attempt)
+
+class FlakyBackend(backend_util.AnalyticBackend):
+    # Fails the first solve after the rotor is in the task file, workers are forked and see the registration.
+    name = 'flaky'
+
+    def mi_analyse(self, flag=0):
+        if not os.path.exists('failed'):
+            open('failed', 'w').close()
+            raise RuntimeError("flaky solver")
+        super().mi_analyse(flag)
+
+backend_util.register_backend('flaky', FlakyBackend)
+
+def executor(**kwargs):
+    return supervisor_util.SupervisedExecutor(1, budget=None, **kwargs)
+
+def test_results_and_errors():
+    with executor(retries=1) as pool:
+        ok = pool.submit(square, 3)
+        bad = pool.submit(fail, 1)
+        assert ok.result() == 9
+        with pytest.raises(supervisor_util.TaskFailed) as error:
+            bad.result()
+    assert error.value.report['attempts'] == 2
+    assert [entry['reason'] for entry in error.value.report['errors']] == ['error', 'error']
+
+def test_crash_and_timeout_respawn():
+    with executor(retries=0) as pool:
+        crashed = pool.submit(crash, 1)
+        slow = pool.submit(sleep, 5, timeout=0.5)
+        after = pool.submit(square, 4)
+        assert after.result(timeout=30) == 16
+        with pytest.raises(supervisor_util.TaskFailed, match='crash'):
+            crashed.result()
+        with pytest.raises(supervisor_util.TaskFailed, match='timeout'):
+            slow.result()
+    assert len(pool.failures) == 2
+
+def test_retry_is_perturbed(tmp_path):
+    with executor(retries=2) as pool:
+        future = pool.submit(fail_once, str(tmp_path / 'marker'), 1, perturb=shift)
+        assert future.result() == 11
+    assert future.attempts == 2
+    assert len(pool.recovered) == 1
+
+def test_priority_order():
+    queue = []
+    for priority in (1, 3, 2, 3):
+        supervisor_util.enqueue(queue, supervisor_util.Task(square, (priority,), None, 0, None, None, priority))
+    assert [task.priority for task in queue] == [3, 3, 2, 1]
+
+def test_retry_does_not_draw_the_rotor_twice(params, monkeypatch):
+    params = dict(params, inner_radius=5.0, magnet_depth=2.0, magnet_angle=120.0, angle_margin=0.0)
+    sims = {'irms': 12, 'degel': 0, 'degmech': [0, 10, 3]}
+    clean = sim_util.multiSimHandler(sim_util.simulate_general, 'tmp/sims/clean', vera.create, params, sims, cache=False, max_workers=1)
+    monkeypatch.setenv(backend_util.backend_env, 'flaky')
+    cache = cache_util.ResultCache()
+    retried = sim_util.multiSimHandler(sim_util.simulate_general, 'tmp/sims/flaky', vera.create, params, sims, cache=cache, max_workers=1, journal='flaky.part')
+    assert os.path.exists('failed')
+    np.testing.assert_allclose(retried['magarea'], clean['magarea'], rtol=1e-2)
+    np.testing.assert_allclose(retried['torque_airgap'], clean['torque_airgap'], rtol=1e-2)
+    assert (retried['magnet_depth'] == 2.0).all()
+    journal = cache_util.Journal('flaky.part')
+    assert 0 < len(cache) < len(retried)
+    assert len(journal) == len(cache)
+    journal.close()
@@ -0,0 +1,45 @@
+import os
+import numpy as np
+import pandas as pd
+import modules.surrogate_util as surrogate_util
+import modules.store_util as store_util
+import modules.sim_util as sim_util
+import geometries.vera_gen as vera
+
+
+def sweep(params):
+    sims = {'irms': 12, 'degel': 0, 'degmech': [0, 30, 7]}
+    steps = dict(params, magnet_depth=[1, 3, 3], magnet_angle=[100, 140, 3])
+    return sim_util.multiSimHandler(sim_util.simulate_general, 'tmp/sims/test', vera.create, steps, sims, cache=False, max_workers=1), steps, sims
+
+def test_gaussian_process_interpolates():
+    x = np.linspace(0, 1, 15)[:, None]
+    model = surrogate_util.GaussianProcess().fit(x, np.sin(3*x))
+    mean, std = model.predict(np.array([[0.25], [0.5]]), return_std=True)
+    np.testing.assert_allclose(mean[:, 0], np.sin([0.75, 1.5]), atol=1e-3)
+    assert (std < 0.05).all()
+    assert model.predict(np.array([[5.0]]), return_std=True)[1][0] > std.max()
+
+def test_library_trains_on_solved_rows_only(params):
+    data, steps, sims = sweep(params)
+    folder = os.path.join('project', 'sims', 'a')
+    os.makedirs(folder)
+    store_util.write(data, os.path.join(folder, 'a_sweep_stand'))
+    fake = data.copy()
+    fake['torque_airgap'] = 100.0
+    fake['surrogate_std'] = 0.01
+    store_util.write(pd.concat([data.assign(surrogate_std=np.nan), fake], ignore_index=True), os.path.join(folder, 'a_sweep_movin'))
+    loaded = surrogate_util.load_family('project', 'vera')
+    assert len(loaded) == 2*len(data)
+    assert loaded['torque_airgap'].max() < 100
+
+    library = surrogate_util.SurrogateLibrary('project')
+    combos = sim_util.createCombos(steps)
+    points = sim_util.createCombos(sims)
+    answered = library.answer(vera.create, combos, points, max_std=np.inf)
+    assert len(answered) == len(combos)*len(points) and all(row is not None for row in answered)
+    predicted = pd.DataFrame(answered).sort_values(['magnet_depth', 'magnet_angle', 'degmech']).reset_index(drop=True)
+    solved = data.sort_values(['magnet_depth', 'magnet_angle', 'degmech']).reset_index(drop=True)
+    np.testing.assert_allclose(predicted['torque_airgap'], solved['torque_airgap'], atol=1e-3*np.abs(solved['torque_airgap']).max() + 1e-6)
+    np.testing.assert_allclose(predicted['magarea'], solved['magarea'], rtol=1e-4)
+    assert surrogate_util.SurrogateLibrary('empty').answer(vera.create, combos, points) == [None]*len(answered)
@@ -0,0 +1,31 @@
+import numpy as np
+import pytest
+import modules.sim_util as sim_util
+import geometries.vera_gen as vera
+
+columns = ['irms', 'degel', 'degmech', 'torque_airgap', 'magarea']
+flux_columns = ['flux_a', 'flux_b', 'flux_c']
+# Points copied from an equivalent position on the aligned grids: every position from one pole pitch (45 deg) on,
+# and for sweeps without flux every no-load position from one cogging period (15 deg) on.
+mirrored = {('point', 'static'): 136, ('point', 'movin'): 136, ('sweep_1d', 'stand'): 2*(41 + 1), ('sweep_1d', 'movin'): 2*25}
+
+
+def solve(params, sims, symmetry, need_flux):
+    ret = sim_util.multiSimHandler(sim_util.simulate_general, 'tmp/sims/test', vera.create, params, sims, cache=False, max_workers=1, symmetry=symmetry, need_flux=need_flux)
+    return ret.sort_values(['magnet_depth', 'irms', 'degmech', 'degel']).reset_index(drop=True)
+
+@pytest.mark.parametrize('kind', ['point', 'sweep_1d'])
+def test_symmetry_matches_full_solve(params, kind):
+    params = dict(params, symmetry_grid=True)
+    params = dict(params, magnet_depth=[1, 3, 2]) if kind == 'sweep_1d' else params
+    need_flux = kind == 'point'
+    for name, sims in sim_util.resolve_sims(kind, None, params).items():
+        full = solve(params, sims, False, need_flux)
+        reduced = solve(params, sims, True, need_flux)
+        assert len(full) == len(reduced)
+        assert (full['solve_time'] > 0).all()
+        copied = (reduced['solve_time'] == 0).to_numpy()
+        assert copied.sum() == mirrored[(kind, name)]
+        used = columns + (flux_columns if need_flux else [])
+        np.testing.assert_allclose(reduced.loc[copied, used].to_numpy(float), full.loc[copied, used].to_numpy(float), rtol=1e-6, atol=1e-9)
+        np.testing.assert_allclose(reduced[used].to_numpy(float), full[used].to_numpy(float), rtol=1e-6, atol=1e-9)
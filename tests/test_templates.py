@@ -0,0 +1,35 @@
+import os
+import numpy as np
+import modules.sim_util as sim_util
+import modules.cache_util as cache_util
+import geometries.vera_gen as vera
+
+columns = ['magnet_depth', 'irms', 'degmech', 'torque_airgap', 'magarea', 'flux_a']
+
+
+def solve(params, sims, **kwargs):
+    ret = sim_util.multiSimHandler(sim_util.simulate_general, 'tmp/sims/test', vera.create, params, sims, max_workers=1, **kwargs)
+    return ret.sort_values(['magnet_depth', 'irms', 'degmech']).reset_index(drop=True)
+
+def test_templates_are_kept_across_calls(params, capsys):
+    params = dict(params, magnet_depth=[1, 3, 2])
+    sims = {'irms': {'values': [0, 12]}, 'degel': 0, 'degmech': [0, 10, 3]}
+    drawn = solve(params, sims, cache=False)
+    first = solve(params, sims, cache=cache_util.ResultCache('first.sqlite'))
+    assert "Drawing 2 geometry templates, reusing 0 stored templates" in capsys.readouterr().out
+    assert len(os.listdir(cache_util.default_template_path)) == 4
+    second = solve(params, sims, cache=cache_util.ResultCache('second.sqlite'))
+    assert "Drawing 0 geometry templates, reusing 2 stored templates" in capsys.readouterr().out
+    np.testing.assert_allclose(first[columns].to_numpy(float), drawn[columns].to_numpy(float))
+    np.testing.assert_allclose(second[columns].to_numpy(float), drawn[columns].to_numpy(float))
+
+def test_template_store_eviction(tmp_path):
+    source = tmp_path / 'drawn.FEM'
+    source.write_text('rotor')
+    store = cache_util.TemplateStore(str(tmp_path / 'templates'), max_files=2)
+    for i, gkey in enumerate(('a', 'b', 'c')):
+        stored = store.put(gkey, {'path': str(source), 'retpars': {'magarea': np.float64(i)}})
+        os.utime(store.files(gkey)[1], (i, i))
+    assert store.get('a') is None
+    assert store.get('c') == {'path': stored['path'], 'retpars': {'magarea': 2.0}}
+    assert sorted(os.listdir(store.path)) == ['b.FEM', 'b.json', 'c.FEM', 'c.json']